@@ -0,0 +1,182 @@
+"""
+OpenAI-compatible Batch API client for large backfills.
+- Write one /chat/completions request per conversation into a JSONL file
+- Upload it via /files and start a job via /batches
+- Poll until the job finishes, download output and map it back by custom_id
+
+The submitted job is recorded in BATCH_DIR/batch_state.json, so a restarted
+run picks up the pending job instead of paying for the same requests again.
+Results are written to the LLM cache as soon as they are collected and the
+state is cleared only afterwards, so a crash never loses a paid batch output.
+"""
+import os
+import json
+import time
+import datetime as dt
+from typing import Dict, Tuple, Optional
+
+from config import OPENAI_MODEL, BATCH_DIR, BATCH_POLL_SECONDS, BATCH_COMPLETION_WINDOW
+from gpt_client import api_request, build_chat_payload
+from llm_cache import cache_key, cache_put
+from llm_schema import parse_reply, record
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+_STATE_FILE = os.path.join(BATCH_DIR, "batch_state.json")
+
+
+def _load_state() -> Optional[dict]:
+    if not os.path.exists(_STATE_FILE):
+        return None
+    try:
+        with open(_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[warn] Unreadable batch state {_STATE_FILE}: {e}")
+        return None
+
+
+def _save_state(state: dict) -> None:
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    tmp = _STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, _STATE_FILE)
+
+
+def _clear_state() -> None:
+    try:
+        os.remove(_STATE_FILE)
+    except FileNotFoundError:
+        pass
+
+
+def _write_jsonl(prompts: Dict[str, Tuple[str, str]]) -> str:
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    path = os.path.join(BATCH_DIR, f"batch_input_{dt.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for cid, (system_prompt, user_prompt) in prompts.items():
+            f.write(json.dumps({
+                "custom_id": cid,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": build_chat_payload(system_prompt, user_prompt),
+            }, ensure_ascii=False) + "\n")
+    return path
+
+
+def _submit(prompts: Dict[str, Tuple[str, str]]) -> dict:
+    path = _write_jsonl(prompts)
+    with open(path, "rb") as fh:
+        data = fh.read()  # bytes, not the handle: a retried upload would re-read it from EOF
+    r = api_request("POST", "/files", json_body=False,
+                    data={"purpose": "batch"}, files={"file": (os.path.basename(path), data, "application/jsonl")})
+    file_id = r.json()["id"]
+    r = api_request("POST", "/batches", json={
+        "input_file_id": file_id,
+        "endpoint": "/v1/chat/completions",
+        "completion_window": BATCH_COMPLETION_WINDOW,
+    })
+    batch_id = r.json()["id"]
+    state = {
+        "batch_id": batch_id,
+        "input_file_id": file_id,
+        "input_path": path,
+        "created": dt.datetime.now().isoformat(timespec="seconds"),
+        # custom_id -> prompt hash, to tell on resume whether a result still matches
+        "keys": {cid: cache_key(OPENAI_MODEL, sp, up) for cid, (sp, up) in prompts.items()},
+    }
+    _save_state(state)
+    print(f"[batch] Submitted {len(prompts)} request(s): batch={batch_id} file={file_id}")
+    return state
+
+
+def _wait(batch_id: str) -> dict:
+    while True:
+        info = api_request("GET", f"/batches/{batch_id}").json()
+        status = info.get("status", "")
+        counts = info.get("request_counts") or {}
+        print(f"[batch] {batch_id} status={status} "
+              f"done={counts.get('completed', '?')}/{counts.get('total', '?')} failed={counts.get('failed', '?')}")
+        if status in TERMINAL_STATUSES:
+            return info
+        time.sleep(BATCH_POLL_SECONDS)
+
+
+def _download(file_id: Optional[str]) -> list:
+    if not file_id:
+        return []
+    text = api_request("GET", f"/files/{file_id}/content").text
+    return [json.loads(ln) for ln in text.splitlines() if ln.strip()]
+
+
+def _collect(info: dict) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """Split output/error files into parsed objects and error messages keyed by custom_id."""
+    results: Dict[str, dict] = {}
+    errors: Dict[str, str] = {}
+    for rec in _download(info.get("output_file_id")) + _download(info.get("error_file_id")):
+        cid = rec.get("custom_id")
+        resp = rec.get("response") or {}
+        if rec.get("error") or resp.get("status_code") != 200:
+            err = rec.get("error") or (resp.get("body") or {}).get("error") or f"HTTP {resp.get('status_code')}"
+            errors[cid] = str(err.get("message", err) if isinstance(err, dict) else err)
+            continue
+        try:
+            content = resp["body"]["choices"][0]["message"]["content"]
+        except Exception as e:
+            errors[cid] = f"Malformed batch output: {e}"
+            continue
+        # no re-ask here: failed replies become _ERROR rows and are retried by the next run
+        obj, status, problems = parse_reply(content)
+        record("failed" if obj is None else status)
+        if obj is None:
+            errors[cid] = "Reply does not match the schema: " + "; ".join(problems[:3])
+        else:
+            results[cid] = obj
+    if info.get("status") != "completed":
+        print(f"[batch] !! batch {info.get('id')} ended with status={info.get('status')}")
+    return results, errors
+
+
+def _store(results: Dict[str, dict], prompts: Dict[str, Tuple[str, str]]) -> None:
+    """Put collected results into the LLM cache (before the batch state is cleared)."""
+    for cid, obj in results.items():
+        cache_put(OPENAI_MODEL, *prompts[cid], obj)
+
+
+def run_batch(prompts: Dict[str, Tuple[str, str]]) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """Run `prompts` (custom_id -> (system, user)) through the Batch API.
+
+    A pending job from an interrupted run is finished first; its successful
+    results are reused for every custom_id whose prompts are unchanged, and
+    the rest (failed ones included) is submitted as a new job. Results are
+    cached as they are collected. Returns (results, errors) keyed by custom_id.
+    """
+    results: Dict[str, dict] = {}
+    errors: Dict[str, str] = {}
+
+    state = _load_state()
+    if state:
+        print(f"[batch] Resuming batch {state['batch_id']} from {state.get('created', '?')}")
+        old_results, old_errors = _collect(_wait(state["batch_id"]))
+        for cid, key in state.get("keys", {}).items():
+            if cid in old_results and cid in prompts and cache_key(OPENAI_MODEL, *prompts[cid]) == key:
+                results[cid] = old_results[cid]
+        _store(results, prompts)
+        if old_errors:
+            print(f"[batch] Resubmitting {len(old_errors)} request(s) that failed in the resumed batch")
+        _clear_state()
+
+    remaining = {cid: p for cid, p in prompts.items() if cid not in results}
+    if remaining:
+        state = _submit(remaining)
+        new_results, new_errors = _collect(_wait(state["batch_id"]))
+        _store(new_results, remaining)
+        results.update(new_results)
+        errors.update(new_errors)
+        for cid in remaining:
+            if cid not in new_results and cid not in new_errors:
+                errors[cid] = "Missing from batch output"
+        _clear_state()
+
+    print(f"[batch] Results: ok={len(results)} failed={len(errors)}")
+    return results, errors
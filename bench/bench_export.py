@@ -0,0 +1,101 @@
+"""
+Template export (template_export.export_rows_to_template): wall-clock time and
+peak Python memory for 1k/10k/100k synthetic rows, written into a generated
+two-row-header template with merged group cells. About a quarter of the rows
+share a (Příjmení, Jméno) pair, so duplicate highlighting is exercised.
+
+    python bench/bench_export.py [rows ...] [--old path/to/template_export.py] [--keep DIR]
+
+--old compares with another template_export.py, e.g. the iterrows version:
+    git show 9b67957^:template_export.py > /tmp/old_template_export.py
+(that version needs pandas). Peak memory is measured with tracemalloc in a
+separate pass, so it does not slow down the timed one. Output workbooks go to a
+temporary directory unless --keep is given.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import tracemalloc
+import importlib.util
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import template_export  # noqa: E402
+
+GROUPS = ["Klient", "Osoba", "Osoba", "Osoba", "Osoba", "Osoba", "Kontakt", "Kontakt", "Kontakt", "Poznámka"]
+LEAVES = ["Název klienta*", "Příjmení*", "Jméno", "Titul před", "Titul za", "Funkce",
+          "Tel 1", "E-mail", "WWW", "Poznámka k osobě"]
+SURNAMES = ["Novák", "Svoboda", "Dvořák", "Černý", "Procházka", "Kučera"]
+NAMES = ["Jan", "Petr", "Eva", "Jana", "Tomáš", "Lucie"]
+
+
+def _template(path: str) -> None:
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Kontakty"
+    for c, (g, leaf) in enumerate(zip(GROUPS, LEAVES), 1):
+        ws.cell(1, c, g).font = Font(bold=True)
+        ws.cell(2, c, leaf).font = Font(bold=True)
+        ws.cell(2, c).fill = PatternFill("solid", start_color="FFDDEBF7")
+    ws.merge_cells("B1:F1")
+    ws.merge_cells("G1:I1")
+    wb.save(path)
+
+
+def _rows(n: int):
+    r = random.Random(n)
+    out = []
+    for i in range(n):
+        dup = r.random() < 0.25
+        out.append({
+            "NazevKlienta": f"Firma {r.randint(1, max(1, n // 4))} s.r.o.",
+            "Prijmeni": r.choice(SURNAMES) + ("" if dup else str(i)),
+            "Jmeno": r.choice(NAMES), "TitulPred": "Ing." if i % 5 == 0 else "", "TitulZa": "",
+            "Funkce": "obchodní ředitel" if i % 4 == 0 else "", "Tel1": f"+420 {r.randint(600000000, 799999999)}",
+            "Email": f"osoba{i}@firma.cz", "WWW": "www.firma.cz",
+            "PoznamkaKOsobe": "Poptávka materiálu, termín do konce měsíce." if i % 3 == 0 else "",
+            "_EMAIL_RECEIVED": "2026-10-01 10:00", "_EMAIL_FROM": f"Osoba {i} <osoba{i}@firma.cz>",
+            "_EMAIL_SUBJECT": "RE: nabídka", "_EMAIL_DIR": "IN", "_CONV_ID": f"conv{i}",
+        })
+    return out
+
+
+def _load(path: str):
+    spec = importlib.util.spec_from_file_location("old_template_export", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def main():
+    args = sys.argv[1:]
+    old = _load(args[args.index("--old") + 1]) if "--old" in args else None
+    keep = args[args.index("--keep") + 1] if "--keep" in args else None
+    sizes = [int(a) for a in args if a.isdigit()] or [1000, 10000, 100000]
+    impls = [("new", template_export.export_rows_to_template)] + \
+            ([("old", old.export_rows_to_template)] if old else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dir = keep or tmp
+        os.makedirs(out_dir, exist_ok=True)
+        template = os.path.join(out_dir, "template.xlsx")
+        _template(template)
+        for n in sizes:
+            rows = _rows(n)
+            for label, fn in impls:
+                out = os.path.join(out_dir, f"export_{label}_{n}.xlsx")
+                t = time.perf_counter()
+                fn(template, out, "", rows, start_row=3)
+                secs = time.perf_counter() - t
+                tracemalloc.start()
+                fn(template, out, "", rows, start_row=3)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"{label} rows={n}: {secs:.2f}s, peak {peak / 2**20:.0f} MiB, "
+                      f"file {os.path.getsize(out) / 2**20:.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
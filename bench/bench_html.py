@@ -0,0 +1,114 @@
+"""
+HTML-to-text: utils.html_to_text vs the former BeautifulSoup (html.parser) version
+on synthetic Outlook/Word-generated bodies (head styles, VML, conditional comments,
+MsoNormal paragraphs, quoted-reply tables).
+
+    python bench/bench_html.py [mails] [--paras N]
+
+--paras sets the maximum body length in paragraphs (large bodies: --paras 400).
+The BeautifulSoup side needs the beautifulsoup4 package; without it only the
+new converter is timed.
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils  # noqa: E402
+
+WORDS = ("dobrý den posílám nabídku na dodávku materiálu termín plnění je do konce měsíce "
+         "please find attached the quote we need the delivery by friday").split()
+PARAS = 40
+
+HEAD = """<html xmlns:v="urn:schemas-microsoft-com:vml" xmlns:o="urn:schemas-microsoft-com:office:office"
+xmlns:w="urn:schemas-microsoft-com:office:word"><head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+<meta name="Generator" content="Microsoft Word 15 (filtered medium)">
+<!--[if !mso]><style>v\\:* {behavior:url(#default#VML);} o\\:* {behavior:url(#default#VML);}</style><![endif]-->
+<style><!--
+@font-face {font-family:"Cambria Math"; panose-1:2 4 5 3 5 4 6 3 2 4;}
+p.MsoNormal, li.MsoNormal, div.MsoNormal {margin:0cm; font-size:11.0pt; font-family:"Calibri",sans-serif;}
+a:link, span.MsoHyperlink {mso-style-priority:99; color:#0563C1; text-decoration:underline;}
+span.EmailStyle17 {mso-style-type:personal-compose; font-family:"Calibri",sans-serif; color:windowtext;}
+@page WordSection1 {size:612.0pt 792.0pt; margin:70.85pt 70.85pt 70.85pt 70.85pt;}
+div.WordSection1 {page:WordSection1;}
+--></style><!--[if gte mso 9]><xml>
+<o:shapedefaults v:ext="edit" spidmax="1026" />
+</xml><![endif]--><!--[if gte mso 9]><xml>
+<o:shapelayout v:ext="edit"><o:idmap v:ext="edit" data="1" /></o:shapelayout></xml><![endif]-->
+</head><body lang="CS" link="#0563C1" vlink="#954F72" style="word-wrap:break-word">
+<div class="WordSection1">
+"""
+
+
+def _para(r: random.Random) -> str:
+    text = " ".join(r.choice(WORDS) for _ in range(r.randint(8, 40))).capitalize() + "."
+    return (f'<p class="MsoNormal"><span style="font-size:10.0pt;font-family:&quot;Arial&quot;,sans-serif;'
+            f'color:#1F497D;mso-fareast-language:CS">{text}<o:p></o:p></span></p>\n')
+
+
+def _mail(i: int) -> str:
+    r = random.Random(i)
+    parts = [HEAD]
+    parts += [_para(r) for _ in range(r.randint(1, PARAS))]
+    parts.append('<p class="MsoNormal"><o:p>&nbsp;</o:p></p>\n'
+                 '<p class="MsoNormal"><b>S pozdravem</b><br>Jan Novák<br>Tel: +420 601 234 567<br>'
+                 '<a href="mailto:jan@firma.cz">jan@firma.cz</a></p>\n'
+                 '<!--[if gte vml 1]><v:shape id="Obrázek_x0020_1" style="width:120pt;height:40pt">'
+                 '<v:imagedata src="cid:image001.png@01D0" o:title=""/></v:shape><![endif]-->'
+                 '<![if !vml]><img width="160" height="53" src="cid:image001.png@01D0"><![endif]>\n')
+    if r.random() < 0.6:
+        parts.append('<div style="border:none;border-top:solid #E1E1E1 1.0pt;padding:3.0pt 0cm 0cm 0cm">'
+                     '<p class="MsoNormal"><b>From:</b> Petra Svobodová &lt;petra@example.com&gt;<br>'
+                     '<b>Sent:</b> Monday, March 3, 2025 9:12 AM<br><b>Subject:</b> RE: nabídka</p></div>\n'
+                     '<table class="MsoNormalTable" border="0" cellpadding="0"><tr>'
+                     + "".join(f'<td style="padding:.75pt .75pt .75pt .75pt">{_para(r)}</td>' for _ in range(3))
+                     + '</tr></table>\n')
+    parts.append('<script>var x = 1;</script></div></body></html>')
+    return "".join(parts)
+
+
+def _bs4_html_to_text():
+    try:
+        from bs4 import BeautifulSoup
+    except ImportError:
+        return None
+
+    def html_to_text(html: str) -> str:
+        if not html:
+            return ""
+        soup = BeautifulSoup(html, "html.parser")
+        for tag in soup(["script", "style"]):
+            tag.decompose()
+        return soup.get_text("\n", strip=True)
+    return html_to_text
+
+
+def main():
+    args = sys.argv[1:]
+    global PARAS
+    if "--paras" in args:
+        PARAS = int(args[args.index("--paras") + 1])
+    n = int(args[0]) if args and args[0].isdigit() else 2000
+    corpus = [_mail(i) for i in range(n)]
+    mb = sum(len(h) for h in corpus) / 1e6
+    old = _bs4_html_to_text()
+    if old is None:
+        print("[i] beautifulsoup4 not installed; timing the new converter only")
+    impls = [("new", utils.html_to_text)] + ([("bs4", old)] if old else [])
+    for label, fn in impls:
+        t = time.perf_counter()
+        for html in corpus:
+            fn(html)
+        s = time.perf_counter() - t
+        print(f"{label}: {s:.2f}s for {n} bodies / {mb:.1f}M chars ({mb / s:.1f}M chars/s)")
+    if old:
+        # bs4 keeps Word's whitespace runs inside a line; compare the words of each line
+        norm = lambda t: [" ".join(ln.split()) for ln in t.splitlines() if ln.strip()]  # noqa: E731
+        same = sum(norm(utils.html_to_text(h)) == norm(old(h)) for h in corpus)
+        print(f"same text lines: {same} of {n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+End-to-end wall-clock of main.main() with PIPELINE_MODE=sequential vs async on a
+synthetic .eml mailbox, with a fake LLM (fixed latency, no network) and a fixed
+per-message body read latency that stands in for Outlook.
+
+    python bench/bench_pipeline.py [conversations] [--replies N] [--llm-ms MS] [--read-ms MS]
+
+Each mode runs in its own process (config is read at import) with LLM_CACHE,
+RUN_JOURNAL and CONTACT_STORE off and all output in a temporary directory.
+A .env next to config.py is loaded with override=True and wins over these
+settings, so move it aside first. Besides the total time, the time until the
+first LLM request is shown: the async pipeline sends it while the mailbox is
+still being read.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import subprocess
+import datetime as dt
+import email.utils
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORDS = ("dobrý den posílám nabídku na dodávku materiálu termín plnění je do konce měsíce "
+         "please find attached the quote we need the delivery by friday").split()
+
+
+def _opt(args, name: str, default: float) -> float:
+    return float(args[args.index(name) + 1]) if name in args else default
+
+
+def _mailbox(path: str, conversations: int, replies: int) -> int:
+    """Write `conversations` threads of 1..`replies` messages within the last two days."""
+    r = random.Random(conversations)
+    now = dt.datetime.now(dt.timezone.utc)
+    n = 0
+    for c in range(conversations):
+        for k in range(r.randint(1, replies)):
+            sent = now - dt.timedelta(minutes=r.randint(5, 2 * 24 * 60))
+            body = "\n\n".join(" ".join(r.choice(WORDS) for _ in range(r.randint(10, 40))).capitalize() + "."
+                               for _ in range(r.randint(1, 6)))
+            with open(os.path.join(path, f"m{n:06d}.eml"), "w", encoding="utf-8") as f:
+                f.write(f"From: Jan Novák {c} <jan{c}@firma{c}.cz>\nTo: me@example.com\n"
+                        f"Subject: {'Re: ' if k else ''}nabídka {c}\nDate: {email.utils.format_datetime(sent)}\n"
+                        f"Message-ID: <m{n}@bench>\nReferences: <root{c}@bench>\n"
+                        "Content-Type: text/plain; charset=utf-8\n\n"
+                        f"{body}\n\nS pozdravem\nJan Novák\nFirma {c} s.r.o.\nTel: +420 601 {c:06d}\n")
+            n += 1
+    return n
+
+
+def _child(mode: str, llm_ms: float, read_ms: float) -> None:
+    """Runs in the subprocess: patch the LLM call and the body reads, then run main()."""
+    sys.path.insert(0, ROOT)
+    sys.argv = ["main.py", "--full"]
+    import main
+    first = []
+
+    def fake_llm(system_prompt: str, user_prompt: str) -> dict:
+        if not first:
+            first.append(time.perf_counter())
+        time.sleep(llm_ms / 1000)
+        return {"NazevKlienta": "Firma s.r.o.", "Prijmeni": "Novák", "Jmeno": "Jan", "Email": "jan@firma.cz"}
+
+    source = main.get_mail_source()
+    iter_headers = source.iter_headers
+
+    def slow(load_body):
+        def load():
+            time.sleep(read_ms / 1000)
+            return load_body()
+        return load
+
+    def slow_headers(*args, **kwargs):
+        for em, load_body in iter_headers(*args, **kwargs):
+            yield em, slow(load_body)
+
+    source.iter_headers = slow_headers
+    main.get_mail_source = lambda: source
+    main._call_llm = fake_llm
+    t = time.perf_counter()
+    main.main()
+    total = time.perf_counter() - t
+    print(f"@@ {mode} {total:.3f} {(first[0] - t) if first else -1:.3f}")
+
+
+def main():
+    args = sys.argv[1:]
+    if args[:1] == ["--child"]:
+        _child(args[1], float(args[2]), float(args[3]))
+        return
+    conversations = int(args[0]) if args and args[0].isdigit() else 200
+    replies = int(_opt(args, "--replies", 3))
+    llm_ms, read_ms = _opt(args, "--llm-ms", 300), _opt(args, "--read-ms", 20)
+    with tempfile.TemporaryDirectory() as tmp:
+        mbox = os.path.join(tmp, "eml")
+        os.makedirs(mbox)
+        n = _mailbox(mbox, conversations, replies)
+        print(f"[i] {n} messages in {conversations} conversations; LLM {llm_ms:.0f} ms, body read {read_ms:.0f} ms")
+        for mode in ("sequential", "async"):
+            env = dict(os.environ, MAIL_SOURCE="eml", MAIL_SOURCE_PATH=mbox, PIPELINE_MODE=mode,
+                       OUTPUT_DIR=os.path.join(tmp, "out"), OUTPUT_NAME=mode, OUTPUT_FORMAT="csv",
+                       EXPORT_MODE="new", DAYS_BACK="3", MAX_EMAILS=str(n), STATUS="all",
+                       LLM_CACHE="false", LLM_PACK_SIZE="1", LOCAL_EXTRACT="false",
+                       RUN_JOURNAL="false", CONTACT_STORE="false", MY_EMAILS="me@example.com",
+                       SYNC_STATE_PATH=os.path.join(tmp, f"state_{mode}.json"))
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode,
+                                  str(llm_ms), str(read_ms)], env=env, capture_output=True, text=True)
+            line = [ln for ln in out.stdout.splitlines() if ln.startswith("@@ ")]
+            if out.returncode or not line:
+                print(f"[err] {mode} run failed:\n{out.stdout[-2000:]}{out.stderr[-2000:]}")
+                continue
+            _, _, total, first = line[-1].split()
+            print(f"{mode}: {float(total):.2f}s total, first LLM request after {float(first):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
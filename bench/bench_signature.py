@@ -0,0 +1,75 @@
+"""
+Signature detection on a synthetic corpus (cue on its own line, inline cue, no-cue
+contact block, no signature).
+
+    python bench/bench_signature.py [mails] [--paras N] [--old path/to/utils.py]
+
+--paras sets the maximum body length in paragraphs (long bodies: --paras 200).
+
+--old compares with another utils.py, e.g. the one before the rewrite:
+    git show 526f266:utils.py > /tmp/old_utils.py
+"""
+import os
+import sys
+import time
+import random
+import importlib.util
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils  # noqa: E402
+
+WORDS = ("dobrý den posílám nabídku na dodávku materiálu termín plnění je do konce měsíce "
+         "please find attached the quote we need the delivery by friday").split()
+CLOSINGS = ["S pozdravem", "Best regards", "Kind regards", "Mit freundlichen Grüßen", "С уважением", "S úctou", "-- "]
+PARAS = 12
+NAMES = ["Jan Novák", "Petra Svobodová", "John Smith", "Hans Müller"]
+
+
+def _mail(i: int):
+    r = random.Random(i)
+    body = "\n".join(" ".join(r.choice(WORDS) for _ in range(r.randint(8, 30))).capitalize() + "."
+                     for _ in range(r.randint(1, PARAS)))
+    name = r.choice(NAMES)
+    contact = [f"Tel: +420 {r.randint(600000000, 799999999)}", f"{name.split()[0].lower()}@firma.cz", "www.firma.cz"]
+    kind = r.choice(["own", "nocue", "inline", "none"])
+    if kind == "own":
+        return f"{body}\n\n{r.choice(CLOSINGS)}\n{name}\n" + "\n".join(contact[:r.randint(0, 3)]), kind
+    if kind == "nocue":
+        return f"{body}\n\n{name}\nFirma s.r.o.\n" + "\n".join(contact), kind
+    if kind == "inline":
+        return f"{body} Díky. {r.choice(CLOSINGS)} {name}", kind
+    return body, kind
+
+
+def _load(path: str):
+    spec = importlib.util.spec_from_file_location("old_utils", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def main():
+    args = sys.argv[1:]
+    global PARAS
+    old = _load(args[args.index("--old") + 1]) if "--old" in args else None
+    if "--paras" in args:
+        PARAS = int(args[args.index("--paras") + 1])
+    n = int(args[0]) if args and args[0].isdigit() else 20000
+    corpus = [_mail(i) for i in range(n)]
+    chars = sum(len(t) for t, _ in corpus)
+    impls = [("new", utils.extract_signature)] + ([("old", old.extract_signature)] if old else [])
+    for label, fn in impls:
+        t = time.perf_counter()
+        for text, _ in corpus:
+            fn(text)
+        print(f"{label}: {time.perf_counter() - t:.2f}s for {n} mails / {chars / 1e6:.1f}M chars")
+    if old:
+        diff = {}
+        for text, kind in corpus:
+            if utils.extract_signature(text) != old.extract_signature(text):
+                diff[kind] = diff.get(kind, 0) + 1
+        print("differing results per kind:", diff or "none")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Body cleanup between html_to_text and the prompt: drops quoted reply history,
+legal disclaimers and mobile/eco boilerplate so the model sees the newest
+message (and its signature) only.
+
+Recognised history formats (cs/en/de/ru):
+- Outlook separators: "-----Original Message-----", "-----Původní zpráva-----", ...
+  and the underscore line Outlook puts above a reply header (only when a From/Od/Von/От
+  line follows; signatures use the same rule between name and company)
+- Outlook reply headers: From/Od/Von/От followed by Sent/Date/Odesláno/Gesendet/
+  Отправлено and To/Subject/Komu/Předmět/An/Betreff/Кому/Тема within a few lines
+- Gmail/Apple headers: "On ... wrote:", "Dne ... napsal(a):", "Am ... schrieb ...:",
+  "... пишет:"
+- '>' quoted lines
+"""
+import re
+from typing import List, Tuple
+
+# Lines that start the quoted history on their own
+_rx_separator = re.compile(
+    r"^\s*(-{2,}\s*(original message|původní zpráva|puvodni zprava|ursprüngliche nachricht|"
+    r"исходное сообщение|forwarded message|přeposlaná zpráva|weitergeleitete nachricht|"
+    r"пересылаемое сообщение)\s*-{2,})\s*$", re.I)
+_rx_rule = re.compile(r"^\s*_{10,}\s*$")
+
+# Outlook reply header fields (the label may be alone on its line: "<b>From:</b> x" -> "From:\nx")
+_rx_hdr_from = re.compile(r"^\s*\*?(from|od|von|от)\s*:", re.I)
+_rx_hdr_date = re.compile(r"^\s*\*?(sent|date|odesláno|odeslano|datum|gesendet|отправлено|дата)\s*:", re.I)
+_rx_hdr_other = re.compile(r"^\s*\*?(to|subject|komu|předmět|predmet|an|betreff|кому|тема)\s*:", re.I)
+_HEADER_WINDOW = 12
+
+# Gmail/Apple style attribution, possibly wrapped over a few lines; it must name an address
+# or start like a dated attribution, so "as I wrote:" in running text is not a cut point
+_rx_attrib_end = re.compile(r"(wrote|napsala?|schrieb|пишет|написала?)(\(a\)|\(а\)|\b)[^:]{0,80}:\s*$", re.I)
+_rx_attrib_start = re.compile(r"^\s*((on|dne|am|le)\b.*\d|\d{1,2}[. ])", re.I)
+
+_rx_quoted = re.compile(r"^\s*>")
+
+# Disclaimer openers; the block continues over the following long lines
+_rx_disclaimer = re.compile(
+    r"(this (e-?mail|message|communication)\b.{0,80}\b(confidential|privileged|intended (solely |only )?for)"
+    r"|confidentiality notice|disclaimer\s*:|"
+    r"tento (e-?mail|email|zpráva|zprava)\b.{0,80}\b(důvěrn|duvern|určen|urcen)|"
+    r"tato (e-?mailová |emailová )?zpráva\b.{0,80}\b(důvěrn|duvern|určen|urcen)|"
+    r"obsah té?to (e-?mailové |emailové )?zprávy\b.{0,80}\b(důvěrn|duvern|určen|urcen)|"
+    r"diese (e-?mail|nachricht)\b.{0,80}\b(vertraulich|bestimmt)|"
+    r"(это|данное) (сообщение|письмо)\b.{0,80}\b(конфиденциальн|предназначен))", re.I)
+_DISCLAIMER_MIN = 80        # an opener line shorter than this is ordinary text
+_DISCLAIMER_CONT = 60       # following lines at least this long belong to the block
+
+# Single boilerplate lines
+_rx_boilerplate = re.compile(
+    r"^\s*(sent from my (iphone|ipad|android|mobile|samsung).*|odesláno z (iphonu|ipadu|mobilu|mého).*|"
+    r"von meinem (iphone|ipad|smartphone) gesendet.*|отправлено с (iphone|ipad|моего).*|"
+    r"get outlook for (ios|android).*|stáhněte si outlook pro .*|"
+    r"(please )?consider the environment before printing.*|před vytištěním .*zvažte.*|"
+    r"bitte denken sie an die umwelt.*)\s*$", re.I)
+
+
+def _history_start(lines: List[str]) -> int:
+    """Index of the first line of quoted history, or -1."""
+    for i, ln in enumerate(lines):
+        if _rx_separator.match(ln):
+            return i
+        if _rx_rule.match(ln) and any(_rx_hdr_from.match(w) for w in lines[i + 1:i + 1 + _HEADER_WINDOW]):
+            return i
+        if _rx_hdr_from.match(ln):
+            window = lines[i + 1:i + 1 + _HEADER_WINDOW]
+            if any(_rx_hdr_date.match(w) for w in window) and any(_rx_hdr_other.match(w) for w in window):
+                return i
+        if _rx_attrib_end.search(ln) and (_rx_attrib_start.match(ln) or "@" in ln):
+            return i
+        if _rx_attrib_start.match(ln):
+            # wrapped, or split by a mailto link: "On ... Jan <" / "jan@x.cz" / "> wrote:"
+            for j in range(i + 1, min(i + 4, len(lines))):
+                joined = " ".join(lines[i:j + 1])
+                if len(joined) < 300 and _rx_attrib_end.search(joined):
+                    return i
+    return -1
+
+
+def _drop_disclaimers(lines: List[str]) -> List[str]:
+    out: List[str] = []
+    in_block = False
+    for i, ln in enumerate(lines):
+        if in_block:
+            if len(ln.strip()) >= _DISCLAIMER_CONT:
+                continue
+            in_block = False
+        if _rx_disclaimer.search(ln):
+            # a bold "CONFIDENTIALITY NOTICE:" becomes its own short line; the text follows it
+            nxt = lines[i + 1] if i + 1 < len(lines) else ""
+            if len(ln) >= _DISCLAIMER_MIN or len(nxt.strip()) >= _DISCLAIMER_CONT:
+                in_block = True
+                continue
+        out.append(ln)
+    return out
+
+
+def clean_body(text: str) -> Tuple[str, int]:
+    """Remove quoted history, disclaimers and boilerplate lines.
+    Returns (clean text, UTF-8 bytes removed). A message that is nothing but
+    quoted history (plain forward) keeps the quoted part."""
+    if not text:
+        return text or "", 0
+    lines = text.splitlines()
+    cut = _history_start(lines)
+    if cut != -1 and any(ln.strip() and not _rx_quoted.match(ln) for ln in lines[:cut]):
+        lines = lines[:cut]
+    lines = [ln for ln in lines if not _rx_quoted.match(ln) and not _rx_boilerplate.match(ln)] or lines
+    lines = _drop_disclaimers(lines)
+    while lines and not lines[-1].strip():
+        lines.pop()
+    clean = "\n".join(lines)
+    return clean, max(0, len(text.encode("utf-8")) - len(clean.encode("utf-8")))
@@ -38,12 +38,100 @@ STATUS_DEFAULT         = os.getenv("STATUS", "all").strip().lower()  # all|unrea
 
 OUTPUT_DIR  = os.getenv("OUTPUT_DIR", "").strip()
 OUTPUT_NAME = os.getenv("OUTPUT_NAME", "outlook_analysis").strip()
+# csv/jsonl/parquet are streamed as each conversation finishes; xlsx is written at the end
+OUTPUT_FORMAT     = os.getenv("OUTPUT_FORMAT", "xlsx").strip().lower()   # xlsx|csv|jsonl|parquet
+OUTPUT_FLUSH_ROWS = max(1, int(os.getenv("OUTPUT_FLUSH_ROWS", "50")))
 STRICT_SCHEMA = os.getenv("STRICT_SCHEMA", "true").lower() == "true"
 
 TEMPLATE_XLSX        = os.getenv("TEMPLATE_XLSX", "").strip()
 TEMPLATE_SHEET       = os.getenv("TEMPLATE_SHEET", "").strip()
 TEMPLATE_START_AT_R3 = os.getenv("TEMPLATE_START_AT_ROW3", "true").lower() == "true"
 
+# EXPORT_MODE=master appends/updates rows in one workbook (MASTER_XLSX) instead of a new file per run
+EXPORT_MODE = os.getenv("EXPORT_MODE", "new").strip().lower()   # new|master
+MASTER_XLSX = os.getenv("MASTER_XLSX", "").strip() or os.path.join(OUTPUT_DIR or ".", f"{OUTPUT_NAME or 'outlook_analysis'}.xlsx")
+
 MY_EMAILS = {e.strip().lower() for e in os.getenv("MY_EMAILS", "").split(",") if e.strip()}
+MY_NAMES  = {" ".join(n.lower().split()) for n in os.getenv("MY_NAME", "").split(",") if n.strip()}
+
+FETCH_SENT_TOO = os.getenv("FETCH_SENT_TOO", "true").lower() == "true"
+
+# Drop quoted reply history, disclaimers and mobile boilerplate from bodies before prompting
+STRIP_QUOTED = os.getenv("STRIP_QUOTED", "true").lower() == "true"
+
+# How Outlook folders are read: "table" = bulk header columns via Folder.GetTable
+# (bodies opened per item only when kept), "items" = per-item COM property access
+OUTLOOK_READ_MODE  = os.getenv("OUTLOOK_READ_MODE", "table").strip().lower()
+OUTLOOK_TABLE_CHUNK = int(os.getenv("OUTLOOK_TABLE_CHUNK", "500"))
+# Worker threads (own COM apartment each) when OUTLOOK_FOLDER lists several folders separated by ";"
+OUTLOOK_FETCH_WORKERS = int(os.getenv("OUTLOOK_FETCH_WORKERS", "4"))
+
+# Where mail comes from: outlook (COM), eml (directory of .eml/.msg files) or mbox (file or directory)
+MAIL_SOURCE      = os.getenv("MAIL_SOURCE", "outlook").strip().lower()
+MAIL_SOURCE_PATH = os.getenv("MAIL_SOURCE_PATH", "").strip()
+
+# Number of conversations sent to the LLM in parallel (1 = sequential)
+LLM_CONCURRENCY = max(1, int(os.getenv("LLM_CONCURRENCY", "4")))
+
+# HTTP connection pool and retry policy for LLM calls
+LLM_POOL_SIZE    = max(1, int(os.getenv("LLM_POOL_SIZE", str(LLM_CONCURRENCY))))
+LLM_MAX_RETRIES  = max(0, int(os.getenv("LLM_MAX_RETRIES", "5")))
+LLM_RETRY_BUDGET = max(0, int(os.getenv("LLM_RETRY_BUDGET", "50")))  # total retries per run
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))      # seconds
+LLM_BACKOFF_MAX  = float(os.getenv("LLM_BACKOFF_MAX", "60"))        # seconds
+
+# Persistent LLM response cache (SQLite); default lives next to the .env file
+LLM_CACHE              = os.getenv("LLM_CACHE", "true").lower() == "true"
+LLM_CACHE_PATH         = os.getenv("LLM_CACHE_PATH", "").strip() or os.path.join(os.path.dirname(ENV_FILE), "llm_cache.sqlite")
+LLM_CACHE_MAX_AGE_DAYS = int(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "90"))
+LLM_CACHE_MAX_ENTRIES  = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+
+# Offline Batch API mode (main.py --batch)
+BATCH_DIR          = os.getenv("BATCH_DIR", "").strip() or os.path.join(os.path.dirname(ENV_FILE), "batches")
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h").strip()
+
+# Pack several short conversations into one LLM request (1 = off; PIPELINE_MODE=sequential only)
+LLM_PACK_SIZE      = max(1, int(os.getenv("LLM_PACK_SIZE", "1")))
+LLM_PACK_MAX_CHARS = int(os.getenv("LLM_PACK_MAX_CHARS", "4000"))  # longer bodies are always sent alone
+
+# Max input tokens per single-email request (system + user prompt); 0 = no limit
+LLM_INPUT_TOKEN_BUDGET = int(os.getenv("LLM_INPUT_TOKEN_BUDGET", "6000"))
+
+# Streamed completions: stop reading once the JSON object closes; optional output cap
+LLM_STREAM     = os.getenv("LLM_STREAM", "false").lower() == "true"
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "0"))  # 0 = no max_tokens in the request
+
+# Structured output: json_schema (strict, built from the schema keys; falls back to json_object
+# when the backend rejects it) or json_object. Replies that cannot be repaired locally are
+# re-asked with a short correction prompt up to LLM_REASK times (0 = off).
+LLM_RESPONSE_FORMAT = os.getenv("LLM_RESPONSE_FORMAT", "json_schema").strip().lower()
+LLM_REASK           = max(0, int(os.getenv("LLM_REASK", "1")))
+
+
+# Rule-based fast path: skip the LLM when headers + signature already give a confident row
+LOCAL_EXTRACT                = os.getenv("LOCAL_EXTRACT", "false").lower() == "true"
+LOCAL_EXTRACT_MIN_CONFIDENCE = float(os.getenv("LOCAL_EXTRACT_MIN_CONFIDENCE", "0.8"))
+
+# async = overlap Outlook fetch, preprocessing and LLM calls; sequential = fetch all, then call the model
+PIPELINE_MODE         = os.getenv("PIPELINE_MODE", "async").strip().lower()
+PIPELINE_QUEUE_SIZE   = max(1, int(os.getenv("PIPELINE_QUEUE_SIZE", "64")))
+PIPELINE_PREP_WORKERS = max(1, int(os.getenv("PIPELINE_PREP_WORKERS", "2")))
+
+# Incremental sync state (per-folder watermarks + last processed message per conversation)
+# SYNC_MODE=full refetches the whole window every run (same as `--full`); the state is still updated
+SYNC_MODE       = os.getenv("SYNC_MODE", "incremental").strip().lower()   # incremental|full
+SYNC_STATE_PATH = os.getenv("SYNC_STATE_PATH", "").strip() or os.path.join(os.path.dirname(ENV_FILE), "sync_state.json")
+SYNC_KEEP_DAYS  = int(os.getenv("SYNC_KEEP_DAYS", "365"))
+
+# Cross-run contact index (SQLite): rows are merged into it and flagged new/changed/known in _CONTACT.
+# CONTACT_EXPORT=changed leaves contacts that are already known and unchanged out of the export.
+CONTACT_STORE           = os.getenv("CONTACT_STORE", "false").lower() == "true"
+CONTACT_STORE_PATH      = os.getenv("CONTACT_STORE_PATH", "").strip() or os.path.join(os.path.dirname(ENV_FILE), "contacts.sqlite")
+CONTACT_FUZZY_THRESHOLD = float(os.getenv("CONTACT_FUZZY_THRESHOLD", "0.88"))  # name similarity 0..1
+CONTACT_EXPORT          = os.getenv("CONTACT_EXPORT", "all").strip().lower()   # all|changed
 
-FETCH_SENT_TOO = os.getenv("FETCH_SENT_TOO", "true").lower() == "true"
\ No newline at end of file
+# Checkpoint journal of finished rows; `--resume` (or RUN_RESUME=true) reuses it after an interrupted run
+RUN_JOURNAL      = os.getenv("RUN_JOURNAL", "true").lower() == "true"
+RUN_RESUME       = os.getenv("RUN_RESUME", "false").lower() == "true"
+RUN_JOURNAL_PATH = os.getenv("RUN_JOURNAL_PATH", "").strip() or os.path.join(os.path.dirname(ENV_FILE), "run_journal.jsonl")
@@ -0,0 +1,270 @@
+"""
+Persistent contact index across runs (SQLite, CONTACT_STORE_PATH).
+- contacts:     one record per person (schema fields as JSON, first/last seen)
+- contact_keys: normalized lookup keys -> contact id
+    email  lowercased address
+    phone  last 9 digits
+    name   diacritics-free, lowercased name tokens in sorted order ("Novák Jan" == "Jan Novak")
+    block  coarse name buckets; only contacts sharing a bucket are compared fuzzily,
+           so a lookup stays a few indexed queries at 100k+ contacts
+
+Each exported row is matched (e-mail with a similar or missing name, then phone or exact name with a compatible
+name/e-mail, then fuzzy name within its blocks), merged into the stored record
+(non-empty new values win) and flagged in `_CONTACT` as new / changed / known.
+Changes are committed only after a successful export.
+"""
+import os
+import json
+import sqlite3
+import threading
+import unicodedata
+import datetime as dt
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import CONTACT_STORE, CONTACT_STORE_PATH, CONTACT_FUZZY_THRESHOLD
+from prompts import SCHEMA_KEYS_OSOBA
+
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()   # rows may be merged from LLM worker threads (streamed output)
+_created: Set[int] = set()   # contacts created / changed in this run, over all merge_rows calls
+_changed: Set[int] = set()
+_BLOCK_CANDIDATES = 500   # upper bound of fuzzy comparisons per lookup
+
+
+def _db() -> Optional[sqlite3.Connection]:
+    global _conn
+    if not CONTACT_STORE:
+        return None
+    if _conn is None:
+        try:
+            os.makedirs(os.path.dirname(CONTACT_STORE_PATH) or ".", exist_ok=True)
+            conn = sqlite3.connect(CONTACT_STORE_PATH, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS contacts ("
+                " id INTEGER PRIMARY KEY, name_key TEXT, data TEXT, first_seen TEXT, last_seen TEXT, updated TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS contact_keys ("
+                " kind TEXT, value TEXT, contact_id INTEGER, PRIMARY KEY (kind, value, contact_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_contact_keys_id ON contact_keys(contact_id)")
+            conn.commit()
+            _conn = conn
+        except Exception as e:
+            print(f"[warn] Contact store disabled ({CONTACT_STORE_PATH}): {e}")
+            return None
+    return _conn
+
+
+def _fold(s: str) -> str:
+    """Lowercase without diacritics: 'Novák' -> 'novak'."""
+    s = str(s or "")
+    if s.isascii():
+        return s.lower()
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+
+
+def _name_tokens(data: Dict[str, str]) -> List[str]:
+    raw = f"{data.get('Jmeno', '')} {data.get('Prijmeni', '')}"
+    return sorted("".join(ch for ch in tok if ch.isalnum()) for tok in _fold(raw).split() if any(c.isalnum() for c in tok))
+
+
+def _emails(data: Dict[str, str]) -> Set[str]:
+    raw = str(data.get("Email", "") or "").replace(";", ",").replace(" ", ",")
+    return {e.strip().lower() for e in raw.split(",") if "@" in e}
+
+
+def _phone(data: Dict[str, str]) -> str:
+    digits = "".join(ch for ch in str(data.get("Tel1", "") or "") if ch.isdigit())
+    return digits[-9:] if len(digits) >= 9 else ""
+
+
+def _blocks(tokens: List[str]) -> List[str]:
+    """Prefix and suffix buckets: a typo in the middle or at one end still shares a bucket."""
+    if not tokens:
+        return []
+    return ["p:" + "|".join(t[:2] for t in tokens), "s:" + "|".join(t[-2:] for t in tokens)]
+
+
+def _keys(data: Dict[str, str]) -> List[Tuple[str, str]]:
+    tokens = _name_tokens(data)
+    keys = [("email", e) for e in sorted(_emails(data))]
+    if _phone(data):
+        keys.append(("phone", _phone(data)))
+    if tokens:
+        keys.append(("name", " ".join(tokens)))
+    keys.extend(("block", b) for b in _blocks(tokens))
+    return keys
+
+
+def _similarity(ka: str, kb: str) -> float:
+    """Similarity of two name keys; 1.0 when either is empty (nothing to contradict)."""
+    if not ka or not kb or ka == kb:
+        return 1.0
+    if 2.0 * min(len(ka), len(kb)) / (len(ka) + len(kb)) < CONTACT_FUZZY_THRESHOLD:
+        return 0.0  # upper bound of the ratio from the lengths alone
+    sm = SequenceMatcher(None, ka, kb)
+    return sm.ratio() if sm.quick_ratio() >= CONTACT_FUZZY_THRESHOLD else 0.0
+
+
+def _emails_compatible(a: Dict[str, str], b: Dict[str, str]) -> bool:
+    """Different addresses only conflict when their domains differ too (new mailbox, same company is fine)."""
+    ea, eb = _emails(a), _emails(b)
+    if not ea or not eb or ea & eb:
+        return True
+    return bool({e.split("@")[1] for e in ea} & {e.split("@")[1] for e in eb})
+
+
+def _same_org(a: Dict[str, str], b: Dict[str, str]) -> bool:
+    """Shared e-mail domain or the same company name."""
+    da = {e.split("@")[1] for e in _emails(a)}
+    if da & {e.split("@")[1] for e in _emails(b)}:
+        return True
+    ca, cb = _fold(a.get("NazevKlienta", "")).strip(), _fold(b.get("NazevKlienta", "")).strip()
+    return bool(ca) and ca == cb
+
+
+def _query(conn: sqlite3.Connection, cols: str, ids) -> list:
+    ids = list(ids)
+    out = []
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        out += conn.execute(f"SELECT id, {cols} FROM contacts WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+    return out
+
+
+def _load(conn: sqlite3.Connection, ids) -> Dict[int, Dict[str, str]]:
+    return {cid: json.loads(data) for cid, data in _query(conn, "data", ids)}
+
+
+def _ids(conn: sqlite3.Connection, kind: str, value: str, limit: int = _BLOCK_CANDIDATES) -> List[int]:
+    return [r[0] for r in conn.execute(
+        "SELECT contact_id FROM contact_keys WHERE kind = ? AND value = ? LIMIT ?", (kind, value, limit))]
+
+
+def _pick(data: Dict[str, str], matches: List[Tuple[int, Dict[str, str]]]) -> Optional[Tuple[int, Dict[str, str]]]:
+    """One match, or the only one from the same organisation; several equal candidates are ambiguous."""
+    if len(matches) == 1:
+        return matches[0]
+    same = [m for m in matches if _same_org(data, m[1])]
+    return same[0] if len(same) == 1 else None
+
+
+def _similar(conn: sqlite3.Connection, key: str, ids) -> Dict[int, float]:
+    """Candidates whose stored name key is similar enough to `key` (names only, data not loaded)."""
+    return {cid: sc for cid, sc in ((cid, _similarity(key, skey or "")) for cid, skey in _query(conn, "name_key", ids))
+            if sc >= CONTACT_FUZZY_THRESHOLD}
+
+
+def find_contact(conn: sqlite3.Connection, data: Dict[str, str]) -> Optional[Tuple[int, Dict[str, str]]]:
+    """Stored contact matching `data`, or None (also when the match would be ambiguous)."""
+    key = " ".join(_name_tokens(data))
+    for e in sorted(_emails(data)):
+        # shared addresses (info@, office@) belong to several people: the name must agree too
+        scores = _similar(conn, key, _ids(conn, "email", e))
+        if scores:
+            cid = max(scores, key=lambda c: (scores[c], -c))
+            return cid, _load(conn, [cid])[cid]
+    exact = []
+    if _phone(data):
+        exact.append(_ids(conn, "phone", _phone(data)))
+    if key:
+        exact.append(_ids(conn, "name", key))
+    for ids in exact:
+        matches = [(cid, stored) for cid, stored in _load(conn, _similar(conn, key, ids)).items()
+                   if _emails_compatible(data, stored)]
+        if matches:
+            return _pick(data, matches)
+    if not key:
+        return None
+    cand: Dict[int, None] = {}
+    for b in _blocks(key.split()):
+        cand.update(dict.fromkeys(_ids(conn, "block", b)))
+    scores = _similar(conn, key, cand)
+    scored = [(scores[cid], cid, stored) for cid, stored in _load(conn, scores).items()
+              if _emails_compatible(data, stored)]
+    if not scored:
+        return None
+    top = max(sc for sc, _, _ in scored)
+    return _pick(data, [(cid, stored) for sc, cid, stored in scored if sc == top])
+
+
+def _same_value(key: str, a: str, b: str) -> bool:
+    """Spelling variants of one value ('Novak'/'Novák', '+420 777 111 222'/'777111222') are no change."""
+    if key == "Tel1" and _phone({key: a}) and _phone({key: a}) == _phone({key: b}):
+        return True
+    return " ".join(_fold(a).split()) == " ".join(_fold(b).split())
+
+
+def _index(conn: sqlite3.Connection, cid: int, data: Dict[str, str]) -> None:
+    """Replace the lookup keys of contact `cid`: keys of an old e-mail, phone or name would keep matching."""
+    conn.execute("DELETE FROM contact_keys WHERE contact_id = ?", (cid,))
+    conn.executemany("INSERT OR IGNORE INTO contact_keys (kind, value, contact_id) VALUES (?, ?, ?)",
+                     [(k, v, cid) for k, v in _keys(data)])
+
+
+def merge_rows(rows: List[dict]) -> Dict[str, int]:
+    """Match every row against the store, merge it and set `_CONTACT` (new/changed/known)
+    and `_CONTACT_ID`. Rows with `_ERROR` or without name and e-mail are left alone.
+    Nothing is committed here (see commit_contacts)."""
+    with _lock:
+        return _merge_rows(rows)
+
+
+def _merge_rows(rows: List[dict]) -> Dict[str, int]:
+    counts = {"new": 0, "changed": 0, "known": 0}
+    conn = _db()
+    if conn is None:
+        return counts
+    now = dt.datetime.now().isoformat(timespec="seconds")
+    created, changed = _created, _changed
+    for row in rows:
+        if row.get("_ERROR"):
+            continue
+        data = {k: str(row.get(k, "") or "").strip() for k in SCHEMA_KEYS_OSOBA}
+        if not _name_tokens(data) and not _emails(data):
+            continue
+        hit = find_contact(conn, data)
+        if hit is None:
+            cid = conn.execute(
+                "INSERT INTO contacts (name_key, data, first_seen, last_seen, updated) VALUES (?, ?, ?, ?, ?)",
+                (" ".join(_name_tokens(data)), json.dumps(data, ensure_ascii=False), now, now, now)).lastrowid
+            _index(conn, cid, data)
+            created.add(cid)
+            status = "new"
+        else:
+            cid, stored = hit
+            merged = dict(stored)
+            merged.update({k: v for k, v in data.items()
+                           if v and k != "PoznamkaKOsobe" and not _same_value(k, v, stored.get(k, ""))})
+            if data.get("PoznamkaKOsobe"):
+                merged["PoznamkaKOsobe"] = data["PoznamkaKOsobe"]  # latest summary, not a contact change
+            if any(merged.get(k, "") != stored.get(k, "") for k in SCHEMA_KEYS_OSOBA if k != "PoznamkaKOsobe"):
+                changed.add(cid)
+                conn.execute("UPDATE contacts SET name_key = ?, data = ?, last_seen = ?, updated = ? WHERE id = ?",
+                             (" ".join(_name_tokens(merged)), json.dumps(merged, ensure_ascii=False), now, now, cid))
+                _index(conn, cid, merged)
+            else:
+                conn.execute("UPDATE contacts SET data = ?, last_seen = ? WHERE id = ?",
+                             (json.dumps(merged, ensure_ascii=False), now, cid))
+            status = "new" if cid in created else ("changed" if cid in changed else "known")
+        row["_CONTACT"] = status
+        row["_CONTACT_ID"] = cid
+        counts[status] += 1
+    return counts
+
+
+def commit_contacts() -> None:
+    """Persist the merges of this run (call after the export succeeded)."""
+    with _lock:
+        if _conn is not None:
+            _conn.commit()
+
+
+def rollback_contacts() -> None:
+    with _lock:
+        if _conn is not None:
+            _conn.rollback()
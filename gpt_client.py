@@ -1,10 +1,22 @@
 
 import os
+import re
+import json
+import time
+import random
+import threading
+import email.utils
+import datetime as dt
 import requests
-from typing import Dict, Any
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Optional
 
-from config import OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL
-from utils import coerce_json
+from config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL,
+    LLM_POOL_SIZE, LLM_MAX_RETRIES, LLM_RETRY_BUDGET, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+    LLM_STREAM, LLM_MAX_TOKENS, LLM_REASK,
+)
+from llm_schema import response_format, schema_rejected, parse_reply, correction_prompts, record
 
 # NEW: simple debug switch via env
 DEBUG_GPT = os.getenv("DEBUG_GPT", "false").lower() == "true"
@@ -12,6 +24,125 @@ DEBUG_GPT = os.getenv("DEBUG_GPT", "false").lower() == "true"
 
 # NEW: monotonic counter for dumps
 _req_counter = {"n": 0}
+_req_lock = threading.Lock()
+
+# Transient statuses worth retrying (rate limit, overloaded/gateway errors)
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Per-run counters, reported by main at the end of the run
+_stats = {"requests": 0, "retries": 0, "budget_exhausted": 0,
+          "streamed": 0, "early_stops": 0, "ttft_ms": 0, "stream_ms": 0}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """Return the shared keep-alive session (created lazily, sized to the worker pool)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_SIZE, max_retries=0)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+        return _session
+
+
+def run_stats() -> Dict[str, int]:
+    """Snapshot of request/retry counters for the run report."""
+    with _req_lock:
+        return dict(_stats, retry_budget=LLM_RETRY_BUDGET)
+
+
+def _take_retry() -> bool:
+    """Consume one retry from the per-run budget; False when it is used up."""
+    with _req_lock:
+        if _stats["retries"] >= LLM_RETRY_BUDGET:
+            _stats["budget_exhausted"] += 1
+            return False
+        _stats["retries"] += 1
+        return True
+
+
+_rx_duration = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+
+def _parse_duration(v: str) -> Optional[float]:
+    """Parse OpenAI-style reset values like '1s', '6m0s', '250ms' into seconds."""
+    v = (v or "").strip()
+    if not v:
+        return None
+    try:
+        return float(v)
+    except ValueError:
+        pass
+    parts = _rx_duration.findall(v)
+    if not parts:
+        return None
+    mult = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(n) * mult[u] for n, u in parts)
+
+
+def _server_delay(r: Optional[requests.Response]) -> Optional[float]:
+    """Delay requested by the server via Retry-After or x-ratelimit-reset-* headers."""
+    if r is None:
+        return None
+    ra = r.headers.get("Retry-After", "").strip()
+    if ra:
+        try:
+            return max(0.0, float(ra))
+        except ValueError:
+            try:
+                when = email.utils.parsedate_to_datetime(ra)
+                return max(0.0, (when - dt.datetime.now(when.tzinfo)).total_seconds())
+            except Exception:
+                pass
+    if r.status_code == 429:
+        resets = [_parse_duration(r.headers.get(h, ""))
+                  for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+        resets = [x for x in resets if x is not None]
+        if resets:
+            return max(resets)
+    return None
+
+
+def _retry_delay(r: Optional[requests.Response], attempt: int) -> float:
+    """Server hint when present (honoured in full, plus a little jitter), otherwise exponential
+    backoff with full jitter capped at LLM_BACKOFF_MAX."""
+    hint = _server_delay(r)
+    if hint is not None:
+        return hint + random.uniform(0, LLM_BACKOFF_BASE)
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _request_with_retry(method: str, url: str, headers: Dict[str, str], req_no: int,
+                        **kwargs) -> requests.Response:
+    """Send a request through the pooled session, retrying transient failures within the run budget."""
+    kwargs.setdefault("timeout", 90)
+    attempt = 0
+    while True:
+        r = None
+        try:
+            r = _get_session().request(method, url, headers=headers, **kwargs)
+            if r.status_code not in RETRY_STATUS:
+                r.raise_for_status()
+                return r
+            reason = f"HTTP {r.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            reason = type(e).__name__
+            if attempt >= LLM_MAX_RETRIES or not _take_retry():
+                raise
+        else:
+            if attempt >= LLM_MAX_RETRIES or not _take_retry():
+                r.raise_for_status()
+        delay = _retry_delay(r, attempt)
+        if r is not None:
+            r.close()
+        attempt += 1
+        _sprint(f"[gpt] .. retry {attempt}/{LLM_MAX_RETRIES} req#{req_no} after {reason}, sleeping {delay:.1f}s")
+        time.sleep(delay)
 
 
 def _sprint(msg: str):
@@ -20,16 +151,27 @@ def _sprint(msg: str):
     except Exception:
         # last resort: replace non-encodables
         print(msg.encode("utf-8", "replace").decode("utf-8"))
-def call_gpt_with_prompts(system_prompt: str, user_prompt: str) -> Dict[str, Any]:
-    """Send prepared prompts to LLM and return parsed JSON."""
+
+
+def _next_req_no() -> int:
+    with _req_lock:
+        _req_counter["n"] += 1
+        _stats["requests"] += 1
+        return _req_counter["n"]
+
+
+def _auth_headers(json_body: bool = True) -> Dict[str, str]:
     if not OPENAI_API_KEY:
         raise SystemExit("Set OPENAI_API_KEY in .env")
-
-    _req_counter["n"] += 1
-    # ---- PRE-LOG ----
-    _sprint(f"[gpt] -> POST {OPENAI_BASE_URL.rstrip('/')}/chat/completions model={OPENAI_MODEL} req#{_req_counter['n']}")
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
+    if json_body:
+        headers["Content-Type"] = "application/json"
+    return headers
 
 
+def build_chat_payload(system_prompt: str, user_prompt: str, packed: bool = False) -> Dict[str, Any]:
+    """Request body for /chat/completions (shared by live calls and batch files).
+    `packed` selects the multi-email {"results": [...]} schema."""
     payload = {
         "model": OPENAI_MODEL,
         "messages": [
@@ -37,28 +179,139 @@ def call_gpt_with_prompts(system_prompt: str, user_prompt: str) -> Dict[str, Any
             {"role": "user", "content": user_prompt}
         ],
         "temperature": 0.0,
-        "response_format": {"type": "json_object"}
-    }
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
+        "response_format": response_format(packed)
     }
+    if LLM_MAX_TOKENS > 0:
+        payload["max_tokens"] = LLM_MAX_TOKENS
+    return payload
+
+
+def api_request(method: str, path: str, json_body: bool = True, **kwargs) -> requests.Response:
+    """Call any endpoint under OPENAI_BASE_URL with the shared session and retry policy."""
+    headers = _auth_headers(json_body=json_body)
+    req_no = _next_req_no()
+    url = f"{OPENAI_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
+    _sprint(f"[gpt] -> {method} {url} req#{req_no}")
+    return _request_with_retry(method, url, headers, req_no, **kwargs)
+
+
+def _object_end(text: str, state: Dict[str, Any]) -> int:
+    """Feed a chunk into a brace/string tracker; return index just past the closing
+    brace of the top-level JSON object in `text`, or -1 if it has not closed yet."""
+    for i, ch in enumerate(text):
+        if state["in_str"]:
+            if state["esc"]:
+                state["esc"] = False
+            elif ch == "\\":
+                state["esc"] = True
+            elif ch == '"':
+                state["in_str"] = False
+        elif ch == '"':
+            state["in_str"] = state["depth"] > 0
+        elif ch == "{":
+            state["depth"] += 1
+        elif ch == "}" and state["depth"] > 0:
+            state["depth"] -= 1
+            if state["depth"] == 0:
+                return i + 1
+    return -1
+
+
+def _read_stream(r: requests.Response, req_no: int, t0: float) -> str:
+    """Collect streamed (SSE) content and stop as soon as the top-level JSON object closes.
+    `t0` is the monotonic time the request was sent (for time-to-first-token)."""
+    ttft = None
+    parts = []
+    state = {"depth": 0, "in_str": False, "esc": False}
+    early = False
+    try:
+        # chunk_size=None: hand over data as soon as it arrives instead of filling 512-byte blocks
+        for line in r.iter_lines(chunk_size=None, decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            choices = chunk.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content") or ""
+            if not delta:
+                continue
+            if ttft is None:
+                ttft = time.monotonic() - t0
+            end = _object_end(delta, state)
+            if end != -1:
+                parts.append(delta[:end])
+                early = True
+                break
+            parts.append(delta)
+    finally:
+        r.close()  # drops the connection when we stop early; remaining tokens are not read
+    total = time.monotonic() - t0
+    with _req_lock:
+        _stats["streamed"] += 1
+        _stats["early_stops"] += int(early)
+        _stats["ttft_ms"] += int((ttft or total) * 1000)
+        _stats["stream_ms"] += int(total * 1000)
+    _sprint(f"[gpt] <- stream req#{req_no} ttft={(ttft or total) * 1000:.0f}ms total={total * 1000:.0f}ms"
+            + (" (closed at end of JSON)" if early else ""))
+    return "".join(parts)
+
+
+def _complete(system_prompt: str, user_prompt: str, packed: bool) -> str:
+    """One chat completion; returns the raw reply text."""
+    headers = _auth_headers()
+    req_no = _next_req_no()
+    # ---- PRE-LOG ----
+    _sprint(f"[gpt] -> POST {OPENAI_BASE_URL.rstrip('/')}/chat/completions model={OPENAI_MODEL} req#{req_no}")
+
+    payload = build_chat_payload(system_prompt, user_prompt, packed)
     url = f"{OPENAI_BASE_URL.rstrip('/')}/chat/completions"
 
     try:
-        r = requests.post(url, headers=headers, json=payload, timeout=90)
-        r.raise_for_status()
-        data = r.json()
-        content = data["choices"][0]["message"]["content"]
+        if LLM_STREAM:
+            payload["stream"] = True
+            t0 = time.monotonic()
+            r = _request_with_retry("POST", url, headers, req_no, json=payload, stream=True)
+            content = _read_stream(r, req_no, t0)
+        else:
+            r = _request_with_retry("POST", url, headers, req_no, json=payload)
+            data = r.json()
+            content = data["choices"][0]["message"]["content"]
         # ---- POST-LOG ----
-        _sprint(f"[gpt] <- OK req#{_req_counter['n']} len={len(content)}")
-
-        return coerce_json(content) or {}
+        _sprint(f"[gpt] <- OK req#{req_no} len={len(content)}")
+        return content
     except requests.HTTPError as e:
         # Log server reply body for easier diagnosis
         body = getattr(e.response, "text", "") if hasattr(e, "response") else ""
-        _sprint(f"[gpt] !! HTTP {getattr(e.response,'status_code',None)} req#{_req_counter['n']} body={body[:500]}")
+        _sprint(f"[gpt] !! HTTP {getattr(e.response,'status_code',None)} req#{req_no} body={body[:500]}")
+        if schema_rejected(getattr(e.response, "status_code", None), body):
+            return _complete(system_prompt, user_prompt, packed)
         raise
     except Exception as e:
-        _sprint(f"[gpt] !! ERROR req#{_req_counter['n']} {e}")
+        _sprint(f"[gpt] !! ERROR req#{req_no} {e}")
         raise
+
+
+def call_gpt_with_prompts(system_prompt: str, user_prompt: str, packed: bool = False) -> Dict[str, Any]:
+    """Send prepared prompts to LLM and return the parsed, schema-checked JSON.
+
+    Broken replies are repaired locally; only when that fails the model gets a short
+    correction prompt (up to LLM_REASK times). Raises ValueError if the reply stays unusable.
+    """
+    content = _complete(system_prompt, user_prompt, packed)
+    obj, status, problems = parse_reply(content, packed)
+    reasks = 0
+    while status == "invalid" and reasks < LLM_REASK:
+        reasks += 1
+        _sprint(f"[gpt] .. reply does not match the schema ({problems[0]}); re-asking {reasks}/{LLM_REASK}")
+        content = _complete(*correction_prompts(content, problems, system_prompt, user_prompt, packed), packed)
+        obj, status, problems = parse_reply(content, packed)
+        if status != "invalid":
+            status = "reasked"
+    if status == "repaired":
+        _sprint("[gpt] .. reply repaired locally")
+    record("failed" if status == "invalid" else status)
+    if obj is None:
+        raise ValueError("LLM reply does not match the schema: " + "; ".join(problems[:3]))
+    return obj
@@ -57,9 +57,12 @@ FIELDS = [
     ("MAX_EMAILS", "Max. počet e-mailů na běh", "entry", {"default": "200"}),
     ("OUTLOOK_FOLDER", "Složka Outlooku (např. Inbox/Subfolder)", "entry", {"default": "Inbox"}),
     ("STATUS", "Stav přečtení", "combo", {"values": ["all", "unread", "read"], "default": "all"}),
+    ("SYNC_MODE", "Načítání (incremental = jen nové od minula, full = celé období)", "combo",
+     {"values": ["incremental", "full"], "default": "incremental"}),
     # Output
     ("OUTPUT_DIR", "Složka pro uložení", "dir_browse", {"default": ""}),
     ("OUTPUT_NAME", "Název souboru (bez .xlsx)", "entry", {"default": "outlook_analysis"}),
+    ("OUTPUT_FORMAT", "Formát výstupu", "combo", {"values": ["xlsx", "csv", "jsonl", "parquet"], "default": "xlsx"}),
 
     # template support
     ("TEMPLATE_XLSX", "Template XLSX", "entry_browse", {"default": ""}),
@@ -69,6 +72,7 @@ FIELDS = [
     # NEW: behavior flags
     ("FETCH_SENT_TOO", "Fetch Sent Items", "combo", {"values": ["true", "false"], "default": "true"}),
     ("DEBUG_GPT", "Debug GPT logs", "combo", {"values": ["true", "false"], "default": "false"}),
+    ("LLM_CONCURRENCY", "Paralelní požadavky na GPT", "entry", {"default": "4"}),
 
 
 ]
@@ -294,10 +298,30 @@ class EnvRunner(tk.Tk):
             self._log(f"[error] uložení .env selhalo: {e}\n")
             return False
 
+    def _unfinished_journal(self) -> str:
+        """Path of the run journal left by an interrupted run, or ""."""
+        data = dotenv_values(ENV_PATH) if os.path.exists(ENV_PATH) else {}
+        if (data.get("RUN_JOURNAL") or "true").lower() != "true":
+            return ""
+        path = (data.get("RUN_JOURNAL_PATH") or "").strip() or os.path.join(os.path.dirname(ENV_PATH), "run_journal.jsonl")
+        return path if os.path.exists(path) and os.path.getsize(path) else ""
+
     def save_and_run_interactive(self):
         if not self.save_env():
             return
-        self._run_main(args=[], new_console=True)
+        args = []
+        journal = self._unfinished_journal()
+        if journal:
+            answer = messagebox.askyesnocancel(
+                "Nedokončený běh",
+                f"Předchozí běh nebyl dokončen ({journal}).\n"
+                "Pokračovat v něm (již zpracované konverzace se znovu neposílají do GPT)?\n\n"
+                "Ne = začít znovu, hotové řádky se zahodí.")
+            if answer is None:
+                return
+            if answer:
+                args = ["--resume"]
+        self._run_main(args=args, new_console=True)
 
     def _run_main(self, args, new_console=False):
         if self.proc and self.proc.poll() is None:
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+from config import LLM_CACHE, LLM_CACHE_PATH, LLM_CACHE_MAX_AGE_DAYS, LLM_CACHE_MAX_ENTRIES
+
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0}
+
+
+def cache_key(model: str, system_prompt: str, user_prompt: str) -> str:
+    """Content address of one request: sha256 over model + both prompts."""
+    h = hashlib.sha256()
+    for part in (model, system_prompt, user_prompt):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _db() -> Optional[sqlite3.Connection]:
+    global _conn
+    if not LLM_CACHE:
+        return None
+    if _conn is None:
+        try:
+            os.makedirs(os.path.dirname(LLM_CACHE_PATH) or ".", exist_ok=True)
+            conn = sqlite3.connect(LLM_CACHE_PATH, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, value TEXT,"
+                " created REAL, last_used REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses(last_used)")
+            conn.commit()
+            _conn = conn
+        except Exception as e:
+            print(f"[warn] LLM cache disabled ({LLM_CACHE_PATH}): {e}")
+            return None
+    return _conn
+
+
+def cache_get(model: str, system_prompt: str, user_prompt: str) -> Optional[Dict[str, Any]]:
+    """Return a cached parsed response or None."""
+    key = cache_key(model, system_prompt, user_prompt)
+    with _lock:
+        conn = _db()
+        if conn is None:
+            return None
+        row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (LLM_CACHE_MAX_AGE_DAYS > 0 and now - row[1] > LLM_CACHE_MAX_AGE_DAYS * 86400):
+            _stats["misses"] += 1
+            return None
+        conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        conn.commit()
+        _stats["hits"] += 1
+    return json.loads(row[0])
+
+
+def cache_put(model: str, system_prompt: str, user_prompt: str, obj: Dict[str, Any]) -> None:
+    """Store a parsed response. Empty results are not cached so they get retried next run."""
+    if not obj:
+        return
+    key = cache_key(model, system_prompt, user_prompt)
+    with _lock:
+        conn = _db()
+        if conn is None:
+            return
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, value, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, model, json.dumps(obj, ensure_ascii=False), now, now),
+        )
+        conn.commit()
+        _stats["stores"] += 1
+
+
+def cache_evict() -> int:
+    """Drop entries older than LLM_CACHE_MAX_AGE_DAYS, then the least recently used above LLM_CACHE_MAX_ENTRIES."""
+    with _lock:
+        conn = _db()
+        if conn is None:
+            return 0
+        removed = 0
+        if LLM_CACHE_MAX_AGE_DAYS > 0:
+            cur = conn.execute("DELETE FROM responses WHERE created < ?",
+                               (time.time() - LLM_CACHE_MAX_AGE_DAYS * 86400,))
+            removed += cur.rowcount
+        if LLM_CACHE_MAX_ENTRIES > 0:
+            (count,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > LLM_CACHE_MAX_ENTRIES:
+                cur = conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                    (count - LLM_CACHE_MAX_ENTRIES,),
+                )
+                removed += cur.rowcount
+        conn.commit()
+        return removed
+
+
+def cache_stats() -> Dict[str, int]:
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,148 @@
+"""
+Structured output for the contact schema.
+- response_format: strict json_schema built from SCHEMA_KEYS_OSOBA (single and packed
+  replies), or plain json_object for backends without structured outputs
+- parse_reply: validate a reply against the schema, repairing it locally when possible
+  (broken JSON via utils.repair_json, missing keys, non-string values)
+- correction_prompts: a short re-ask that sends the broken reply back without the email
+  (the full request is repeated only when the reply holds no JSON at all)
+
+Outcomes are counted per run: valid / repaired / re-asked / failed.
+"""
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import LLM_RESPONSE_FORMAT
+from prompts import SCHEMA_KEYS_OSOBA
+from utils import repair_json
+
+_stats = {"valid": 0, "repaired": 0, "reasked": 0, "failed": 0}
+_lock = threading.Lock()
+_schema_supported = {"on": LLM_RESPONSE_FORMAT == "json_schema"}
+
+
+def _person_schema(with_index: bool) -> Dict[str, Any]:
+    props: Dict[str, Any] = {"index": {"type": "integer"}} if with_index else {}
+    props.update({k: {"type": "string"} for k in SCHEMA_KEYS_OSOBA})
+    return {"type": "object", "properties": props, "required": list(props), "additionalProperties": False}
+
+
+def response_format(packed: bool = False) -> Dict[str, Any]:
+    """response_format for /chat/completions: json_schema while the backend accepts it."""
+    if not _schema_supported["on"]:
+        return {"type": "json_object"}
+    if packed:
+        schema = {
+            "type": "object",
+            "properties": {"results": {"type": "array", "items": _person_schema(True)}},
+            "required": ["results"],
+            "additionalProperties": False,
+        }
+    else:
+        schema = _person_schema(False)
+    return {"type": "json_schema",
+            "json_schema": {"name": "contacts" if packed else "contact", "strict": True, "schema": schema}}
+
+
+def schema_rejected(status_code: Optional[int], body: str) -> bool:
+    """True (and json_schema switched off for the rest of the run) when a 400 reply says the
+    backend does not support structured outputs."""
+    if not _schema_supported["on"] or status_code not in (400, 422):
+        return False
+    low = (body or "").lower()
+    if "json_schema" not in low and "response_format" not in low:
+        return False
+    _schema_supported["on"] = False
+    print("[warn] Backend rejected json_schema response_format; using json_object for this run")
+    return True
+
+
+def _person_problems(obj: Any, with_index: bool) -> List[str]:
+    if not isinstance(obj, dict):
+        return ["not a JSON object"]
+    problems = []
+    if with_index and not isinstance(obj.get("index"), int):
+        problems.append("index is not an integer")
+    for k in SCHEMA_KEYS_OSOBA:
+        if k not in obj:
+            problems.append(f"missing key {k}")
+        elif not isinstance(obj[k], str):
+            problems.append(f"{k} is not a string")
+    return problems
+
+
+def validate(obj: Any, packed: bool = False) -> List[str]:
+    """Schema violations of a parsed reply (empty list = valid)."""
+    if not packed:
+        return _person_problems(obj, False)
+    items = obj.get("results") if isinstance(obj, dict) else None
+    if not isinstance(items, list):
+        return ["no results array"]
+    return [f"results[{i}]: {p}" for i, item in enumerate(items) for p in _person_problems(item, True)]
+
+
+def _fix_person(obj: Any) -> Optional[Dict[str, Any]]:
+    """Missing keys -> "", scalars -> str. None when the object has no schema key or nested values."""
+    if not isinstance(obj, dict) or not any(k in obj for k in SCHEMA_KEYS_OSOBA):
+        return None
+    fixed = dict(obj)
+    for k in SCHEMA_KEYS_OSOBA:
+        v = fixed.get(k)
+        if v is None:
+            fixed[k] = ""
+        elif isinstance(v, (int, float)):
+            fixed[k] = str(v)
+        elif not isinstance(v, str):
+            return None
+    return fixed
+
+
+def _fix(obj: Any, packed: bool) -> Optional[Dict[str, Any]]:
+    if not packed:
+        return _fix_person(obj)
+    items = obj.get("results") if isinstance(obj, dict) else None
+    if not isinstance(items, list):
+        return None
+    # unusable entries are dropped; the caller retries their emails one by one
+    fixed = [f for f in (_fix_person(item) for item in items) if f is not None]
+    return {"results": fixed} if fixed else None
+
+
+def parse_reply(content: str, packed: bool = False) -> Tuple[Optional[Dict[str, Any]], str, List[str]]:
+    """(object, status, problems) for a model reply; status is valid, repaired or invalid."""
+    obj, syntax_fixed = repair_json(content)
+    if obj is None:
+        return None, "invalid", ["reply is not parseable JSON"]
+    problems = validate(obj, packed)
+    if not problems:
+        return obj, ("repaired" if syntax_fixed else "valid"), []
+    fixed = _fix(obj, packed)
+    if fixed is None:
+        return None, "invalid", problems
+    return fixed, "repaired", []
+
+
+def correction_prompts(content: str, problems: List[str], system_prompt: str, user_prompt: str,
+                       packed: bool = False) -> Tuple[str, str]:
+    """Re-ask prompts. A reply that holds JSON goes back alone with what is wrong with it
+    (the email is not sent again); a reply without any JSON needs the original request."""
+    if "{" not in (content or ""):
+        return system_prompt, user_prompt + "\n\nReturn only the JSON object described above, no other text."
+    keys = ", ".join(SCHEMA_KEYS_OSOBA)
+    shape = (f'{{"results": [{{"index": <int>, {keys}}}]}}' if packed else f"{{{keys}}}")
+    fix_system = (
+        "You fix malformed JSON. Return only the corrected JSON, nothing else.\n"
+        f"Required structure (all values strings, \"\" when unknown): {shape}\n"
+        "Keep every value from the input; do not invent data."
+    )
+    return fix_system, "Problems: " + "; ".join(problems[:10]) + "\n\nJSON to fix:\n" + content[:8000]
+
+
+def record(status: str) -> None:
+    with _lock:
+        _stats[status] += 1
+
+
+def schema_stats() -> Dict[str, int]:
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,153 @@
+"""
+Rule-based contact extraction from headers + signature (no LLM).
+Fills the SCHEMA_KEYS_OSOBA fields that can be read deterministically
+and returns a confidence score; main only calls the model when the score
+is below LOCAL_EXTRACT_MIN_CONFIDENCE or a PoznamkaKOsobe summary is wanted.
+"""
+import re
+from typing import Dict, List, Tuple
+
+from config import MY_EMAILS, MY_NAMES
+from models import EmailItem
+from prompts import SCHEMA_KEYS_OSOBA
+
+TITLES_BEFORE = [
+    "Ing. arch.", "Ing.", "Mgr. art.", "Mgr.", "Bc.", "BcA.", "MgA.", "MUDr.", "MVDr.", "MDDr.",
+    "JUDr.", "PhDr.", "RNDr.", "PharmDr.", "PaedDr.", "ThDr.", "ThLic.", "doc.", "prof.", "Dr.", "Dipl.-Ing.",
+]
+TITLES_AFTER = ["Ph.D.", "PhD.", "PhD", "CSc.", "DrSc.", "DiS.", "MBA", "LL.M.", "MSc.", "BBA", "DBA", "MPA"]
+
+ROLE_WORDS = [
+    "jednatel", "ředitel", "reditel", "vedoucí", "vedouci", "manažer", "manazer", "obchodní", "obchodni",
+    "zástupce", "zastupce", "referent", "specialist", "konzultant", "asistent", "účetní", "ucetni",
+    "nákup", "nakup", "prodej", "majitel", "předseda", "predseda", "technik", "koordinátor", "koordinator",
+    "manager", "director", "head of", "ceo", "cfo", "cto", "coo", "owner", "founder", "sales",
+    "account", "consultant", "assistant", "engineer", "officer", "purchasing", "procurement",
+    "geschäftsführer", "leiter", "директор", "менеджер", "руководитель",
+]
+COMPANY_MARKERS = [
+    "s.r.o.", "spol. s r.o.", "a.s.", "k.s.", "v.o.s.", "z.s.", "o.p.s.", "s.p.",
+    "GmbH", "AG", "Ltd", "Ltd.", "Inc.", "LLC", "B.V.", "S.A.", "sp. z o.o.", "SE", "ООО",
+]
+
+_rx_email = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_rx_phone = re.compile(r"(?<![\w+])(\+|00)?\d[\d ()/.-]{7,}\d(?!\w)")
+_rx_url = re.compile(r"\b(?:https?://)?(?:www\.)[\w-]+(?:\.[\w-]+)+(?:/[^\s<>\"]*)?|\bhttps?://[\w-]+(?:\.[\w-]+)+(?:/[^\s<>\"]*)?", re.I)
+_rx_sender = re.compile(r"^\s*(.*?)\s*<([^>]*)>\s*$")
+_rx_role = re.compile(r"(?<!\w)(?:" + "|".join(re.escape(w) for w in ROLE_WORDS) + r")(?!\w)", re.I)
+_rx_company = re.compile(
+    r"(?<!\w)(?:" + "|".join(re.escape(m) for m in sorted(COMPANY_MARKERS, key=len, reverse=True)) + r")(?!\w)"
+)
+_rx_title_before = re.compile(
+    r"^(?:" + "|".join(re.escape(t) for t in sorted(TITLES_BEFORE, key=len, reverse=True)) + r")(?=\s|$)", re.I
+)
+_rx_title_after = re.compile(
+    r",?\s*(?:" + "|".join(re.escape(t) for t in sorted(TITLES_AFTER, key=len, reverse=True)) + r")\s*$", re.I
+)
+
+# Confidence weights per field (sum = 1.0)
+_WEIGHTS = {"Email": 0.3, "name": 0.3, "Tel1": 0.15, "NazevKlienta": 0.15, "WWW": 0.05, "Funkce": 0.05}
+
+
+def _split_titles(name: str) -> Tuple[str, str, str]:
+    """'Ing. Jan Novák, Ph.D.' -> ('Ing.', 'Jan Novák', 'Ph.D.')"""
+    before: List[str] = []
+    after: List[str] = []
+    s = name.strip()
+    while True:
+        m = _rx_title_before.match(s)
+        if not m:
+            break
+        before.append(s[:m.end()])
+        s = s[m.end():].strip()
+    while True:
+        m = _rx_title_after.search(s)
+        if not m or m.start() == 0:
+            break
+        after.insert(0, s[m.start():].strip(" ,"))
+        s = s[:m.start()].strip(" ,")
+    return " ".join(before), s, " ".join(after)
+
+
+def _is_me(email: str = "", name: str = "") -> bool:
+    if email and email.lower() in MY_EMAILS:
+        return True
+    n = " ".join(name.lower().split())
+    return bool(n) and any(n == m or sorted(n.split()) == sorted(m.split()) for m in MY_NAMES)
+
+
+def _parse_person(display: str, sig_lines: List[str]) -> Dict[str, str]:
+    """Name + titles from the sender display name, ordered/enriched by the signature."""
+    out = {"Jmeno": "", "Prijmeni": "", "TitulPred": "", "TitulZa": ""}
+    if not display or "@" in display:
+        return out
+    if "," in display and not _rx_title_after.search(display):
+        last, first = [p.strip() for p in display.split(",", 1)]  # "Novák, Jan"
+        parts = [first, last]
+    else:
+        tb, core, ta = _split_titles(display)
+        out["TitulPred"], out["TitulZa"] = tb, ta
+        parts = core.split()
+    if len(parts) != 2:
+        return out
+    first, last = parts
+    # Outlook often shows "Surname Name"; the signature usually has "Name Surname"
+    for ln in sig_lines:
+        low = ln.lower()
+        i, j = low.find(first.lower()), low.find(last.lower())
+        if i != -1 and j != -1:
+            if j < i:
+                first, last = last, first
+            tb, _, ta = _split_titles(ln)
+            out["TitulPred"] = out["TitulPred"] or tb
+            out["TitulZa"] = out["TitulZa"] or ta
+            break
+    out["Jmeno"], out["Prijmeni"] = first, last
+    return out
+
+
+def extract_contact_locally(em: EmailItem) -> Tuple[Dict[str, str], float]:
+    """Return (row with SCHEMA_KEYS_OSOBA, confidence 0..1) from headers and signature only."""
+    row = {k: "" for k in SCHEMA_KEYS_OSOBA}
+    if not em.is_incoming:
+        return row, 0.0  # counterpart of an outgoing mail needs the model
+    m = _rx_sender.match(em.sender or "")
+    display, sender_email = (m.group(1), m.group(2).strip()) if m else ("", (em.sender or "").strip())
+    if _is_me(sender_email, display):
+        return row, 0.0
+
+    sig = em.signature_text or ""
+    sig_lines = [ln.strip() for ln in sig.splitlines() if ln.strip()]
+
+    emails = [e for e in _rx_email.findall(sig) if not _is_me(e)]
+    row["Email"] = sender_email if "@" in sender_email else (emails[0] if emails else "")
+
+    for pm in _rx_phone.finditer(sig):
+        digits = re.sub(r"\D", "", pm.group(0))
+        if 9 <= len(digits) <= 15:
+            row["Tel1"] = " ".join(pm.group(0).split())
+            break
+
+    for um in _rx_url.finditer(sig):
+        url = um.group(0).rstrip(".,;)")
+        if not _rx_email.search(url):
+            row["WWW"] = url
+            break
+
+    for ln in sig_lines:
+        if _rx_company.search(ln):
+            if not row["NazevKlienta"] and len(ln) <= 80:
+                row["NazevKlienta"] = ln.strip(" ,|")
+            continue  # a company line is not a role
+        # digits: street address ("Obchodní 12") or phone line, not a role
+        if (not row["Funkce"] and _rx_role.search(ln) and len(ln) <= 60
+                and not _rx_email.search(ln) and not any(ch.isdigit() for ch in ln)):
+            row["Funkce"] = ln.strip(" ,|")
+
+    row.update({k: v for k, v in _parse_person(display, sig_lines).items() if v})
+
+    score = 0.0
+    for field, w in _WEIGHTS.items():
+        filled = (row["Jmeno"] and row["Prijmeni"]) if field == "name" else row[field]
+        score += w if filled else 0.0
+    return row, round(score, 2)
@@ -0,0 +1,303 @@
+"""
+Mail sources producing header-only EmailItem records with body loaders.
+
+- OutlookSource: the Outlook COM reader (outlook_io), Inbox + matching Sent Items
+- EmlDirSource:  a directory tree of .eml files (and .msg with the optional
+                 extract-msg package)
+- MboxSource:    mbox archives, memory-mapped and scanned one message at a time
+
+All sources honour the same date window, status and watermark filters; the
+MAX_EMAILS cap and conversation selection are applied by the caller.
+Offline archives have no Sent folder: direction comes from the sender as usual.
+"""
+import os
+import mmap
+import email.utils
+import datetime as dt
+from contextlib import nullcontext
+from email import policy
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+from email.policy import Compat32
+from typing import Dict, Iterator, List, Optional, Set
+
+from config import MAIL_SOURCE, MAIL_SOURCE_PATH, OUTLOOK_FOLDER_DEFAULT, FETCH_SENT_TOO
+from models import EmailItem
+from outlook_io import RawItem, iter_inbox_and_sent_headers, com_apartment
+from utils import to_naive_local
+
+
+class MailSource:
+    """Interface of a mail source."""
+    name = "?"
+
+    def iter_headers(self, date_from: dt.datetime, date_to: Optional[dt.datetime], status: str,
+                     watermarks: Optional[Dict[str, dt.datetime]] = None,
+                     known_conv_ids: Optional[Set[str]] = None, max_emails: int = 0) -> Iterator[RawItem]:
+        """Stream (header-only EmailItem, body loader) in the window; no body is read here.
+        `max_emails` lets a source that reads newest-first stop early (the caller still caps)."""
+        raise NotImplementedError
+
+    def thread_context(self):
+        """Context needed to read this source from a worker thread."""
+        return nullcontext()
+
+
+class OutlookSource(MailSource):
+    def __init__(self, folder_path: str, fetch_sent_too: bool):
+        self.folder_path = folder_path
+        self.fetch_sent_too = fetch_sent_too
+        self.name = "Outlook " + (folder_path or "Inbox") + ("+Sent" if fetch_sent_too else "")
+
+    def iter_headers(self, date_from, date_to, status, watermarks=None, known_conv_ids=None, max_emails=0):
+        return iter_inbox_and_sent_headers(date_from, date_to, status, self.folder_path,
+                                           self.fetch_sent_too, watermarks, known_conv_ids, max_emails)
+
+    def thread_context(self):
+        return com_apartment()
+
+
+# ---- shared helpers for offline archives ----
+
+class _RawHeaders(Compat32):
+    """compat32 returning header values as parsed: raw 8-bit bytes stay surrogate-escaped
+    (compat32 would wrap them in an unknown-8bit Header that prints as U+FFFD)."""
+    def header_fetch_parse(self, name, value):
+        return value
+
+
+_parser = BytesParser(policy=policy.default)          # full messages (bodies)
+_hdr_parser = BytesParser(policy=_RawHeaders())       # header scan: plain strings, much faster
+
+def _hdr(msg, name: str) -> str:
+    """Header value with RFC 2047 encoded words decoded; raw 8-bit headers are read as UTF-8."""
+    value = msg.get(name)
+    if value is None:
+        return ""
+    value = str(value)
+    if not value.isascii():
+        value = value.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+    if "=?" not in value:
+        return value
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+def _in_window(received: dt.datetime, date_from: dt.datetime, date_to: Optional[dt.datetime],
+               wm: Optional[dt.datetime]) -> bool:
+    if received < date_from or (wm and received <= wm):
+        return False
+    if date_to and received > date_to.replace(hour=23, minute=59, second=59, microsecond=0):
+        return False
+    return True
+
+def _is_unread(msg) -> bool:
+    """Read flag from mbox Status/X-Status or Thunderbird X-Mozilla-Status; no flag counts as read."""
+    flags = f"{msg.get('Status', '')}{msg.get('X-Status', '')}"
+    if "R" in flags:
+        return False
+    moz = str(msg.get("X-Mozilla-Status", "") or "").strip()
+    if moz:
+        try:
+            return not int(moz, 16) & 0x0001
+        except ValueError:
+            pass
+    return bool(flags.strip())
+
+def _status_ok(msg, status: str) -> bool:
+    if status == "unread":
+        return _is_unread(msg)
+    if status == "read":
+        return not _is_unread(msg)
+    return True
+
+def _thread_key(msg) -> str:
+    """Conversation key: root of References, else In-Reply-To, else the own Message-ID."""
+    refs = _hdr(msg, "References").split()
+    for value in (refs[0] if refs else "", msg.get("In-Reply-To", ""), msg.get("Message-ID", "")):
+        value = str(value or "").strip().strip("<>")
+        if value:
+            return value
+    return ""
+
+def _header_date(msg) -> Optional[dt.datetime]:
+    try:
+        return to_naive_local(email.utils.parsedate_to_datetime(_hdr(msg, "Date")))
+    except Exception:
+        return None
+
+def _email_item(msg, received: dt.datetime, entry_id: str, folder_path: str) -> EmailItem:
+    name, addr = email.utils.parseaddr(_hdr(msg, "From"))
+    return EmailItem(
+        received=received, subject=_hdr(msg, "Subject"), sender=f"{name} <{addr}>",
+        to_recipients=_hdr(msg, "To"), cc_recipients=_hdr(msg, "Cc"),
+        body_text="", conversation_id=_thread_key(msg),
+        entry_id=entry_id, signature_text="", folder_path=folder_path,
+    )
+
+def _body_from_bytes(data: bytes) -> str:
+    """HTML part when present, else plain text (same preference as the Outlook reader)."""
+    msg = _parser.parsebytes(data)
+    part = msg.get_body(preferencelist=("html", "plain"))
+    return part.get_content() if part is not None else ""
+
+def _body_from_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return _body_from_bytes(f.read())
+
+
+class EmlDirSource(MailSource):
+    def __init__(self, path: str):
+        self.path = path
+        self.name = f"eml dir {path}"
+
+    def _files(self) -> List[str]:
+        out = []
+        for root, dirs, files in os.walk(self.path):
+            dirs.sort()
+            out.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith((".eml", ".msg")))
+        return out
+
+    def iter_headers(self, date_from, date_to, status, watermarks=None, known_conv_ids=None, max_emails=0):
+        wm = (watermarks or {}).get(self.path)
+        warned_msg = False
+        for path in self._files():
+            try:
+                if path.lower().endswith(".msg"):
+                    raw = _read_msg_headers(path)
+                    if raw is None:
+                        if not warned_msg:
+                            print("[warn] .msg files skipped: pip install extract-msg to read them")
+                            warned_msg = True
+                        continue
+                    em, unread, load_body = raw
+                    if (status == "unread" and not unread) or (status == "read" and unread):
+                        continue
+                else:
+                    with open(path, "rb") as f:
+                        msg = _hdr_parser.parse(f, headersonly=True)
+                    if not _status_ok(msg, status):
+                        continue
+                    received = _header_date(msg) or dt.datetime.fromtimestamp(os.path.getmtime(path))
+                    em = _email_item(msg, received, path, self.path)
+                    load_body = lambda p=path: _body_from_file(p)
+            except Exception as e:
+                print(f"[skip] Failed reading {path}: {e}")
+                continue
+            em.folder_path = self.path
+            if _in_window(em.received, date_from, date_to, wm):
+                yield em, load_body
+
+
+def _read_msg_headers(path: str):
+    """Headers of an Outlook .msg via the optional extract_msg package; None when unavailable."""
+    try:
+        import extract_msg
+    except ImportError:
+        return None
+    m = extract_msg.Message(path)
+    try:
+        hdr = m.header
+        received = m.date if isinstance(m.date, dt.datetime) else None
+        if received is None and hdr is not None:
+            received = _header_date(hdr)
+        received = to_naive_local(received) if received else dt.datetime.fromtimestamp(os.path.getmtime(path))
+        em = EmailItem(
+            received=received, subject=str(m.subject or ""), sender=str(m.sender or ""),
+            to_recipients=str(m.to or ""), cc_recipients=str(m.cc or ""),
+            body_text="", conversation_id=_thread_key(hdr) if hdr is not None else "",
+            entry_id=path, signature_text="",
+        )
+        unread = bool(getattr(m, "isRead", True) is False)
+    finally:
+        m.close()
+
+    def load_body() -> str:
+        m = extract_msg.Message(path)
+        try:
+            html = m.htmlBody or b""
+            html = html.decode("utf-8", "replace") if isinstance(html, bytes) else str(html)
+            plain = str(m.body or "")
+            return html if len(html) > len(plain) else plain
+        finally:
+            m.close()
+    return em, unread, load_body
+
+
+class MboxSource(MailSource):
+    def __init__(self, path: str):
+        self.path = path
+        self.name = f"mbox {path}"
+
+    def _files(self) -> List[str]:
+        if os.path.isdir(self.path):
+            return [os.path.join(self.path, f) for f in sorted(os.listdir(self.path))
+                    if os.path.isfile(os.path.join(self.path, f)) and not f.lower().endswith(".msf")]
+        return [self.path]
+
+    def iter_headers(self, date_from, date_to, status, watermarks=None, known_conv_ids=None, max_emails=0):
+        for path in self._files():
+            yield from self._iter_file(path, date_from, date_to, status, (watermarks or {}).get(path))
+
+    def _iter_file(self, path, date_from, date_to, status, wm) -> Iterator[RawItem]:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # The map stays open while body loaders may still need it (closed when collected)
+        count = 0
+        start = 0 if mm[:5] == b"From " else mm.find(b"\nFrom ") + 1
+        while start >= 0 and (start > 0 or mm[:5] == b"From "):
+            nxt = mm.find(b"\nFrom ", start)
+            end = len(mm) if nxt == -1 else nxt + 1
+            raw = self._headers(mm, path, start, end, date_from, date_to, status, wm)
+            if raw is not None:
+                count += 1
+                yield raw
+            start = -1 if nxt == -1 else end
+        print(f"[i] {path}: {count} message(s) in window")
+
+    def _headers(self, mm, path, start, end, date_from, date_to, status, wm) -> Optional[RawItem]:
+        line_end = mm.find(b"\n", start, end)
+        if line_end == -1:
+            return None
+        body_start = line_end + 1
+        ends = [i for i in (mm.find(b"\n\n", body_start, end), mm.find(b"\n\r\n", body_start, end)) if i != -1]
+        hdr_end = min(ends) if ends else end
+        try:
+            msg = _hdr_parser.parsebytes(mm[body_start:hdr_end + 1], headersonly=True)
+            if not _status_ok(msg, status):
+                return None
+            received = _header_date(msg) or _from_line_date(mm[start:line_end])
+            if received is None or not _in_window(received, date_from, date_to, wm):
+                return None
+            em = _email_item(msg, received, f"{path}:{start}", path)
+        except Exception as e:
+            print(f"[skip] Failed reading {path} at {start}: {e}")
+            return None
+
+        def load_body() -> str:
+            # mboxrd: body lines starting with ">From " were escaped on write
+            return _body_from_bytes(mm[body_start:end].replace(b"\n>From ", b"\nFrom "))
+        return em, load_body
+
+
+def _from_line_date(line: bytes) -> Optional[dt.datetime]:
+    """Date of an mbox separator line: 'From sender Thu Oct 17 10:00:00 2026'."""
+    parts = line.decode("ascii", "replace").split()
+    try:
+        return dt.datetime.strptime(" ".join(parts[-5:]), "%a %b %d %H:%M:%S %Y")
+    except ValueError:
+        return None
+
+
+def get_mail_source() -> MailSource:
+    """Source selected by MAIL_SOURCE (outlook|eml|mbox) and MAIL_SOURCE_PATH."""
+    if MAIL_SOURCE == "eml":
+        return EmlDirSource(MAIL_SOURCE_PATH)
+    if MAIL_SOURCE == "mbox":
+        return MboxSource(MAIL_SOURCE_PATH)
+    if MAIL_SOURCE != "outlook":
+        print(f"[warn] Unknown MAIL_SOURCE '{MAIL_SOURCE}'; using Outlook.")
+    return OutlookSource(OUTLOOK_FOLDER_DEFAULT, FETCH_SENT_TOO)
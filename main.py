@@ -3,34 +3,62 @@
 """
 Entry point.
 - Load config
-- Fetch Outlook emails
+- Fetch email headers (Outlook, or an .eml/mbox archive via MAIL_SOURCE)
 - Post-filter by date and cap
 - Build conversations
 - Keep latest OUT message per conversation (configurable)
+- Load and parse bodies of the selected messages only
 - Call LLM with single prompt schema (contact + inline summary)
-- Export to Excel/template
+  (PIPELINE_MODE=async: LLM calls start while Outlook is still being read)
+  (--batch: submit all prompts through the Batch API instead, resumable)
+- Incremental: only mail newer than the last run per folder, conversations whose
+  latest message was already extracted are skipped (--full: ignore sync state)
+- Journal every finished row (--resume: reuse them after an interrupted run)
+- Merge contacts into the cross-run contact store (new/changed/known)
+- Export to Excel/template (EXPORT_MODE=master: append/update one master workbook);
+  OUTPUT_FORMAT=csv/jsonl/parquet: rows are streamed to the file as they finish
 """
 import sys, io
 import os
+import threading
 import datetime as dt
 from collections import defaultdict
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Tuple, Optional
 
-import pandas as pd
 from dotenv import load_dotenv
 
 from config import (
-    OUTPUT_DIR, OUTPUT_NAME, STRICT_SCHEMA,
-    TEMPLATE_XLSX, TEMPLATE_SHEET, TEMPLATE_START_AT_R3,
+    OUTPUT_DIR, OUTPUT_NAME, OUTPUT_FORMAT, STRICT_SCHEMA,
+    TEMPLATE_XLSX, TEMPLATE_SHEET, TEMPLATE_START_AT_R3, EXPORT_MODE, MASTER_XLSX,
     DATE_FROM_ENV, DATE_TO_ENV, DAYS_BACK_DEFAULT, MAX_EMAILS_DEFAULT,
-    OUTLOOK_FOLDER_DEFAULT, STATUS_DEFAULT, MY_EMAILS, ENV_FILE, FETCH_SENT_TOO
+    STATUS_DEFAULT, MY_EMAILS, ENV_FILE,
+    LLM_CONCURRENCY, OPENAI_MODEL, LLM_PACK_SIZE, LLM_PACK_MAX_CHARS, LLM_INPUT_TOKEN_BUDGET,
+    LOCAL_EXTRACT, LOCAL_EXTRACT_MIN_CONFIDENCE, PIPELINE_MODE, CONTACT_STORE, CONTACT_EXPORT, SYNC_MODE,
+    RUN_RESUME
 )
 from models import EmailItem
-from utils import to_naive_local, coerce_to_schema, is_incoming_email, resolve_template_path
-from outlook_io import fetch_inbox_and_sent
-from template_export import export_rows_to_template
-from gpt_client import call_gpt_with_prompts
-from prompts import SCHEMA_KEYS_OSOBA, make_prompts_for_message
+from utils import (
+    to_naive_local, coerce_to_schema, is_incoming_email, resolve_template_path, split_packed_results,
+    conversation_key
+)
+from outlook_io import load_bodies, iter_with_bodies, finish_item, cap_emails
+from mail_sources import MailSource, get_mail_source
+from pipeline import run_pipeline
+from template_export import export_rows_to_template, upsert_rows_into_workbook
+from output_writers import OUTPUT_FORMATS, RowWriter, get_row_writer
+from gpt_client import call_gpt_with_prompts, run_stats
+from llm_schema import schema_stats
+from llm_cache import cache_get, cache_put, cache_evict, cache_stats
+from batch_client import run_batch
+from local_extract import extract_contact_locally
+from sync_state import load_state, save_state, folder_watermarks, is_processed, record_run
+from contact_store import merge_rows, commit_contacts, rollback_contacts
+from run_journal import open_journal, journaled_row, journal_rows, reused_rows, close_journal
+from prompts import (
+    SCHEMA_KEYS_OSOBA, TRUNCATION_MARK, NOTE_REQUIRED,
+    make_prompts_for_message, make_prompts_for_messages, fit_message_to_budget
+)
 
 def _force_utf8_stdio():
     # Force UTF-8 for both streams. Safe in frozen and non-frozen modes.
@@ -46,14 +74,239 @@ def _force_utf8_stdio():
 _force_utf8_stdio()
 load_dotenv()
 
-def main():
-    # Output path
-    _ts = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
-    _final_name = f"{OUTPUT_NAME or 'outlook_analysis'}_{_ts}.xlsx"
-    output = os.path.normpath(os.path.join(OUTPUT_DIR or ".", _final_name))
-    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+_token_stats = {"requests": 0, "input_tokens": 0, "trimmed": 0, "stripped_bytes": 0}
+_token_lock = threading.Lock()
 
-    # Date range
+def _message_for_prompt(em: EmailItem) -> dict:
+    """Prompt fields for one email, trimmed to LLM_INPUT_TOKEN_BUDGET."""
+    raw = {
+        "is_incoming": bool(em.is_incoming),
+        "received": em.received.strftime("%Y-%m-%d %H:%M"),
+        "sender": em.sender,
+        "to": em.to_recipients,
+        "cc": em.cc_recipients,
+        "subject": em.subject,
+        "body": em.body_text,
+        "signature": em.signature_text,
+    }
+    msg, tokens = fit_message_to_budget(raw, LLM_INPUT_TOKEN_BUDGET)
+    trimmed = msg["body"].endswith(TRUNCATION_MARK) and not raw["body"].endswith(TRUNCATION_MARK)
+    with _token_lock:
+        _token_stats["requests"] += 1
+        _token_stats["input_tokens"] += tokens
+        _token_stats["trimmed"] += int(trimmed)
+        _token_stats["stripped_bytes"] += em.stripped_bytes
+    print(f"[tok] conv={conversation_key(em)} input_tokens={tokens} stripped={em.stripped_bytes}B"
+          + (" (trimmed)" if trimmed else ""))
+    return msg
+
+def _row_from_result(em: EmailItem, obj: dict) -> dict:
+    row = coerce_to_schema(obj or {}, SCHEMA_KEYS_OSOBA) if STRICT_SCHEMA else (obj or {})
+    row["_EMAIL_RECEIVED"] = em.received.strftime("%Y-%m-%d %H:%M")
+    row["_EMAIL_FROM"] = em.sender
+    row["_EMAIL_SUBJECT"] = em.subject
+    row["_EMAIL_DIR"] = ("IN" if em.is_incoming else "OUT")
+    row["_CONV_ID"] = conversation_key(em)
+    row["_SIGNATURE"] = em.signature_text
+    return row
+
+def _error_row(em: EmailItem, err: Exception) -> dict:
+    # --- keep failure visible in export ---
+    fallback = {k: "" for k in SCHEMA_KEYS_OSOBA}
+    fallback["_ERROR"] = str(err)
+    fallback["_EMAIL_SUBJECT"] = em.subject
+    fallback["_CONV_ID"] = conversation_key(em)
+    return fallback
+
+def _call_llm(system_prompt: str, user_prompt: str) -> dict:
+    """Return a cached response for identical prompts, otherwise call the model and cache it."""
+    obj = cache_get(OPENAI_MODEL, system_prompt, user_prompt)
+    if obj is None:
+        obj = call_gpt_with_prompts(system_prompt, user_prompt)
+        cache_put(OPENAI_MODEL, system_prompt, user_prompt, obj)
+    return obj
+
+_local_stats = {"avoided": 0}
+_local_lock = threading.Lock()
+
+def _try_local(em: EmailItem) -> dict:
+    """Rule-based row when LOCAL_EXTRACT is on, no summary is required and confidence is high enough."""
+    if not LOCAL_EXTRACT or NOTE_REQUIRED:
+        return None
+    obj, confidence = extract_contact_locally(em)
+    if confidence < LOCAL_EXTRACT_MIN_CONFIDENCE:
+        return None
+    with _local_lock:
+        _local_stats["avoided"] += 1
+    print(f"[local] conv={conversation_key(em)} resolved without LLM (confidence={confidence:.2f})")
+    return obj
+
+_pack_stats = {"requests": 0, "emails": 0, "fallbacks": 0}
+_pack_lock = threading.Lock()
+
+def _pack_units(last_emails: List[EmailItem]) -> List[List[int]]:
+    """Group indices into LLM requests: short bodies go LLM_PACK_SIZE at a time, long ones alone."""
+    units: List[List[int]] = []
+    pack: List[int] = []
+    for i, em in enumerate(last_emails):
+        if LLM_PACK_SIZE > 1 and len(em.body_text) <= LLM_PACK_MAX_CHARS:
+            pack.append(i)
+            if len(pack) == LLM_PACK_SIZE:
+                units.append(pack)
+                pack = []
+        else:
+            units.append([i])
+    if pack:
+        units.append(pack)
+    return units
+
+def _call_llm_packed(prompts: Dict[int, Tuple[str, str]], msgs: Dict[int, dict]) -> Dict[int, dict]:
+    """Resolve several messages with one packed request.
+
+    Cache hits are answered locally and the rest share one request. Returns only
+    the entries that were resolved; the caller retries the others one by one.
+    """
+    resolved: Dict[int, dict] = {}
+    for i, (system_prompt, user_prompt) in prompts.items():
+        cached = cache_get(OPENAI_MODEL, system_prompt, user_prompt)
+        if cached is not None:
+            resolved[i] = cached
+    todo = [i for i in prompts if i not in resolved]
+    if len(todo) < 2:
+        return resolved
+
+    system_prompt, user_prompt = make_prompts_for_messages([msgs[i] for i in todo])
+    try:
+        parts = split_packed_results(call_gpt_with_prompts(system_prompt, user_prompt, packed=True),
+                                     len(todo), SCHEMA_KEYS_OSOBA)
+    except Exception as e:
+        print(f"[gpt] !! packed request failed ({e}); retrying its {len(todo)} email(s) one by one")
+        parts = [None] * len(todo)
+    for i, part in zip(todo, parts):
+        if part is not None:
+            resolved[i] = part
+            # stored under the single-message prompt so later runs hit it either way
+            cache_put(OPENAI_MODEL, *prompts[i], part)
+    with _pack_lock:
+        _pack_stats["requests"] += 1
+        _pack_stats["emails"] += len(todo)
+        _pack_stats["fallbacks"] += sum(1 for p in parts if p is None)
+    return resolved
+
+def _extract_one(em: EmailItem, prompts: Optional[Tuple[str, str]] = None) -> dict:
+    """Row for a single email: local fast path, cache or one LLM call; `_ERROR` row on failure.
+    `prompts` already built by the caller (packed fallback) skip the local path and the prompt build."""
+    if prompts is None:
+        local = _try_local(em)
+        if local is not None:
+            return _row_from_result(em, local)
+    try:
+        if prompts is None:
+            prompts = make_prompts_for_message(_message_for_prompt(em), [])
+        return _row_from_result(em, _call_llm(*prompts))
+    except Exception as e:
+        print(f"[gpt] !! failed on conv={conversation_key(em)}: {e}")
+        return _error_row(em, e)
+
+def _extract_packed(ems: Dict[int, EmailItem]) -> Dict[int, dict]:
+    """Rows for a group of short emails sharing one packed request; misses fall back to `_extract_one`."""
+    out: Dict[int, dict] = {}
+    msgs: Dict[int, dict] = {}
+    prompts: Dict[int, Tuple[str, str]] = {}
+    for i, em in ems.items():
+        local = _try_local(em)
+        if local is not None:
+            out[i] = _row_from_result(em, local)
+            continue
+        try:
+            msgs[i] = _message_for_prompt(em)
+            prompts[i] = make_prompts_for_message(msgs[i], [])
+        except Exception as e:
+            print(f"[gpt] !! failed on conv={conversation_key(em)}: {e}")
+            out[i] = _error_row(em, e)
+    if len(prompts) > 1:
+        for i, obj in _call_llm_packed(prompts, msgs).items():
+            out[i] = _row_from_result(ems[i], obj)
+    for i in prompts:
+        if i not in out:
+            out[i] = _extract_one(ems[i], prompts[i])
+    return out
+
+def _extract_rows(last_emails: List[EmailItem],
+                  on_rows: Optional[Callable[[List[Tuple[EmailItem, dict]]], None]] = None) -> List[dict]:
+    """Call the LLM for every selected email using a bounded thread pool.
+
+    Rows are returned in the same order as `last_emails`; a failed call yields
+    an `_ERROR` row instead of aborting the run. With LLM_PACK_SIZE > 1 short
+    emails are packed into shared requests (see `_call_llm_packed`).
+    `on_rows` receives the (email, row) pairs of every finished request (in completion order).
+    """
+    total = len(last_emails)
+    done = {"n": 0}
+    lock = threading.Lock()
+
+    def work(unit: List[int]) -> Dict[int, dict]:
+        if len(unit) == 1:
+            out = {unit[0]: _extract_one(last_emails[unit[0]])}
+        else:
+            out = _extract_packed({i: last_emails[i] for i in unit})
+        if on_rows is not None:
+            on_rows([(last_emails[i], row) for i, row in out.items()])
+        with lock:
+            for _ in unit:
+                done["n"] += 1
+                print(f"Pokrok v praci na dopisech {done['n']}/{total}")
+        return out
+
+    units = _pack_units(last_emails)
+    rows: List[dict] = [None] * total
+    workers = min(LLM_CONCURRENCY, len(units))
+    if workers <= 1:
+        results = [work(u) for u in units]
+    else:
+        print(f"[i] LLM workers: {workers}")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm") as pool:
+            results = list(pool.map(work, units))
+    for out in results:
+        for i, row in out.items():
+            rows[i] = row
+    return rows
+
+def _extract_rows_batch(last_emails: List[EmailItem]) -> List[dict]:
+    """Same rows as `_extract_rows`, but uncached prompts go through the Batch API."""
+    rows_by_conv: Dict[str, dict] = {}
+    pending: Dict[str, tuple] = {}
+    for em in last_emails:
+        conv_id = conversation_key(em)
+        local = _try_local(em)
+        if local is not None:
+            rows_by_conv[conv_id] = _row_from_result(em, local)
+            continue
+        try:
+            system_prompt, user_prompt = make_prompts_for_message(_message_for_prompt(em), [])
+        except Exception as e:
+            rows_by_conv[conv_id] = _error_row(em, e)
+            continue
+        cached = cache_get(OPENAI_MODEL, system_prompt, user_prompt)
+        if cached is not None:
+            rows_by_conv[conv_id] = _row_from_result(em, cached)
+        else:
+            pending[conv_id] = (system_prompt, user_prompt)
+
+    print(f"[i] Batch mode: {len(pending)} request(s) to submit, {len(rows_by_conv)} resolved locally")
+    if pending:
+        results, errors = run_batch(pending)
+        for em in last_emails:
+            conv_id = conversation_key(em)
+            if conv_id not in pending:
+                continue
+            if conv_id in results:  # already cached by run_batch
+                rows_by_conv[conv_id] = _row_from_result(em, results[conv_id])
+            else:
+                rows_by_conv[conv_id] = _error_row(em, RuntimeError(errors.get(conv_id, "No batch result")))
+    return [rows_by_conv[conversation_key(em)] for em in last_emails]
+
+def _date_window() -> Tuple[dt.datetime, Optional[dt.datetime]]:
     date_from = to_naive_local(dt.datetime.fromisoformat(DATE_FROM_ENV)) if DATE_FROM_ENV else None
     date_to   = to_naive_local(dt.datetime.fromisoformat(DATE_TO_ENV))   if DATE_TO_ENV   else None
     if not date_from:
@@ -64,15 +317,12 @@ def main():
     else:
         df_from = date_from.replace(hour=0, minute=0, second=0, microsecond=0)
         df_to   = date_to.replace(hour=23, minute=59, second=59, microsecond=0) if date_to else None
+    return df_from, df_to
 
-    print(f"[i] Fetching emails... sources=Inbox+Sent range={[df_from, df_to]} status={STATUS_DEFAULT}")
-    emails = fetch_inbox_and_sent(
-        date_from=df_from, date_to=df_to,
-        status=STATUS_DEFAULT, max_emails=MAX_EMAILS_DEFAULT,
-        folder_path=OUTLOOK_FOLDER_DEFAULT,
-        fetch_sent_too=FETCH_SENT_TOO
-    )
-
+def _select_latest(emails: List[EmailItem], df_from: dt.datetime, df_to: Optional[dt.datetime],
+                   state: Optional[dict] = None) -> List[EmailItem]:
+    """Date filter, MAX_EMAILS cap, then the latest message of every conversation
+    (minus conversations whose latest message is already recorded in `state`)."""
     # Normalize datetimes
     for em in emails:
         em.received = to_naive_local(em.received)
@@ -84,7 +334,7 @@ def main():
 
     if not emails:
         print("[i] Nothing to do.")
-        return
+        return []
 
     # Optional cap AFTER filtering
     if len(emails) > MAX_EMAILS_DEFAULT:
@@ -92,13 +342,11 @@ def main():
         emails = emails[:MAX_EMAILS_DEFAULT]
         print(f"[i] Capped to MAX_EMAILS={MAX_EMAILS_DEFAULT}")
 
-
     # Build conversations
     conv_map: Dict[str, List[EmailItem]] = defaultdict(list)
     for em in emails:
         em.is_incoming = is_incoming_email(em, MY_EMAILS)
-        conv_id = em.conversation_id or f"__{em.entry_id or id(em)}"
-        conv_map[conv_id].append(em)
+        conv_map[conversation_key(em)].append(em)
 
     # Select last message per conversation
     last_emails: List[EmailItem] = []
@@ -108,88 +356,293 @@ def main():
         lst.sort(key=lambda x: x.received)  # ascending
         last_emails.append(lst[-1])
 
-
-
-    # Send to GPT and collect rows
     print(f"[i] Conversations selected (latest-only): {len(last_emails)}")
+    if state is not None:
+        before = len(last_emails)
+        last_emails = [em for em in last_emails if not is_processed(state, em)]
+        if before != len(last_emails):
+            print(f"[i] Skipped unchanged conversations (already processed): {before - len(last_emails)}")
     if not last_emails:
         print("[i] No conversations match selection. Done.")
-        return
+    return last_emails
 
-    # Send to GPT and collect rows
-    rows: List[dict] = []
-    total = len(last_emails)
-    for idx, em in enumerate(last_emails, 1):
-        try:
-            conv_id = em.conversation_id or f"__{em.entry_id or id(em)}"
-            # --- NEW: pre-call log per item ---
-            print(
-                f"Pokrok v praci na dopisech {idx}/{total}"
-            )
-
-            msg = {
-                "is_incoming": bool(em.is_incoming),
-                "received": em.received.strftime("%Y-%m-%d %H:%M"),
-                "sender": em.sender,
-                "to": em.to_recipients,
-                "cc": em.cc_recipients,
-                "subject": em.subject,
-                "body": em.body_text[:20000],
-                "signature": em.signature_text,
-            }
-            system_prompt, user_prompt = make_prompts_for_message(msg,[])
-            obj = call_gpt_with_prompts(system_prompt, user_prompt)
-
-            row = coerce_to_schema(obj or {}, SCHEMA_KEYS_OSOBA) if STRICT_SCHEMA else (obj or {})
-            row["_EMAIL_RECEIVED"] = em.received.strftime("%Y-%m-%d %H:%M")
-            row["_EMAIL_FROM"] = em.sender
-            row["_EMAIL_SUBJECT"] = em.subject
-            row["_EMAIL_DIR"] = ("IN" if em.is_incoming else "OUT")
-            row["_CONV_ID"] = conv_id
-            row["_SIGNATURE"] = em.signature_text
-            rows.append(row)
-        except Exception as e:
-            # --- keep failure visible in export ---
-            fallback = {k: "" for k in SCHEMA_KEYS_OSOBA}
-            fallback["_ERROR"] = str(e)
-            fallback["_EMAIL_SUBJECT"] = em.subject
-            fallback["_CONV_ID"] = conv_id
-            rows.append(fallback)
-            print(f"[gpt] !! failed on conv={conv_id}: {e}")
-
-    # Export
-    print("[i] Exporting...")
-    if TEMPLATE_XLSX:
-        try:
-            template_path = resolve_template_path(TEMPLATE_XLSX)  # NEW
-            start_row = 3 if TEMPLATE_START_AT_R3 else None
-            export_rows_to_template(
-                # template_path=TEMPLATE_XLSX,  # OLD
-                template_path=template_path,  # NEW
-                out_path=output,
-                sheet_name=TEMPLATE_SHEET,
-                rows=rows,
-                start_row=start_row
-            )
-            print(f"[ok] Saved {len(rows)} row(s) into template: {output}")
-        except FileNotFoundError as e:
-            print(f"[err] {e}")  # ASCII-safe log
-            return
-    else:
-        # Union columns respecting SCHEMA_KEYS_OSOBA order
-        union_cols, seen = [], set()
-        for k in SCHEMA_KEYS_OSOBA:
+def _iter_headers(source: MailSource, df_from: dt.datetime, df_to: Optional[dt.datetime], state: Optional[dict]):
+    return source.iter_headers(
+        date_from=df_from, date_to=df_to,
+        status=STATUS_DEFAULT,
+        watermarks=folder_watermarks(state) if state else None,
+        known_conv_ids=set(state["conversations"]) if state else None,
+        max_emails=MAX_EMAILS_DEFAULT
+    )
+
+def _run_async_pipeline(source: MailSource, df_from: dt.datetime, df_to: Optional[dt.datetime],
+                        state: Optional[dict], fetched: List[EmailItem], unreadable: List[EmailItem],
+                        on_rows: Optional[Callable[[List[Tuple[EmailItem, dict]]], None]] = None
+                        ) -> Tuple[List[EmailItem], List[dict]]:
+    """Fetch, preprocessing and LLM calls overlapped (see pipeline.py); same selection as the sequential path.
+    Every prepared item is appended to `fetched`, every message whose body could not be read
+    or parsed to `unreadable` (both for the sync state); `on_rows` gets each final row.
+    Messages with a journaled row (--resume) are not sent to the LLM; results are journaled as they
+    arrive, speculative ones too (the journal is keyed by entry ID, so only the same message reuses them)."""
+    def raw_source():
+        with source.thread_context():  # fetch runs in its own thread (COM apartment for Outlook)
+            yield from iter_with_bodies(_iter_headers(source, df_from, df_to, state), unreadable)
+
+    header_only: set = set()
+
+    def prepare(em: EmailItem, body_src: Optional[str]) -> EmailItem:
+        if body_src is None:
+            header_only.add(id(em))  # superseded in its conversation, body not read
+        else:
+            try:
+                em = finish_item(em, body_src)
+            except Exception:
+                unreadable.append(em)
+                raise
+        em.received = to_naive_local(em.received)
+        em.is_incoming = is_incoming_email(em, MY_EMAILS)
+        fetched.append(em)
+        return em
+
+    def accept(em: EmailItem) -> bool:
+        if id(em) in header_only:
+            return False
+        return em.received >= df_from and (df_to is None or em.received <= df_to)
+
+    def select(emails: List[EmailItem]) -> List[EmailItem]:
+        return _select_latest(cap_emails(emails, MAX_EMAILS_DEFAULT), df_from, df_to, state)
+
+    if LLM_PACK_SIZE > 1:
+        print(f"[warn] LLM_PACK_SIZE={LLM_PACK_SIZE} is ignored: the async pipeline sends one request per "
+              "email; set PIPELINE_MODE=sequential to pack requests")
+    def extract(em: EmailItem) -> dict:
+        row = journaled_row(em)
+        if row is None:
+            row = _extract_one(em)
+            journal_rows([(em, row)])
+        return row
+
+    on_row = (lambda em, row: on_rows([(em, row)])) if on_rows is not None else None
+    return run_pipeline(raw_source, prepare, accept, select, extract, MAX_EMAILS_DEFAULT, on_row)
+
+def _export_columns(rows: List[dict]) -> List[str]:
+    """Union of row keys, SCHEMA_KEYS_OSOBA first."""
+    union_cols, seen = [], set()
+    for k in SCHEMA_KEYS_OSOBA:
+        if k not in seen:
+            union_cols.append(k); seen.add(k)
+    for r in rows:
+        for k in r.keys():
             if k not in seen:
                 union_cols.append(k); seen.add(k)
+    return union_cols
+
+def _export_master(rows: List[dict]) -> bool:
+    try:
+        template_path = resolve_template_path(TEMPLATE_XLSX) if TEMPLATE_XLSX else None
+        os.makedirs(os.path.dirname(os.path.abspath(MASTER_XLSX)), exist_ok=True)
+        counts = upsert_rows_into_workbook(MASTER_XLSX, template_path, TEMPLATE_SHEET, rows, _export_columns(rows))
+    except FileNotFoundError as e:
+        print(f"[err] {e}")
+        return False
+    except PermissionError as e:
+        print(f"[err] Master workbook is locked (open in Excel?): {e}")
+        return False
+    print(f"[ok] Master {MASTER_XLSX}: appended={counts['appended']} updated={counts['updated']} "
+          f"unchanged={counts['unchanged']}")
+    return True
+
+def _open_stream(fmt: str, output: str) -> Tuple[RowWriter, Callable[[List[dict]], None], Dict[str, int]]:
+    """Writer for streamed output and the callback feeding it: finished rows are merged
+    into the contact store (CONTACT_EXPORT=changed drops known ones) and written at once."""
+    writer = get_row_writer(fmt, output)
+    contacts = {"new": 0, "changed": 0, "known": 0, "left_out": 0}
+    lock = threading.Lock()
+
+    def emit(rows: List[dict]) -> None:
+        with lock:
+            if CONTACT_STORE:
+                for k, n in merge_rows(rows).items():
+                    contacts[k] += n
+                if CONTACT_EXPORT == "changed":
+                    kept = [r for r in rows if r.get("_CONTACT") != "known"]
+                    contacts["left_out"] += len(rows) - len(kept)
+                    rows = kept
+            for r in rows:
+                writer.write(r)
+    return writer, emit, contacts
+
+def _close_stream(writer: RowWriter, contacts: Dict[str, int], output: str) -> bool:
+    if CONTACT_STORE:
+        print(f"[i] Contacts: new={contacts['new']} changed={contacts['changed']} known={contacts['known']}")
+        if CONTACT_EXPORT == "changed":
+            print(f"[i] Known unchanged contacts left out of the export: {contacts['left_out']}")
+    try:
+        writer.close()
+    except OSError as e:
+        print(f"[err] {e}")
+        return False
+    print(f"[ok] Saved {writer.rows} row(s) to: {output}")
+    return True
+
+def _export(rows: List[dict], output: str) -> bool:
+    """Master workbook, template or plain xlsx export of the ordered rows
+    (csv/jsonl/parquet are streamed instead, see _open_stream)."""
+    print("[i] Exporting...")
+    if EXPORT_MODE == "master":
+        return _export_master(rows)
+    if not TEMPLATE_XLSX:
+        writer = get_row_writer("xlsx", output, _export_columns(rows))
         for r in rows:
-            for k in r.keys():
-                if k not in seen:
-                    union_cols.append(k); seen.add(k)
-        df = pd.DataFrame(rows, columns=union_cols)
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="Analysis")
+            writer.write(r)
+        writer.close()
         print(f"[ok] Saved {len(rows)} row(s) to: {output}")
+        return True
+    try:
+        template_path = resolve_template_path(TEMPLATE_XLSX)  # NEW
+        start_row = 3 if TEMPLATE_START_AT_R3 else None
+        export_rows_to_template(
+            # template_path=TEMPLATE_XLSX,  # OLD
+            template_path=template_path,  # NEW
+            out_path=output,
+            sheet_name=TEMPLATE_SHEET,
+            rows=rows,
+            start_row=start_row
+        )
+        print(f"[ok] Saved {len(rows)} row(s) into template: {output}")
+    except FileNotFoundError as e:
+        print(f"[err] {e}")  # ASCII-safe log
+        return False
+    return True
+
+def _print_run_report():
+    st = run_stats()
+    print(f"[i] LLM requests: {st['requests']}, retries used: {st['retries']}/{st['retry_budget']}")
+    if st["streamed"]:
+        print(f"[i] Streamed: {st['streamed']}, avg ttft={st['ttft_ms'] // st['streamed']}ms "
+              f"avg total={st['stream_ms'] // st['streamed']}ms, stopped early: {st['early_stops']}")
+    print(f"[i] Prompt input tokens: {_token_stats['input_tokens']} over {_token_stats['requests']} email(s), "
+          f"trimmed to budget: {_token_stats['trimmed']}, "
+          f"quoted history/disclaimers removed: {_token_stats['stripped_bytes']} B")
+    if LOCAL_EXTRACT:
+        print(f"[i] LLM calls avoided by local extraction: {_local_stats['avoided']}"
+              + (" (disabled: PROMPT_RULES ask for PoznamkaKOsobe)" if NOTE_REQUIRED else ""))
+    if _pack_stats["requests"]:
+        print(f"[i] Packed requests: {_pack_stats['requests']} covering {_pack_stats['emails']} email(s), "
+              f"single-call fallbacks: {_pack_stats['fallbacks']}")
+    vs = schema_stats()
+    if any(vs.values()):
+        print(f"[i] LLM replies: valid={vs['valid']} repaired locally={vs['repaired']} "
+              f"re-asked={vs['reasked']} failed={vs['failed']}")
+    if reused_rows():
+        print(f"[i] Rows reused from the run journal (--resume): {reused_rows()}")
+    cs = cache_stats()
+    print(f"[i] LLM cache: hits={cs['hits']} misses={cs['misses']} stored={cs['stores']} evicted={cache_evict()}")
+
+def main():
+    # Output path
+    _ts = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
+    fmt = OUTPUT_FORMAT
+    if fmt not in OUTPUT_FORMATS:
+        print(f"[warn] Unknown OUTPUT_FORMAT '{fmt}'; using xlsx.")
+        fmt = "xlsx"
+    # xlsx (plain, template or master) is written at the end in selection order; other formats stream
+    streamed = EXPORT_MODE != "master" and fmt != "xlsx"
+    _final_name = f"{OUTPUT_NAME or 'outlook_analysis'}_{_ts}.{fmt if streamed else 'xlsx'}"
+    output = os.path.normpath(os.path.join(OUTPUT_DIR or ".", _final_name))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    writer, emit, streamed_contacts = _open_stream(fmt, output) if streamed else (None, None, None)
+
+    # Checkpoint journal: every finished row is journaled before it is streamed
+    open_journal("--resume" in sys.argv or RUN_RESUME)
+
+    def on_rows(pairs: List[Tuple[EmailItem, dict]]) -> None:
+        journal_rows(pairs)
+        if emit is not None:
+            emit([row for _, row in pairs])
+
+    # Date range
+    df_from, df_to = _date_window()
+
+    # Sync state: SYNC_MODE=full / --full refetches the whole window but still records this run
+    state = load_state()
+    full = "--full" in sys.argv or SYNC_MODE == "full"
+    if full:
+        print("[i] Full run (SYNC_MODE=full or --full): sync state ignored for fetching")
+    else:
+        for path, wm in folder_watermarks(state).items():
+            if wm > df_from:
+                print(f"[i] Incremental sync: {path} fetched only after {wm} (already processed); "
+                      "SYNC_MODE=full or --full refetches the whole window")
+    run_state = None if full else state
+
+    source = get_mail_source()
+    print(f"[i] Fetching emails... source={source.name} range={[df_from, df_to]} status={STATUS_DEFAULT}")
+    batch_mode = "--batch" in sys.argv
+    if PIPELINE_MODE == "async" and not batch_mode:
+        emails: List[EmailItem] = []
+        unreadable: List[EmailItem] = []
+        last_emails, rows = _run_async_pipeline(source, df_from, df_to, run_state, emails, unreadable, on_rows)
+    else:
+        # Two-phase fetch: select on headers, then read bodies of the selected messages only
+        raw = list(_iter_headers(source, df_from, df_to, run_state))
+        emails = cap_emails([em for em, _ in raw], MAX_EMAILS_DEFAULT)
+        last_emails = _select_latest(emails, df_from, df_to, run_state)
+        unreadable: List[EmailItem] = []
+        rows: List[dict] = []
+        if last_emails:
+            # --resume: conversations with a journaled row need neither their body nor the LLM
+            resumed: Dict[int, dict] = {}
+            for em in last_emails:
+                row = journaled_row(em)
+                if row is not None:
+                    resumed[id(em)] = row
+            wanted = [em for em in last_emails if id(em) not in resumed]
+            todo = load_bodies(raw, wanted)
+            read_ids = {id(em) for em in todo}
+            unreadable = [em for em in wanted if id(em) not in read_ids]
+            if resumed:
+                on_rows([(em, resumed[id(em)]) for em in last_emails if id(em) in resumed])
+
+            # Send to GPT and collect rows
+            if batch_mode:
+                new_rows = _extract_rows_batch(todo)
+                on_rows(list(zip(todo, new_rows)))
+            else:
+                new_rows = _extract_rows(todo, on_rows)
+            by_id = dict(resumed)
+            by_id.update(zip(map(id, todo), new_rows))
+            last_emails = [em for em in last_emails if id(em) in by_id]
+            rows = [by_id[id(em)] for em in last_emails]
+
+    # Export: streamed rows are already written and merged into the contact store
+    if not last_emails:
+        # nothing selected: no output file, but the sync state and the journal are still finalized
+        print("[i] No new conversations to export")
+        ok = True
+    elif writer is not None:
+        ok = _close_stream(writer, streamed_contacts, output)
+    else:
+        # Contact store: flag new/changed contacts, optionally export only those
+        export_rows = rows
+        if CONTACT_STORE:
+            cc = merge_rows(rows)
+            print(f"[i] Contacts: new={cc['new']} changed={cc['changed']} known={cc['known']}")
+            if CONTACT_EXPORT == "changed":
+                export_rows = [r for r in rows if r.get("_CONTACT") != "known"]
+                print(f"[i] Known unchanged contacts left out of the export: {len(rows) - len(export_rows)}")
+        ok = _export(export_rows, output)
+    if not ok:
+        rollback_contacts()
+        close_journal(finished=False)  # --resume repeats the export without LLM calls
+        return
+    commit_contacts()
+
+    record_run(state, emails, last_emails, rows, unreadable)
+    save_state(state)
+    close_journal(finished=True)
 
+    _print_run_report()
     print("[done]")
 
 if __name__ == "__main__":
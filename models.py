@@ -16,3 +16,5 @@ class EmailItem:
     is_incoming: Optional[bool] = None
     signature_text: str = ""
     folder_path: str = ""
+    stripped_bytes: int = 0  # quoted history / disclaimers removed from body_text
+    signature_confidence: float = 0.0  # detect_signature score 0..1
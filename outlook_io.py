@@ -1,8 +1,17 @@
 
+import queue
+import threading
 import datetime as dt
-from typing import List, Optional
+from contextlib import contextmanager
+from typing import List, Optional, Iterator, Tuple, Dict, Set, Callable
+from config import OUTLOOK_READ_MODE, OUTLOOK_TABLE_CHUNK, OUTLOOK_FETCH_WORKERS, STRIP_QUOTED
 from models import EmailItem
-from utils import html_to_text, extract_signature, to_naive_local
+from body_cleanup import clean_body
+from utils import html_to_text, detect_signature, to_naive_local
+
+# (header-only EmailItem, callable returning the raw body) - bodies are read only for kept items
+RawItem = Tuple[EmailItem, Callable[[], str]]
+
 def _resolve_folder(ns, folder_path: str):
     """Resolve an Outlook folder by path. First segment may be a store name or a well-known folder."""
     if not folder_path:
@@ -45,8 +54,8 @@ def _resolve_folder(ns, folder_path: str):
             break
         folder = found
     return folder
-def _restrict_items(items, date_from: dt.datetime, date_to: Optional[dt.datetime], status: str):
-    items.Sort("[ReceivedTime]", True)
+def _restriction(date_from: dt.datetime, date_to: Optional[dt.datetime], status: str) -> str:
+    """Jet filter shared by Items.Restrict and Folder.GetTable."""
     def fmt_ol(d: dt.datetime) -> str:
         return d.strftime("%d.%m.%Y %H:%M")
     clauses = [f"[ReceivedTime] >= '{fmt_ol(date_from)}'"]
@@ -57,7 +66,10 @@ def _restrict_items(items, date_from: dt.datetime, date_to: Optional[dt.datetime
         clauses.append("[Unread] = True")
     elif status == "read":
         clauses.append("[Unread] = False")
-    restriction = " AND ".join(clauses)
+    return " AND ".join(clauses)
+
+def _restrict_items(items, restriction: str):
+    items.Sort("[ReceivedTime]", True)
     print(f"[debug] Outlook Restrict: {restriction}")
     try:
         return items.Restrict(restriction)
@@ -65,76 +77,360 @@ def _restrict_items(items, date_from: dt.datetime, date_to: Optional[dt.datetime
         print(f"[warn] Restrict failed ({e}); using unfiltered items.")
         return items
 
-def _collect_from_items(restricted) -> List[EmailItem]:
-    emails: List[EmailItem] = []
+def _item_body(item) -> str:
+    """Raw body of a MailItem: HTML when it is the richer variant, else plain text."""
+    body_html  = str(getattr(item, "HTMLBody", "") or "")
+    body_plain = str(getattr(item, "Body", "") or "")
+    return body_html if len(body_html) > len(body_plain) else body_plain
+
+_thread_ns = threading.local()
+
+def _namespace_for_thread():
+    """MAPI namespace of the calling thread (COM objects must not cross apartments)."""
+    ns = getattr(_thread_ns, "ns", None)
+    if ns is None:
+        ns = _thread_ns.ns = _outlook_namespace()
+    return ns
+
+def _body_loader(entry_id: str, store_id: str) -> Callable[[], str]:
+    """Loader that reopens the item by ID in whichever thread reads the body."""
+    return lambda: _item_body(_namespace_for_thread().GetItemFromID(entry_id, store_id))
+
+def _read_raw(item, conv_filter: Optional[Set[str]] = None, store_id: str = "") -> Optional[RawItem]:
+    """Read header COM properties of one MailItem; the body is read by the returned loader.
+    With `conv_filter`, ConversationID is read first and other conversations are skipped."""
+    if getattr(item, "Class", None) != 43:  # olMail
+        return None
+    try:
+        conversation_id = str(getattr(item, "ConversationID", "") or "")
+        if conv_filter is not None and conversation_id not in conv_filter:
+            return None
+        received = to_naive_local(item.ReceivedTime)
+        subject  = str(item.Subject or "")
+        sender_email = str(getattr(item, "SenderEmailAddress", "") or "")
+        sender_name = str(getattr(item, "SenderName", "") or "")
+        sender = f"{sender_name} <{sender_email}>"
+        to_recips  = str(getattr(item, "To", "") or "")
+        cc_recips  = str(getattr(item, "CC", "") or "")
+        entry_id = str(getattr(item, "EntryID", "") or "")
+        folder_path = str(getattr(getattr(item, "Parent", None), "FolderPath", "") or "") #DEBUG
+        em = EmailItem(
+            received=received, subject=subject, sender=sender,
+            to_recipients=to_recips, cc_recipients=cc_recips,
+            body_text="", conversation_id=conversation_id,
+            entry_id=entry_id, signature_text="",
+            folder_path=folder_path,  # DEBUG
+        )
+        return em, _body_loader(entry_id, store_id)
+    except Exception as e:
+        print(f"[skip] Failed reading an item: {e}")
+        return None
+
+def finish_item(em: EmailItem, body_src: str) -> EmailItem:
+    """CPU part of reading a message: HTML -> text, quoted history removal, signature detection.
+    The signature is taken from the cleaned body, i.e. from the newest message only."""
+    em.body_text = html_to_text(body_src)
+    if STRIP_QUOTED:
+        em.body_text, em.stripped_bytes = clean_body(em.body_text)
+    em.signature_text, em.signature_confidence = detect_signature(em.body_text)
+    return em
+
+def _stop_note(folder, limit: int, ids_sink: Optional[Set[str]]) -> None:
+    tail = "; rest scanned for conversation IDs only" if ids_sink is not None else ""
+    print(f"[i] {getattr(folder, 'Name', '?')}: stopped after the {limit} newest item(s){tail}")
+
+def _iter_raw(restricted, conv_filter: Optional[Set[str]] = None, store_id: str = "",
+              limit: int = 0, ids_sink: Optional[Set[str]] = None) -> Iterator[RawItem]:
+    n = 0
     for item in restricted:
-        if getattr(item, "Class", None) != 43:  # olMail
+        if limit and n >= limit:
+            if ids_sink is None:
+                return
+            if getattr(item, "Class", None) == 43:
+                conv = str(getattr(item, "ConversationID", "") or "")
+                if conv:
+                    ids_sink.add(conv)
             continue
+        raw = _read_raw(item, conv_filter, store_id)
+        if raw is not None:
+            n += 1
+            yield raw
+
+def _items_reader(folder, restriction: str, conv_filter: Optional[Set[str]] = None,
+                  limit: int = 0, ids_sink: Optional[Set[str]] = None) -> Iterator[RawItem]:
+    """Per-item reader: every header property is a separate COM call."""
+    restricted = _restrict_items(folder.Items, restriction)
+    print(f"[i] {getattr(folder, 'Name', '?')} after Restrict: {getattr(restricted, 'Count', '?')}")
+    n = 0
+    for raw in _iter_raw(restricted, conv_filter, str(folder.StoreID), limit, ids_sink):
+        n += 1
+        yield raw
+    if limit and n >= limit:
+        _stop_note(folder, limit, ids_sink)
+
+# Header columns read in bulk through Folder.GetTable (bodies are not available in a Table)
+TABLE_COLUMNS = ("EntryID", "MessageClass", "ReceivedTime", "Subject", "SenderName",
+                 "SenderEmailAddress", "To", "CC", "ConversationID")
+
+def _open_table(folder, restriction: str):
+    print(f"[debug] Outlook GetTable: {restriction}")
+    table = folder.GetTable(restriction, 0)  # olUserItems
+    table.Columns.RemoveAll()
+    for col in TABLE_COLUMNS:
+        table.Columns.Add(col)
+    table.Sort("ReceivedTime", True)
+    return table
+
+def _iter_table(folder, table, conv_filter: Optional[Set[str]] = None,
+                limit: int = 0, ids_sink: Optional[Set[str]] = None) -> Iterator[RawItem]:
+    folder_path = str(getattr(folder, "FolderPath", "") or "")
+    store_id = str(folder.StoreID)
+    n = 0
+    while not table.EndOfTable:
+        if limit and n >= limit and ids_sink is None:
+            break
+        rows = table.GetArray(OUTLOOK_TABLE_CHUNK)
+        if not rows:
+            break
+        for row in rows:
+            rec = dict(zip(TABLE_COLUMNS, row))
+            if not str(rec["MessageClass"] or "").startswith("IPM.Note"):  # olMail only
+                continue
+            if limit and n >= limit:
+                if ids_sink is None:
+                    break
+                if rec["ConversationID"]:
+                    ids_sink.add(str(rec["ConversationID"]))
+                continue
+            if conv_filter is not None and str(rec["ConversationID"] or "") not in conv_filter:
+                continue
+            try:
+                entry_id = str(rec["EntryID"] or "")
+                em = EmailItem(
+                    received=to_naive_local(rec["ReceivedTime"]),
+                    subject=str(rec["Subject"] or ""),
+                    sender=f"{rec['SenderName'] or ''} <{rec['SenderEmailAddress'] or ''}>",
+                    to_recipients=str(rec["To"] or ""), cc_recipients=str(rec["CC"] or ""),
+                    body_text="", conversation_id=str(rec["ConversationID"] or ""),
+                    entry_id=entry_id, signature_text="",
+                    folder_path=folder_path,
+                )
+            except Exception as e:
+                print(f"[skip] Failed reading a table row: {e}")
+                continue
+            n += 1
+            yield em, _body_loader(entry_id, store_id)
+    if limit and n >= limit:
+        _stop_note(folder, limit, ids_sink)
+
+def _folder_reader(folder, restriction: str, conv_filter: Optional[Set[str]] = None,
+                   limit: int = 0, ids_sink: Optional[Set[str]] = None) -> Iterator[RawItem]:
+    """Pick the reader for OUTLOOK_READ_MODE; falls back to per-item reads if GetTable fails.
+    `conv_filter` drops other conversations during the header scan, before anything else is read.
+
+    Both readers walk the folder newest first, so after `limit` items nothing older can make
+    the merged MAX_EMAILS cut: the reader stops there, or - when `ids_sink` is given - only
+    collects the ConversationIDs of the remaining items (needed for the Sent filter)."""
+    if OUTLOOK_READ_MODE == "table":
         try:
-            received = to_naive_local(item.ReceivedTime)
-            subject  = str(item.Subject or "")
-            sender_email = str(getattr(item, "SenderEmailAddress", "") or "")
-            sender_name = str(getattr(item, "SenderName", "") or "")
-            sender = f"{sender_name} <{sender_email}>"
-            body_html  = str(getattr(item, "HTMLBody", "") or "")
-            body_plain = str(getattr(item, "Body", "") or "")
-            body_src   = body_html if len(body_html) > len(body_plain) else body_plain
-            body_text  = html_to_text(body_src)
-            to_recips  = str(getattr(item, "To", "") or "")
-            cc_recips  = str(getattr(item, "CC", "") or "")
-            conversation_id = str(getattr(item, "ConversationID", "") or "")
-            entry_id = str(getattr(item, "EntryID", "") or "")
-            sig = extract_signature(body_text)
-            folder_path = str(getattr(getattr(item, "Parent", None), "FolderPath", "") or "") #DEBUG
-            emails.append(EmailItem(
-                received=received, subject=subject, sender=sender,
-                to_recipients=to_recips, cc_recipients=cc_recips,
-                body_text=body_text, conversation_id=conversation_id,
-                entry_id=entry_id, signature_text=sig,
-                folder_path=folder_path,  # DEBUG
-            ))
+            table = _open_table(folder, restriction)
+            print(f"[i] {getattr(folder, 'Name', '?')} after GetTable: {table.GetRowCount()}")
+            return _iter_table(folder, table, conv_filter, limit, ids_sink)
         except Exception as e:
-            print(f"[skip] Failed reading an item: {e}")
-            continue
-    return emails
+            print(f"[warn] GetTable failed ({e}); reading items one by one.")
+    return _items_reader(folder, restriction, conv_filter, limit, ids_sink)
 
-def fetch_inbox_and_sent(date_from: dt.datetime,
-                         date_to: Optional[dt.datetime],
-                         status: str,
-                         max_emails: int,
-                         folder_path: str,
-                         fetch_sent_too) -> List[EmailItem]:
-    """Fetch Inbox + Sent Items, apply the same Restrict, then merge."""
+@contextmanager
+def com_apartment():
+    """Initialise COM for the current thread (needed when Outlook is read outside the main thread)."""
     try:
-        import win32com.client
+        import pythoncom
     except ImportError:
         raise SystemExit("pywin32 is required. Install: pip install pywin32")
-    ns = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
-    base = _resolve_folder(ns, folder_path)
-    print(f"[i] Base folder resolved: {getattr(base, 'Name', '?')} ({getattr(base, 'FolderPath', '?')})")
-    r_in = _restrict_items(base.Items, date_from, date_to, status)
-    print(f"[i] Base after Restrict: {getattr(r_in, 'Count', '?')}")
-    base_emails = _collect_from_items(r_in)
-    sent_emails: List[EmailItem] = []
+    pythoncom.CoInitialize()
+    try:
+        yield
+    finally:
+        _thread_ns.ns = None  # namespace belongs to this apartment
+        pythoncom.CoUninitialize()
 
-    if fetch_sent_too:
-        sent = ns.GetDefaultFolder(5)
-        print(f"[i] Sent folder: {getattr(sent, 'FolderPath', '?')}")
-        r_out = _restrict_items(sent.Items, date_from, date_to, status)
-        print(f"[i] Sent after Restrict: {getattr(r_out, 'Count', '?')}")
-        all_sent = _collect_from_items(r_out)
-
-        # Keep only Sent that belong to conversations seen in the base folder
-        conv_ids = {e.conversation_id for e in base_emails if e.conversation_id}
-        if conv_ids:
-            sent_emails = [e for e in all_sent if e.conversation_id and e.conversation_id in conv_ids]
-        else:
-            sent_emails = []  # no conversations in base - ignore Sent completely
+def _outlook_namespace():
+    try:
+        import win32com.client
+    except ImportError:
+        raise SystemExit("pywin32 is required. Install: pip install pywin32")
+    return win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
 
-        print(f"[i] Sent kept after conv filter: {len(sent_emails)}")
-    emails = base_emails + sent_emails
-    # Optional hard cap after merge
+def cap_emails(emails: List[EmailItem], max_emails: int) -> List[EmailItem]:
+    """Optional hard cap after merge: keep the newest `max_emails`."""
     if max_emails and len(emails) > max_emails:
         emails.sort(key=lambda x: x.received, reverse=True)
         emails = emails[:max_emails]
     return emails
+
+def _iter_folder_raw(folder, date_from: dt.datetime, date_to: Optional[dt.datetime], status: str,
+                     watermarks: Optional[Dict[str, dt.datetime]],
+                     conv_filter: Optional[Set[str]] = None,
+                     limit: int = 0, ids_sink: Optional[Set[str]] = None) -> Iterator[RawItem]:
+    """Restrict one folder and stream its headers; items at or before the folder's watermark are skipped."""
+    wm = (watermarks or {}).get(str(getattr(folder, "FolderPath", "") or ""))
+    if wm and wm > date_from:
+        print(f"[i] Incremental: {getattr(folder, 'FolderPath', '?')} since {wm:%Y-%m-%d %H:%M:%S}")
+        date_from = wm
+    for em, load_body in _folder_reader(folder, _restriction(date_from, date_to, status), conv_filter,
+                                        limit, ids_sink):
+        if wm and em.received <= wm:
+            continue  # Restrict works with minute precision
+        yield em, load_body
+
+def _with_body(em: EmailItem, load_body: Callable[[], str]) -> Optional[Tuple[EmailItem, str]]:
+    try:
+        return em, load_body()
+    except Exception as e:
+        print(f"[skip] Failed reading a body: {e}")
+        return None
+
+def split_folder_paths(folder_path: str) -> List[str]:
+    """OUTLOOK_FOLDER may list several folders/stores separated by ';'."""
+    return [p.strip() for p in str(folder_path or "").split(";") if p.strip()] or [""]
+
+def _iter_base_folders(paths: List[str], date_from: dt.datetime, date_to: Optional[dt.datetime], status: str,
+                       watermarks: Optional[Dict[str, dt.datetime]],
+                       limit: int = 0, ids_sink: Optional[Set[str]] = None) -> Iterator[RawItem]:
+    """Read several base folders concurrently, one COM apartment and namespace per worker thread;
+    items are yielded as they arrive."""
+    if len(paths) == 1:
+        base = _resolve_folder(_namespace_for_thread(), paths[0])
+        print(f"[i] Base folder resolved: {getattr(base, 'Name', '?')} ({getattr(base, 'FolderPath', '?')})")
+        yield from _iter_folder_raw(base, date_from, date_to, status, watermarks, None, limit, ids_sink)
+        return
+
+    out: queue.Queue = queue.Queue(maxsize=1000)
+    done = object()
+    pending = list(paths)
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            with com_apartment():
+                while True:
+                    with lock:
+                        if not pending:
+                            break
+                        path = pending.pop(0)
+                    try:
+                        base = _resolve_folder(_namespace_for_thread(), path)
+                        print(f"[i] Base folder resolved: {getattr(base, 'Name', '?')} ({getattr(base, 'FolderPath', '?')})")
+                        for raw in _iter_folder_raw(base, date_from, date_to, status, watermarks, None,
+                                                    limit, ids_sink):
+                            out.put(raw)
+                    except Exception as e:
+                        print(f"[warn] Reading folder '{path}' failed: {e}")
+        except BaseException as e:
+            print(f"[err] Outlook fetch worker stopped: {e}")
+        finally:
+            out.put(done)
+
+    n_workers = max(1, min(OUTLOOK_FETCH_WORKERS, len(paths)))
+    for i in range(n_workers):
+        threading.Thread(target=worker, name=f"outlook-fetch-{i}", daemon=True).start()
+    finished = 0
+    while finished < n_workers:
+        raw = out.get()
+        if raw is done:
+            finished += 1
+        else:
+            yield raw
+
+def iter_inbox_and_sent_headers(date_from: dt.datetime,
+                                date_to: Optional[dt.datetime],
+                                status: str,
+                                folder_path: str,
+                                fetch_sent_too,
+                                watermarks: Optional[Dict[str, dt.datetime]] = None,
+                                known_conv_ids: Optional[Set[str]] = None,
+                                max_emails: int = 0) -> Iterator[RawItem]:
+    """Stream header-only (EmailItem, body loader) from the base folder(s), then matching Sent Items.
+    No body is read here. The exact cap is left to `cap_emails`, but every folder stops after
+    its `max_emails` newest items, which is all the merged cap can keep from it.
+
+    folder_path:    one path or several separated by ';' (other stores / shared mailboxes);
+                    several folders are read in parallel and de-duplicated by EntryID
+    watermarks:     FolderPath -> last processed ReceivedTime (incremental sync)
+    known_conv_ids: conversations from earlier runs; their Sent replies are kept
+                    even when the base folder has no new message in them
+    """
+    paths = split_folder_paths(folder_path)
+    conv_ids = set(known_conv_ids or ())
+    seen: Set[str] = set()
+    dups = 0
+    for em, load_body in _iter_base_folders(paths, date_from, date_to, status, watermarks,
+                                            max_emails, conv_ids if fetch_sent_too else None):
+        if em.entry_id:
+            if em.entry_id in seen:
+                dups += 1
+                continue
+            seen.add(em.entry_id)
+        if em.conversation_id:
+            conv_ids.add(em.conversation_id)
+        yield em, load_body
+    if dups:
+        print(f"[i] Duplicates dropped (same EntryID in several folders): {dups}")
+
+    if fetch_sent_too:
+        sent = _namespace_for_thread().GetDefaultFolder(5)
+        print(f"[i] Sent folder: {getattr(sent, 'FolderPath', '?')}")
+        if not conv_ids:
+            print("[i] Sent kept after conv filter: 0")
+            return  # no conversations in base - ignore Sent completely
+        kept = 0
+        # Keep only Sent that belong to conversations seen in the base folder; the filter
+        # runs inside the header scan (PR_CONVERSATION_ID is binary and not reliably
+        # usable in a DASL restriction, so it is not pushed into the query itself)
+        for em, load_body in _iter_folder_raw(sent, date_from, date_to, status, watermarks, conv_ids,
+                                              max_emails):
+            if em.entry_id in seen:
+                continue
+            kept += 1
+            yield em, load_body
+        print(f"[i] Sent kept after conv filter: {kept}")
+
+def iter_with_bodies(headers: Iterator[RawItem],
+                     unreadable: Optional[List[EmailItem]] = None) -> Iterator[Tuple[EmailItem, Optional[str]]]:
+    """Turn a header stream (any mail source) into (EmailItem, raw body) in the same order.
+    Bodies are not converted yet. A message older than an already-read message of the same
+    conversation can never be its latest one, so its body is not read (yielded as None).
+    Messages whose body cannot be read are dropped and added to `unreadable`."""
+    newest: Dict[str, dt.datetime] = {}
+    skipped = 0
+    for em, load_body in headers:
+        conv = em.conversation_id
+        if conv and conv in newest and em.received < newest[conv]:
+            skipped += 1
+            yield em, None
+            continue
+        raw = _with_body(em, load_body)
+        if raw is None:
+            if unreadable is not None:
+                unreadable.append(em)
+            continue
+        if conv:
+            newest[conv] = max(em.received, newest.get(conv, em.received))
+        yield raw
+    print(f"[i] Bodies not read (superseded in conversation): {skipped}")
+
+def load_bodies(raw: List[RawItem], selected: List[EmailItem]) -> List[EmailItem]:
+    """Phase two: read and parse bodies only for `selected` (items of `raw`).
+    Messages whose body cannot be read are dropped."""
+    loaders = {id(em): load_body for em, load_body in raw}
+    out: List[EmailItem] = []
+    for em in selected:
+        got = _with_body(em, loaders[id(em)])
+        if got is None:
+            continue
+        try:
+            out.append(finish_item(*got))
+        except Exception as e:
+            print(f"[skip] Failed reading an item: {e}")
+    print(f"[i] Bodies loaded: {len(out)} of {len(raw)} fetched message(s)")
+    return out
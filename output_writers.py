@@ -0,0 +1,183 @@
+"""
+Streaming output writers: rows are appended as each conversation finishes
+instead of building one DataFrame at the end of the run.
+
+- CsvWriter:     UTF-8 CSV, header row first
+- JsonlWriter:   one JSON object per line
+- ParquetWriter: row groups of up to 10k rows (optional pyarrow package)
+- XlsxWriter:    openpyxl write-only workbook, sheet "Analysis"
+
+Columns are fixed up front: SCHEMA_KEYS_OSOBA, then the _EMAIL_* / _CONV_ID
+metadata columns, unless the caller passes its own (the end-of-run xlsx uses the
+union of the row keys). Other keys (STRICT_SCHEMA=false) are kept by JSONL only.
+CSV and JSONL are flushed every OUTPUT_FLUSH_ROWS rows, so an interrupted run
+leaves the finished rows readable; Parquet and xlsx are complete only after close().
+"""
+import csv
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+from config import OUTPUT_FLUSH_ROWS
+from prompts import SCHEMA_KEYS_OSOBA
+
+META_COLUMNS = [
+    "_EMAIL_RECEIVED", "_EMAIL_FROM", "_EMAIL_SUBJECT", "_EMAIL_DIR", "_CONV_ID",
+    "_SIGNATURE", "_ERROR", "_CONTACT", "_CONTACT_ID",
+]
+OUTPUT_FORMATS = ("xlsx", "csv", "jsonl", "parquet")
+
+
+def output_columns() -> List[str]:
+    cols = list(SCHEMA_KEYS_OSOBA)
+    return cols + [k for k in META_COLUMNS if k not in cols]
+
+
+def _cell(v: Any) -> Any:
+    return "" if v is None else v
+
+
+class RowWriter:
+    """Interface of an output writer. write() may be called from worker threads;
+    the file is created on the first row (or on close() for an empty run)."""
+    ext = "?"
+    keeps_extra_keys = False
+
+    def __init__(self, path: str, flush_rows: int = OUTPUT_FLUSH_ROWS, columns: Optional[List[str]] = None):
+        self.path = path
+        self.columns = list(columns) if columns else output_columns()
+        self.flush_rows = max(1, flush_rows)
+        self.rows = 0
+        self._pending = 0
+        self._opened = False
+        self._dropped: set = set()
+        self._lock = threading.Lock()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        with self._lock:
+            if not self._opened:
+                self._open()
+                self._opened = True
+            extra = row.keys() - set(self.columns) - self._dropped
+            if extra and not self.keeps_extra_keys:
+                self._dropped |= extra
+                print(f"[warn] {self.ext} output has fixed columns; dropped key(s): {', '.join(sorted(extra))}")
+            self._write(row)
+            self.rows += 1
+            self._pending += 1
+            if self._pending >= self.flush_rows:
+                self._flush()
+                self._pending = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._opened:
+                self._open()
+                self._opened = True
+            self._close()
+
+    def _open(self) -> None:
+        raise NotImplementedError
+
+    def _write(self, row: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def _flush(self) -> None:
+        pass
+
+    def _close(self) -> None:
+        raise NotImplementedError
+
+
+class CsvWriter(RowWriter):
+    ext = "csv"
+
+    def _open(self):
+        self._f = open(self.path, "w", encoding="utf-8", newline="")
+        self._w = csv.writer(self._f)
+        self._w.writerow(self.columns)
+
+    def _write(self, row):
+        self._w.writerow([_cell(row.get(k)) for k in self.columns])
+
+    def _flush(self):
+        self._f.flush()
+
+    def _close(self):
+        self._f.close()
+
+
+class JsonlWriter(RowWriter):
+    ext = "jsonl"
+    keeps_extra_keys = True
+
+    def _open(self):
+        self._f = open(self.path, "w", encoding="utf-8", newline="\n")
+
+    def _write(self, row):
+        obj = {k: _cell(row.get(k)) for k in self.columns}
+        obj.update((k, v) for k, v in row.items() if k not in obj)
+        self._f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+
+    def _flush(self):
+        self._f.flush()
+
+    def _close(self):
+        self._f.close()
+
+
+class ParquetWriter(RowWriter):
+    """All columns as strings. The file is readable only after close() (footer), so rows
+    are buffered into large row groups instead of being flushed every OUTPUT_FLUSH_ROWS."""
+    ext = "parquet"
+    row_group = 10_000
+
+    def _open(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._schema = pa.schema([(k, pa.string()) for k in self.columns])
+        self._w = pq.ParquetWriter(self.path, self._schema)
+        self._buf: List[Dict[str, Any]] = []
+
+    def _write(self, row):
+        self._buf.append({k: str(_cell(row.get(k))) for k in self.columns})
+
+    def _flush(self, force: bool = False):
+        if self._buf and (force or len(self._buf) >= self.row_group):
+            self._w.write_table(self._pa.Table.from_pylist(self._buf, schema=self._schema))
+            self._buf = []
+
+    def _close(self):
+        self._flush(force=True)
+        self._w.close()
+
+
+class XlsxWriter(RowWriter):
+    """Write-only workbook: rows go to a temporary sheet file, not into memory."""
+    ext = "xlsx"
+
+    def _open(self):
+        from openpyxl import Workbook
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet("Analysis")
+        self._ws.append(self.columns)
+
+    def _write(self, row):
+        self._ws.append([_cell(row.get(k)) for k in self.columns])
+
+    def _close(self):
+        self._wb.save(self.path)
+
+
+_WRITERS = {"csv": CsvWriter, "jsonl": JsonlWriter, "parquet": ParquetWriter, "xlsx": XlsxWriter}
+
+
+def get_row_writer(fmt: str, path: str, columns: Optional[List[str]] = None) -> RowWriter:
+    """Writer for an OUTPUT_FORMATS entry (default columns: output_columns()); Parquet needs pyarrow."""
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("OUTPUT_FORMAT=parquet needs the pyarrow package (pip install pyarrow)")
+    return _WRITERS[fmt](path, columns=columns)
@@ -0,0 +1,147 @@
+"""
+Async pipeline: Outlook fetch -> preprocessing -> LLM workers, connected by queues.
+
+The fetch runs in its own thread (own COM apartment) and feeds raw items
+into a bounded queue; preprocessing workers convert bodies; every message
+that is currently the newest of its conversation (and inside the newest
+`max_emails`) is dispatched to the LLM workers right away. When the fetch
+ends, the final selection is computed exactly like the sequential path and
+only its rows are kept; conversations that were not dispatched yet are
+sent then, speculative results for superseded messages are dropped.
+"""
+import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from config import LLM_CONCURRENCY, PIPELINE_QUEUE_SIZE, PIPELINE_PREP_WORKERS
+from models import EmailItem
+from utils import conversation_key
+
+
+def run_pipeline(raw_source: Callable[[], Iterator[Tuple[EmailItem, str]]],
+                 prepare: Callable[[EmailItem, str], EmailItem],
+                 accept: Callable[[EmailItem], bool],
+                 select: Callable[[List[EmailItem]], List[EmailItem]],
+                 extract_one: Callable[[EmailItem], dict],
+                 max_emails: int,
+                 on_row: Optional[Callable[[EmailItem, dict], None]] = None) -> Tuple[List[EmailItem], List[dict]]:
+    """
+    raw_source:  generator of (EmailItem, raw body); runs in the fetch thread
+    prepare:     raw body -> finished EmailItem (HTML to text, signature, ...)
+    accept:      cheap filter deciding whether a message may be dispatched early
+    select:      final selection over all fetched messages (in fetch order)
+    extract_one: EmailItem -> export row (LLM call); runs in worker threads
+    on_row:      (message, row) once per row of the final selection, as soon as it is known to be final
+    Returns (selected messages, rows in the same order).
+    """
+    return asyncio.run(_run(raw_source, prepare, accept, select, extract_one, max_emails, on_row))
+
+
+async def _run(raw_source, prepare, accept, select, extract_one, max_emails, on_row):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(
+        max_workers=LLM_CONCURRENCY + PIPELINE_PREP_WORKERS + 1, thread_name_prefix="pipe"))
+    raw_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    llm_q: asyncio.Queue = asyncio.Queue()
+
+    arrived: List[Tuple[int, EmailItem]] = []
+    newest: Dict[str, EmailItem] = {}   # conversation -> newest message seen so far
+    top: List = []                      # min-heap of the newest `max_emails` received times
+    results: Dict[int, dict] = {}       # id(em) -> row
+    queued: Set[int] = set()
+    running: Set[int] = set()
+    final_ids: Optional[Set[int]] = None
+
+    def enqueue(em: EmailItem) -> None:
+        if id(em) in queued or id(em) in running or id(em) in results:
+            return
+        queued.add(id(em))
+        llm_q.put_nowait(em)
+
+    def consider(em: EmailItem) -> None:
+        if max_emails:
+            if len(top) >= max_emails:
+                if em.received <= top[0]:
+                    return  # older than everything kept so far
+                heapq.heappushpop(top, em.received)
+            else:
+                heapq.heappush(top, em.received)
+        key = conversation_key(em)
+        cur = newest.get(key)
+        if cur is not None and em.received < cur.received:
+            return
+        newest[key] = em
+        enqueue(em)
+
+    def fetch() -> None:
+        try:
+            for seq, (em, body_src) in enumerate(raw_source()):
+                asyncio.run_coroutine_threadsafe(raw_q.put((seq, em, body_src)), loop).result()
+        finally:
+            for _ in range(PIPELINE_PREP_WORKERS):
+                asyncio.run_coroutine_threadsafe(raw_q.put(None), loop).result()
+
+    async def prep_worker() -> None:
+        while True:
+            item = await raw_q.get()
+            if item is None:
+                return
+            seq, em, body_src = item
+            try:
+                em = await asyncio.to_thread(prepare, em, body_src)
+            except Exception as e:
+                print(f"[skip] Failed reading an item: {e}")
+                continue
+            arrived.append((seq, em))
+            if accept(em):
+                consider(em)
+
+    async def llm_worker() -> None:
+        while True:
+            em = await llm_q.get()
+            if em is None:
+                return
+            queued.discard(id(em))
+            wanted = (id(em) in final_ids) if final_ids is not None \
+                else newest.get(conversation_key(em)) is em
+            if not wanted:
+                continue  # superseded by a newer message before it was sent
+            running.add(id(em))
+            try:
+                results[id(em)] = await asyncio.to_thread(extract_one, em)
+            finally:
+                running.discard(id(em))
+            if final_ids is not None and id(em) in final_ids and on_row is not None:
+                on_row(em, results[id(em)])
+            if final_ids is None:
+                done, total = len(results), len(newest)
+            else:
+                done, total = sum(1 for k in results if k in final_ids), len(final_ids)
+            print(f"Pokrok v praci na dopisech {done}/{total}")
+
+    workers = [asyncio.create_task(llm_worker()) for _ in range(LLM_CONCURRENCY)]
+    try:
+        await asyncio.gather(loop.run_in_executor(None, fetch),
+                             *[prep_worker() for _ in range(PIPELINE_PREP_WORKERS)])
+
+        arrived.sort(key=lambda x: x[0])
+        selected = select([em for _, em in arrived])
+        final_ids = {id(em) for em in selected}
+        for em in selected:
+            if id(em) in results:
+                if on_row is not None:
+                    on_row(em, results[id(em)])  # speculative result that made the final selection
+            else:
+                enqueue(em)
+        for _ in workers:
+            llm_q.put_nowait(None)
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+
+    discarded = sum(1 for k in results if k not in final_ids)
+    if discarded:
+        print(f"[i] Pipeline: {discarded} speculative LLM result(s) discarded (message superseded or capped)")
+    return selected, [results[id(em)] for em in selected]
@@ -3,11 +3,14 @@ from inspect import signature
 
 from typing import List, Dict, Tuple
 import os
+from utils import count_tokens, truncate_to_tokens
 
 _my_names  = [s.strip() for s in os.getenv("MY_NAME", "").split(",") if s.strip()]
 _my_emails = [s.strip().lower() for s in os.getenv("MY_EMAILS", "").split(",") if s.strip()]
 _rules_raw = os.getenv("PROMPT_RULES", "") or ""
 _my_rules = _rules_raw.replace("\\n", "\n").replace('\\"', '"').strip()
+# The configured rules ask for a free-text summary -> only the model can fill the row completely
+NOTE_REQUIRED = "PoznamkaKOsobe" in _my_rules
 # NEW: include client name to map into Excel header "Název Klienta"
 SCHEMA_KEYS_OSOBA = [
     "NazevKlienta",
@@ -25,6 +28,19 @@ SCHEMA_KEYS_OSOBA = [
 # Render a fixed-order JSON skeleton that the model must follow
 _schema_json_block_osoba = "{\n" + ",\n".join([f'  "{k}": ""' for k in SCHEMA_KEYS_OSOBA]) + "\n}"
 
+# Identity and field rules shared by the single and the packed prompt
+_identity_and_field_rules = f"""Identity rules (who is ME vs the CONTACT):
+- Treat these identities as ME and NEVER output ME as the contact person:
+  - jmena a prijmeni: {_my_names}
+  - emails: {_my_emails}
+- If the current message appears authored by ME (From matches ME, or signature matches ME), DO NOT extract ME. Extract the COUNTERPART instead:
+  - Prefer a single non‑ME person found in headers (From/To/Cc) or in the signature/body.
+  - If multiple candidates exist, pick the primary counterpart (the main recipient or the signer of the current message).
+- Never put ME's email/phone into output fields. If only ME's data is found, leave fields empty.
+
+Field notes:
+{_my_rules}"""
+
 # System prompt for extracting a single JSON object for a person
 SYSTEM_PROMPT_OSOBA = f"""
 You are an assistant that extracts structured company/client data from emails and returns it as a SINGLE JSON object.
@@ -36,17 +52,7 @@ Important rules:
 - Do not add or remove keys.
 - Return only the JSON, without any explanations or extra text.
 
-Identity rules (who is ME vs the CONTACT):
-- Treat these identities as ME and NEVER output ME as the contact person:
-  - jmena a prijmeni: {_my_names}
-  - emails: {_my_emails}
-- If the current message appears authored by ME (From matches ME, or signature matches ME), DO NOT extract ME. Extract the COUNTERPART instead:
-  - Prefer a single non‑ME person found in headers (From/To/Cc) or in the signature/body.
-  - If multiple candidates exist, pick the primary counterpart (the main recipient or the signer of the current message).
-- Never put ME's email/phone into output fields. If only ME's data is found, leave fields empty.
-
-Field notes:
-{_my_rules}
+{_identity_and_field_rules}
 
 
 
@@ -54,6 +60,32 @@ The JSON structure to follow:
 {_schema_json_block_osoba}
 """.strip()
 
+# Packed variant: several independent emails in one request, one result object per email
+_schema_json_block_osoba_multi = (
+    '{\n  "results": [\n    {\n      "index": 0,\n'
+    + ",\n".join([f'      "{k}": ""' for k in SCHEMA_KEYS_OSOBA])
+    + "\n    }\n  ]\n}"
+)
+
+SYSTEM_PROMPT_OSOBA_MULTI = f"""
+You are an assistant that extracts structured company/client data from SEVERAL independent emails and returns it as a SINGLE JSON object with a "results" array.
+
+Important rules:
+- The user message contains emails marked "EMAIL #<n>". Process each email on its own; never mix data between emails.
+- "results" must contain exactly one object per email. Each object starts with "index" (the integer <n> of its email).
+- The identity rules below apply to each email separately; "the current message" is the email being processed.
+- The remaining keys must match exactly and appear in the same order as listed below.
+- All values except "index" must be strings.
+- If the information is not available, use an empty string "".
+- Do not add or remove keys.
+- Return only the JSON, without any explanations or extra text.
+
+{_identity_and_field_rules}
+
+The JSON structure to follow:
+{_schema_json_block_osoba_multi}
+""".strip()
+
 # User prompt template for incoming message (full metadata + body of THIS email only)
 USER_PROMPT_TEMPLATE_INCOMING = """
 EMAIL METADATA
@@ -103,3 +135,91 @@ def make_prompts_for_message(msg: Dict, thread_messages: List[Dict]) -> Tuple[st
     return system_prompt, user_prompt
 
 
+# One email block inside a packed request
+USER_PROMPT_TEMPLATE_PACKED_ITEM = """
+=== EMAIL #{index} ===
+EMAIL METADATA
+- received: {received}
+- from: {sender}
+- to: {to}
+- cc: {cc}
+- subject: {subject}
+
+EMAIL BODY
+\"\"\"{body}\"\"\"
+
+EMAIL SIGNATURE
+\"\"\"{signature}\"\"\"
+""".strip()
+
+
+def make_prompts_for_messages(msgs: List[Dict]) -> Tuple[str, str]:
+    """
+    Build one packed prompt pair for several independent messages.
+
+    msgs: list of dicts with the same keys as in make_prompts_for_message.
+    The model answers {"results": [{"index": i, ...SCHEMA_KEYS_OSOBA}]},
+    where i is the position of the message in `msgs`.
+    """
+    blocks = [
+        USER_PROMPT_TEMPLATE_PACKED_ITEM.format(
+            index=i,
+            received=msg.get("received", ""),
+            sender=msg.get("sender", ""),
+            to=msg.get("to", ""),
+            cc=msg.get("cc", ""),
+            subject=msg.get("subject", ""),
+            body=msg.get("body", ""),
+            signature=msg.get("signature", ""),
+        )
+        for i, msg in enumerate(msgs)
+    ]
+    user_prompt = (
+        f"There are {len(msgs)} emails below (#0 to #{len(msgs) - 1}).\n\n"
+        + "\n\n".join(blocks)
+        + "\n\nReturn one object per email in \"results\". If a company name is present, put it into "
+          "\"NazevKlienta\". Extract the rest according to SYSTEM_PROMPT."
+    )
+    return SYSTEM_PROMPT_OSOBA_MULTI, user_prompt
+
+
+TRUNCATION_MARK = "\n[...]"
+
+
+def fit_message_to_budget(msg: Dict, max_tokens: int) -> Tuple[Dict, int]:
+    """
+    Prepare `msg` for make_prompts_for_message so that the whole request fits `max_tokens`.
+
+    - The signature is removed from the body when the body already contains it
+      (it is sent in its own section).
+    - The signature is kept whole if possible (capped at half of the free room).
+    - The body is cut from the end: the newest text is on top, quoted history below.
+    max_tokens <= 0 disables trimming.
+
+    Returns (new_msg, input_tokens) where input_tokens counts system + user prompt.
+    """
+    msg = dict(msg)
+    body = msg.get("body", "") or ""
+    sig = (msg.get("signature", "") or "").strip()
+    if sig:
+        pos = body.rfind(sig)
+        if pos != -1:
+            body = (body[:pos] + body[pos + len(sig):]).rstrip()
+    msg["body"] = body
+
+    system_prompt, user_prompt = make_prompts_for_message(msg, [])
+    total = count_tokens(system_prompt) + count_tokens(user_prompt)
+    if max_tokens <= 0 or total <= max_tokens:
+        return msg, total
+
+    _, empty_user = make_prompts_for_message(dict(msg, body="", signature=""), [])
+    room = max(0, max_tokens - count_tokens(system_prompt) - count_tokens(empty_user))
+    sig_cap = room // 2
+    if count_tokens(sig) > sig_cap:
+        sig = truncate_to_tokens(sig, sig_cap)
+    msg["signature"] = sig
+    body_room = room - count_tokens(sig) - count_tokens(TRUNCATION_MARK)
+    msg["body"] = truncate_to_tokens(body, body_room) + TRUNCATION_MARK
+
+    system_prompt, user_prompt = make_prompts_for_message(msg, [])
+    return msg, count_tokens(system_prompt) + count_tokens(user_prompt)
@@ -0,0 +1,129 @@
+"""
+Crash-safe checkpoint journal of the extraction loop (RUN_JOURNAL_PATH, JSON lines).
+
+Every finished row is appended (flushed and fsynced) as soon as it arrives,
+keyed by conversation ID + entry ID of the extracted message. A run started
+with `--resume` (or RUN_RESUME=true) reuses the rows of the interrupted run for conversations whose
+latest message is unchanged and calls the LLM only for the rest. `_ERROR` rows
+are not journaled, so they are retried. The journal is removed after a
+successful export; any other run starts a new one.
+"""
+import os
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from config import RUN_JOURNAL, RUN_JOURNAL_PATH
+from models import EmailItem
+from utils import conversation_key
+
+_f = None
+_state = {"on": False, "mode": "w", "reused": 0}
+_lock = threading.Lock()
+_rows: Dict[Tuple[str, str], dict] = {}
+
+
+def _key(em: EmailItem) -> Tuple[str, str]:
+    return conversation_key(em), em.entry_id or ""
+
+
+def _load() -> None:
+    bad = 0
+    with open(RUN_JOURNAL_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                _rows[(rec["conv"], rec["entry_id"])] = rec["row"]
+            except (ValueError, KeyError, TypeError):
+                bad += 1  # a line cut short by the crash
+    if bad:
+        print(f"[warn] Journal {RUN_JOURNAL_PATH}: {bad} unreadable line(s) ignored")
+
+
+def open_journal(resume: bool) -> int:
+    """Start journaling this run; with `resume` first load the previous run's rows.
+    The file is (re)written from the first finished row on. Returns the number of rows
+    available for reuse."""
+    if not RUN_JOURNAL:
+        return 0
+    _rows.clear()
+    exists = os.path.exists(RUN_JOURNAL_PATH)
+    if resume and exists:
+        _load()
+        print(f"[i] Resuming: {len(_rows)} row(s) from the interrupted run ({RUN_JOURNAL_PATH})")
+    elif resume:
+        print(f"[i] Nothing to resume (no journal at {RUN_JOURNAL_PATH})")
+    elif exists and os.path.getsize(RUN_JOURNAL_PATH):
+        print(f"[warn] {RUN_JOURNAL_PATH} holds rows of an unfinished run; they are discarded "
+              "(start with --resume or RUN_RESUME=true to reuse them)")
+    _state.update(on=True, mode="a" if resume else "w", reused=0)
+    return len(_rows)
+
+
+def _ends_with_newline() -> bool:
+    with open(RUN_JOURNAL_PATH, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _file():
+    global _f
+    if _f is None and _state["on"]:
+        try:
+            os.makedirs(os.path.dirname(RUN_JOURNAL_PATH) or ".", exist_ok=True)
+            _f = open(RUN_JOURNAL_PATH, _state["mode"], encoding="utf-8", newline="\n")
+            if _state["mode"] == "a" and _f.tell() and not _ends_with_newline():
+                _f.write("\n")  # terminate a line cut short by the crash
+        except OSError as e:
+            print(f"[warn] Run journal disabled ({RUN_JOURNAL_PATH}): {e}")
+            _state["on"] = False
+    return _f
+
+
+def journaled_row(em: EmailItem) -> Optional[dict]:
+    """Copy of the journaled row for this exact message, or None."""
+    with _lock:
+        row = _rows.get(_key(em))
+        if row is None:
+            return None
+        _state["reused"] += 1
+        return dict(row)
+
+
+def journal_rows(pairs: List[Tuple[EmailItem, dict]]) -> None:
+    """Append finished (message, row) pairs; rows already journaled or with `_ERROR` are skipped."""
+    if not _state["on"]:
+        return
+    with _lock:
+        lines = []
+        for em, row in pairs:
+            key = _key(em)
+            if row.get("_ERROR") or key in _rows:
+                continue
+            _rows[key] = dict(row)
+            lines.append(json.dumps({"conv": key[0], "entry_id": key[1], "row": row}, ensure_ascii=False, default=str))
+        f = _file() if lines else None
+        if f is None:
+            return
+        try:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        except OSError as e:
+            print(f"[warn] Run journal write failed: {e}")
+
+
+def reused_rows() -> int:
+    return _state["reused"]
+
+
+def close_journal(finished: bool) -> None:
+    """Close the journal; `finished` (export succeeded) removes it."""
+    global _f
+    with _lock:
+        if _f is not None:
+            _f.close()
+            _f = None
+        if finished and _state["on"] and os.path.exists(RUN_JOURNAL_PATH):
+            os.remove(RUN_JOURNAL_PATH)
+        _state["on"] = False
@@ -0,0 +1,94 @@
+"""
+Persistent state for incremental runs.
+- folders:       FolderPath -> newest ReceivedTime/EntryID already processed
+- conversations: ConversationID -> EntryID/ReceivedTime of the message last extracted
+
+A run fetches only items newer than the folder watermark and skips
+conversations whose latest message was already extracted. SYNC_MODE=full
+(or `--full`) ignores the state for fetching; it is still updated afterwards,
+but watermarks and conversation markers never move back in time.
+"""
+import os
+import json
+import datetime as dt
+from typing import Dict, List, Optional
+
+from config import SYNC_STATE_PATH, SYNC_KEEP_DAYS
+from models import EmailItem
+from utils import to_naive_local
+
+
+def load_state() -> dict:
+    if not os.path.exists(SYNC_STATE_PATH):
+        return {"folders": {}, "conversations": {}}
+    try:
+        with open(SYNC_STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception as e:
+        print(f"[warn] Unreadable sync state {SYNC_STATE_PATH} ({e}); doing a full run.")
+        return {"folders": {}, "conversations": {}}
+    state.setdefault("folders", {})
+    state.setdefault("conversations", {})
+    return state
+
+
+def save_state(state: dict) -> None:
+    os.makedirs(os.path.dirname(SYNC_STATE_PATH) or ".", exist_ok=True)
+    tmp = SYNC_STATE_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, SYNC_STATE_PATH)
+
+
+def folder_watermarks(state: dict) -> Dict[str, dt.datetime]:
+    return {path: dt.datetime.fromisoformat(v["received"]) for path, v in state["folders"].items()}
+
+
+def is_processed(state: dict, em: EmailItem) -> bool:
+    """True when this exact message was already the extracted one of its conversation."""
+    rec = state["conversations"].get(em.conversation_id or "")
+    return bool(rec and em.entry_id and rec.get("entry_id") == em.entry_id)
+
+
+def record_run(state: dict, fetched: List[EmailItem], selected: List[EmailItem], rows: List[dict],
+               unreadable: Optional[List[EmailItem]] = None) -> None:
+    """Advance folder watermarks and conversation markers after a successful export.
+
+    Conversations whose row carries `_ERROR` are not marked, and their folder's
+    watermark stays below the failed message so the next run fetches it again.
+    Messages in `unreadable` (body could not be read or parsed) are handled the same way.
+    """
+    failed_at: Dict[str, dt.datetime] = {}
+
+    def hold(em: EmailItem) -> None:
+        received = to_naive_local(em.received)
+        prev = failed_at.get(em.folder_path)
+        failed_at[em.folder_path] = received if prev is None else min(prev, received)
+
+    for em in unreadable or []:
+        hold(em)
+    for em, row in zip(selected, rows):
+        if row.get("_ERROR"):
+            hold(em)
+        elif em.conversation_id:
+            received = em.received.isoformat(timespec="seconds")
+            prev = state["conversations"].get(em.conversation_id)
+            if prev is None or prev.get("received", "") <= received:
+                state["conversations"][em.conversation_id] = {"entry_id": em.entry_id or "", "received": received}
+
+    newest: Dict[str, EmailItem] = {}
+    for em in fetched:
+        if em.folder_path and (em.folder_path not in newest or em.received > newest[em.folder_path].received):
+            newest[em.folder_path] = em
+    for path, em in newest.items():
+        rec = {"received": em.received.isoformat(timespec="seconds"), "entry_id": em.entry_id or ""}
+        if path in failed_at:
+            rec = {"received": (failed_at[path] - dt.timedelta(seconds=1)).isoformat(timespec="seconds"),
+                   "entry_id": ""}
+        prev = state["folders"].get(path)
+        if prev is None or dt.datetime.fromisoformat(prev["received"]) < dt.datetime.fromisoformat(rec["received"]):
+            state["folders"][path] = rec  # a --full run over an older window must not lower it
+
+    if SYNC_KEEP_DAYS > 0:
+        cutoff = (dt.datetime.now() - dt.timedelta(days=SYNC_KEEP_DAYS)).isoformat(timespec="seconds")
+        state["conversations"] = {k: v for k, v in state["conversations"].items() if v.get("received", "") >= cutoff}
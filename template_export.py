@@ -1,10 +1,19 @@
+import os
+import re
 import shutil
-from typing import List, Dict, Any, Tuple
-import pandas as pd
-from openpyxl import load_workbook
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import List, Dict, Any, Optional, Tuple
+from openpyxl import Workbook, load_workbook
+from openpyxl.formatting.formatting import ConditionalFormattingList
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.utils import get_column_letter
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.styles import PatternFill
 
+from config import CONTACT_FUZZY_THRESHOLD
+
 def _detect_header_row(ws: Worksheet, max_cols: int = 120, search_rows: int = 60) -> Tuple[int, List[str]]:
     """Detect a 2-row header: row1 = group, row2 = leaf; combine if both exist."""
     # r = 2  # old: force row 2 only
@@ -39,6 +48,82 @@ def _unmerge_data_area(ws: Worksheet, first_data_row: int = 3) -> None:
         ws.unmerge_cells(rng)
 
 
+HEADER_JSON_ALIASES: Dict[str, str] = {
+    # NEW first column mapping for client name
+    "NazevKlienta": "NazevKlienta",
+    "Název Klienta": "NazevKlienta",
+    "Název klienta*": "NazevKlienta",
+    "Prijmeni": "Prijmeni",
+    "Příjmení": "Prijmeni",
+    "Příjmení*":"Prijmeni",
+    "Jmeno": "Jmeno",
+    "Jméno": "Jmeno",
+    "TitulPred": "TitulPred",
+    "TitulZa": "TitulZa",
+    "Titul před": "TitulPred",
+    "Titul za": "TitulZa",
+    "Funkce": "Funkce",
+    "Tel1": "Tel1",
+    "Tel 1": "Tel1",
+    "Telefon": "Tel1",
+    "E-mail": "Email",
+    "Email": "Email",
+    "WWW": "WWW",
+    "PoznamkaKOsobe": "PoznamkaKOsobe",
+    "Poznámka k osobě": "PoznamkaKOsobe",
+}
+
+
+def _sheet(wb, sheet_name: str) -> Worksheet:
+    # If sheet_name is empty, use the first sheet
+    if not sheet_name:
+        return wb[wb.sheetnames[0]]
+    return wb[sheet_name]
+
+
+def _label_keys(labels: List[str], rows: List[Dict[str, Any]]) -> List[str]:
+    """Row key for every header label (aliases, then normalized text match)."""
+    # Build reverse lookup from source rows
+    src_keys_norm: Dict[str, str] = {}
+
+    def _normalize_name(s: str) -> str:
+        return "".join(ch for ch in str(s).lower() if ch.isalnum())
+
+    for k in set().union(*(r.keys() for r in rows)) if rows else set():
+        src_keys_norm[_normalize_name(k)] = k
+
+    keys: List[str] = []
+    for lbl in labels:
+        if lbl in HEADER_JSON_ALIASES:
+            keys.append(HEADER_JSON_ALIASES[lbl])
+            continue
+        # fallback by normalized text
+        n = _normalize_name(lbl)
+        key = src_keys_norm.get(n)
+        if not key and " | " in lbl:
+            # try the rightmost token of a multi-row header
+            right = lbl.split("|")[-1].strip()
+            key = src_keys_norm.get(_normalize_name(right))
+            if not key and right in HEADER_JSON_ALIASES:
+                key = HEADER_JSON_ALIASES[right]
+        keys.append(key if key else lbl)
+    return keys
+
+
+def _name_columns(labels: List[str]) -> Tuple[Optional[int], Optional[int]]:
+    """0-based (surname, name) column indexes, found by the leaf header text."""
+    name_col = None
+    surname_col = None
+    for j, lbl in enumerate(labels):
+        leaf = lbl.split("|")[-1].strip()  # rightmost part like "Jméno" or "Příjmení *"
+        n = _norm(leaf)
+        if n == "jmeno":
+            name_col = j
+        elif n == "prijmeni":
+            surname_col = j
+    return surname_col, name_col
+
+
 def export_rows_to_template(
     template_path: str,
     out_path: str,
@@ -54,12 +139,7 @@ def export_rows_to_template(
     """
     shutil.copyfile(template_path, out_path)
     wb = load_workbook(out_path)
-
-    # If sheet_name is empty, use the first sheet
-    if not sheet_name:
-        ws = wb[wb.sheetnames[0]]
-    else:
-        ws = wb[sheet_name]
+    ws = _sheet(wb, sheet_name)
 
     header_row, labels = _detect_header_row(ws)
     if not labels:
@@ -67,104 +147,222 @@ def export_rows_to_template(
     if start_row is None:
         start_row = header_row + 1
 
-    HEADER_JSON_ALIASES: Dict[str, str] = {
-        # NEW first column mapping for client name
-        "NazevKlienta": "NazevKlienta",
-        "Název Klienta": "NazevKlienta",
-        "Název klienta*": "NazevKlienta",
-        "Prijmeni": "Prijmeni",
-        "Příjmení": "Prijmeni",
-        "Příjmení*":"Prijmeni",
-        "Jmeno": "Jmeno",
-        "Jméno": "Jmeno",
-        "TitulPred": "TitulPred",
-        "TitulZa": "TitulZa",
-        "Titul před": "TitulPred",
-        "Titul za": "TitulZa",
-        "Funkce": "Funkce",
-        "Tel1": "Tel1",
-        "Tel 1": "Tel1",
-        "Telefon": "Tel1",
-        "E-mail": "Email",
-        "Email": "Email",
-        "WWW": "WWW",
-        "PoznamkaKOsobe": "PoznamkaKOsobe",
-        "Poznámka k osobě": "PoznamkaKOsobe",
-    }
+    keys = _label_keys(labels, rows)
+    aligned = [[r.get(k, "") for k in keys] for r in rows]
 
-    # Build reverse lookup from source rows
-    src_keys_norm: Dict[str, str] = {}
+    _unmerge_data_area(ws, first_data_row=start_row)
+    _write_values(ws, start_row, aligned)
 
-    def _normalize_name(s: str) -> str:
-        return "".join(ch for ch in str(s).lower() if ch.isalnum())
+    # Keep freeze panes if header occupies first two rows and data starts at row 3
+    if header_row == 2 and start_row == 3:
+        ws.freeze_panes = "A3"
 
-    for k in set().union(*(r.keys() for r in rows)) if rows else set():
-        src_keys_norm[_normalize_name(k)] = k
+    # --- highlight duplicate (Surname, Name) rows ---
+    surname_col, name_col = _name_columns(labels)
+    if name_col is not None and surname_col is not None:
+        dup_rows = _duplicate_rows(aligned, surname_col, name_col, start_row)
+        if dup_rows:
+            _highlight_rows(ws, dup_rows, len(labels))
+    wb.save(out_path)
 
-    label_to_key: Dict[str, str] = {}
-    for lbl in labels:
-        if lbl in HEADER_JSON_ALIASES:
-            label_to_key[lbl] = HEADER_JSON_ALIASES[lbl]
-        else:
-            # fallback by normalized text
-            n = _normalize_name(lbl)
-            key = src_keys_norm.get(n)
-            if not key and " | " in lbl:
-                # try the rightmost token of a multi-row header
-                right = lbl.split("|")[-1].strip()
-                key = src_keys_norm.get(_normalize_name(right))
-                if not key and right in HEADER_JSON_ALIASES:
-                    key = HEADER_JSON_ALIASES[right]
-            label_to_key[lbl] = key if key else lbl
-
-    aligned = [{lbl: r.get(label_to_key[lbl], "") for lbl in labels} for r in rows]
-    df = pd.DataFrame(aligned, columns=labels)
 
-    _unmerge_data_area(ws, first_data_row=start_row)
+def _norm(s: str) -> str:
+    s = "".join(ch for ch in unicodedata.normalize("NFKD", str(s)) if not unicodedata.combining(ch))
+    return re.sub(r"[^a-z0-9]+", "", s.lower())
 
-    r0 = start_row
-    for i, (_, s) in enumerate(df.iterrows(), start=r0):
-        for j, v in enumerate(s.tolist(), start=1):
-            ws.cell(row=i, column=j, value=v)
 
-    # Keep freeze panes if header occupies first two rows and data starts at row 3
-    if header_row == 2 and start_row == 3:
-        ws.freeze_panes = "A3"
+def _write_values(ws: Worksheet, start_row: int, aligned: List[List[Any]]) -> None:
+    """Write the value grid from `start_row` down. Empty values create no cell: the template's
+    data area is blank, and every written cell costs time when the workbook is saved."""
+    cell = ws.cell
+    for i, vals in enumerate(aligned, start=start_row):
+        for j, v in enumerate(vals, start=1):
+            if v is not None and v != "":
+                cell(row=i, column=j, value=v)
 
-        # --- highlight duplicate (Surname, Name) rows ---
-    import unicodedata, re
-    def norm(s: str) -> str:
-        s = "".join(ch for ch in unicodedata.normalize("NFKD", str(s)) if not unicodedata.combining(ch))
-        return re.sub(r"[^a-z0-9]+", "", s.lower())
 
-    name_col = None
-    surname_col = None
-    for j, lbl in enumerate(labels, start=1):
-        leaf = lbl.split("|")[-1].strip()  # rightmost part like "Jméno" or "Příjmení *"
-        n = norm(leaf)
-        if n == "jmeno":
-            name_col = j
-        elif n == "prijmeni":
-            surname_col = j
+def _duplicate_rows(aligned: List[List[Any]], surname_col: int, name_col: int, start_row: int) -> List[int]:
+    """Sheet rows whose (surname, name) pair occurs more than once, from the in-memory values."""
+    buckets: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    for r, vals in enumerate(aligned, start=start_row):
+        ln, fn = vals[surname_col], vals[name_col]
+        last_name = (str(ln).strip() if ln is not None else "")
+        first_name = (str(fn).strip() if fn is not None else "")
+        if last_name or first_name:
+            buckets[(last_name.lower(), first_name.lower())].append(r)
+    return sorted(rr for rr_list in buckets.values() if len(rr_list) > 1 for rr in rr_list)
+
+
+_DUP_FILL = "FFFFC7CE"  # ARGB light red
+
+
+def _highlight_rows(ws: Worksheet, sheet_rows: List[int], n_cols: int) -> None:
+    """One conditional-format rule (always true, light red fill) over all given rows;
+    consecutive rows are merged into one block of the multi-range sqref."""
+    last_col = get_column_letter(n_cols)
+    blocks: List[str] = []
+    first = prev = sheet_rows[0]
+    for r in sheet_rows[1:] + [None]:
+        if r is not None and r == prev + 1:
+            prev = r
+            continue
+        blocks.append(f"A{first}:{last_col}{prev}")
+        if r is not None:
+            first = prev = r
+    ws.conditional_formatting.add(" ".join(blocks), FormulaRule(formula=["TRUE"], fill=PatternFill(bgColor=_DUP_FILL)))
+
+
+def _drop_highlight(ws: Worksheet) -> None:
+    """Remove the duplicate rule added by an earlier run (other conditional formats are kept)."""
+    def ours(rule) -> bool:
+        fill = rule.dxf.fill if rule.dxf is not None else None
+        color = fill.bgColor.rgb if fill is not None and fill.bgColor is not None else None
+        return rule.type == "expression" and rule.formula == ["TRUE"] and color == _DUP_FILL
+
+    kept = ConditionalFormattingList()
+    for cf in ws.conditional_formatting:
+        for rule in cf.rules:
+            if not ours(rule):
+                kept.add(str(cf.sqref), rule)
+    ws.conditional_formatting = kept
+
+
+def _row_keys(email: Any, conv_id: Any) -> Tuple[str, List[str]]:
+    """Upsert keys of a row: its conversation ID and every address of its e-mail cell."""
+    conv = str(conv_id).strip() if conv_id not in (None, "") else ""
+    raw = str(email or "").replace(";", ",").replace(" ", ",")
+    return conv, [e.strip().lower() for e in raw.split(",") if "@" in e]
+
 
-    if name_col and surname_col:
-        from collections import defaultdict
-        buckets = defaultdict(list)
-        row_start = start_row
-        row_end = start_row + len(df) - 1
-        for r in range(row_start, row_end + 1):
-            ln = ws.cell(row=r, column=surname_col).value
-            fn = ws.cell(row=r, column=name_col).value
-            last_name = (str(ln).strip() if ln is not None else "")
-            first_name = (str(fn).strip() if fn is not None else "")
-            if last_name or first_name:
-                buckets[(last_name.lower(), first_name.lower())].append(r)
-
-        dup_rows = {rr for rr_list in buckets.values() if len(rr_list) > 1 for rr in rr_list}
+def _name_key(surname: Any, name: Any) -> str:
+    return " ".join(p for p in (_norm(surname or ""), _norm(name or "")) if p)
+
+
+def _name_score(a: str, b: str) -> float:
+    """Similarity of two name keys; 1.0 when either is empty (nothing to contradict)."""
+    if not a or not b or a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _new_master(path: str, template_path: Optional[str], columns: List[str]) -> None:
+    """Create the master from the template, or a plain sheet with the header in row 2."""
+    if template_path:
+        shutil.copyfile(template_path, path)
+        return
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Analysis"
+    for j, k in enumerate(columns, start=1):
+        ws.cell(row=2, column=j, value=k)
+    ws.freeze_panes = "A3"
+    wb.save(path)
+
+
+def upsert_rows_into_workbook(
+    master_path: str,
+    template_path: Optional[str],
+    sheet_name: str,
+    rows: List[Dict[str, Any]],
+    columns: List[str],
+) -> Dict[str, int]:
+    """
+    Append or update `rows` in an existing master workbook instead of writing a new file.
+    - The master is created on first use (template copy, or `columns` as a plain header).
+    - Existing rows are matched by conversation ID (when the sheet has a _CONV_ID column),
+      else by e-mail address when the names agree too (shared addresses such as info@
+      belong to several people); a match gets its non-empty new values, others are
+      appended after the last used row.
+    - The sheet is read once (values only) to index keys, the last row and names for
+      duplicate highlighting, which is recomputed over the whole sheet.
+    - Saved through a temporary file, so a failed save leaves the master intact.
+    Returns counts: appended / updated / unchanged.
+    """
+    if not os.path.exists(master_path):
+        _new_master(master_path, template_path, columns)
+        print(f"[i] Created master workbook: {master_path}")
+    wb = load_workbook(master_path)
+    ws = _sheet(wb, sheet_name)
+
+    header_row, labels = _detect_header_row(ws)
+    if not labels:
+        raise RuntimeError(f"Header not detected in {master_path}.")
+    keys = _label_keys(labels, rows)
+    n_cols = len(labels)
+    email_col = keys.index("Email") if "Email" in keys else None
+    conv_col = keys.index("_CONV_ID") if "_CONV_ID" in keys else None
+    surname_col, name_col = _name_columns(labels)
+
+    # Single pass over the existing data area
+    first_row = header_row + 1
+    last_row = header_row
+    by_conv: Dict[str, int] = {}
+    by_email: Dict[str, List[int]] = defaultdict(list)
+    names: Dict[int, Tuple[Any, Any]] = {}
+
+    def index(r: int, conv: str, emails: List[str]) -> None:
+        if conv:
+            by_conv.setdefault(conv, r)
+        for e in emails:
+            if r not in by_email[e]:
+                by_email[e].append(r)
+
+    for r, vals in enumerate(ws.iter_rows(min_row=first_row, max_col=n_cols, values_only=True), start=first_row):
+        if not any(v not in (None, "") for v in vals):
+            continue
+        last_row = r
+        index(r, *_row_keys(vals[email_col] if email_col is not None else None,
+                            vals[conv_col] if conv_col is not None else None))
+        if surname_col is not None and name_col is not None:
+            names[r] = (vals[surname_col], vals[name_col])
+
+    def by_address(emails: List[str], key: str) -> Optional[int]:
+        scores = {r: _name_score(key, _name_key(*names.get(r, ("", "")))) for e in emails for r in by_email.get(e, ())}
+        scores = {r: sc for r, sc in scores.items() if sc >= CONTACT_FUZZY_THRESHOLD}
+        return min(scores, key=lambda r: (-scores[r], r)) if scores else None
+
+    _unmerge_data_area(ws, first_data_row=first_row)
+    counts = {"appended": 0, "updated": 0, "unchanged": 0}
+    cell = ws.cell
+    for row in rows:
+        vals = [row.get(k, "") for k in keys]
+        conv, emails = _row_keys(row.get("Email"), row.get("_CONV_ID"))
+        target = by_conv.get(conv) if conv else None
+        if target is None:
+            target = by_address(emails, _name_key(row.get("Prijmeni"), row.get("Jmeno")))
+        if target is None:
+            last_row += 1
+            target = last_row
+            _write_values(ws, target, [vals])
+            counts["appended"] += 1
+        else:
+            changed = False
+            for j, v in enumerate(vals, start=1):
+                if v is None or v == "":
+                    continue
+                c = cell(row=target, column=j)
+                if c.value is None or str(c.value) != str(v):
+                    c.value = v
+                    changed = True
+            counts["updated" if changed else "unchanged"] += 1
+        index(target, conv, emails)
+        if surname_col is not None and name_col is not None:
+            names[target] = (cell(row=target, column=surname_col + 1).value,
+                             cell(row=target, column=name_col + 1).value)
+
+    _drop_highlight(ws)
+    if names:
+        by_row = sorted(names)
+        grid = [[names[r][0], names[r][1]] for r in by_row]
+        dup_rows = [by_row[i - first_row] for i in _duplicate_rows(grid, 0, 1, first_row)]
         if dup_rows:
-            # ARGB light red
-            fill = PatternFill(start_color="FFFFC7CE", end_color="FFFFC7CE", fill_type="solid")
-            for r in dup_rows:
-                for c in range(1, len(labels) + 1):
-                    ws.cell(row=r, column=c).fill = fill
-    wb.save(out_path)
+            _highlight_rows(ws, dup_rows, n_cols)
+
+    tmp_path = master_path + ".tmp"
+    try:
+        wb.save(tmp_path)
+        os.replace(tmp_path, master_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return counts
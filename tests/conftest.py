@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeApi:
+    """Local HTTP server standing in for the OpenAI API. A test sets `handle(method, path, body)`
+    returning (status, headers, body) with body a dict (sent as JSON) or str; every request is
+    recorded in `requests` as (method, path, body bytes)."""
+
+    def __init__(self):
+        self.requests = []
+        self.handle = lambda method, path, body: (404, {}, {"error": {"message": "not found"}})
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _serve(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                api.requests.append((self.command, self.path, body))
+                status, headers, payload = api.handle(self.command, self.path, body)
+                data = (payload if isinstance(payload, str) else json.dumps(payload)).encode("utf-8")
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def paths(self, method=None):
+        return [p for m, p, _ in self.requests if method is None or m == method]
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    import gpt_client
+    api = FakeApi()
+    monkeypatch.setattr(gpt_client, "OPENAI_BASE_URL", api.url)
+    monkeypatch.setattr(gpt_client, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(gpt_client, "_session", None)
+    monkeypatch.setattr(gpt_client, "_stats", dict(gpt_client._stats, retries=0))
+    yield api
+    api.server.shutdown()
+    api.server.server_close()
+
+
+@pytest.fixture
+def llm_cache_db(monkeypatch, tmp_path):
+    """Enable the LLM cache on a fresh SQLite file for this test."""
+    import llm_cache
+    monkeypatch.setattr(llm_cache, "LLM_CACHE", True)
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_PATH", str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setattr(llm_cache, "_conn", None)
+    yield llm_cache
+    if llm_cache._conn is not None:
+        llm_cache._conn.close()
@@ -0,0 +1,114 @@
+"""
+Batch API client (batch_client.run_batch) against a fake /files + /batches server:
+submission, resume of a pending job and caching before the job state is cleared.
+"""
+import json
+
+import pytest
+
+import batch_client
+from config import OPENAI_MODEL
+from llm_cache import cache_get, cache_key
+from prompts import SCHEMA_KEYS_OSOBA
+
+PROMPTS = {cid: ("system", f"user prompt {cid}") for cid in ("a", "b", "c")}
+
+
+def _reply(cid):
+    obj = {k: "" for k in SCHEMA_KEYS_OSOBA}
+    obj["Prijmeni"] = f"Person {cid}"
+    return obj
+
+
+class FakeBatches:
+    """Minimal /files + /batches endpoints; every batch completes at once, custom_ids in `fail` get HTTP 500."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.inputs = {}    # file_id -> custom_ids of the uploaded JSONL
+        self.batches = {}   # batch_id -> input file_id
+
+    def add_batch(self, batch_id, custom_ids):
+        self.inputs[f"in-{batch_id}"] = list(custom_ids)
+        self.batches[batch_id] = f"in-{batch_id}"
+
+    def _output(self, batch_id):
+        lines = []
+        for cid in self.inputs[self.batches[batch_id]]:
+            if cid in self.fail:
+                resp = {"status_code": 500, "body": {"error": {"message": "server error"}}}
+            else:
+                content = json.dumps(_reply(cid))
+                resp = {"status_code": 200, "body": {"choices": [{"message": {"content": content}}]}}
+            lines.append(json.dumps({"custom_id": cid, "response": resp}))
+        return "\n".join(lines) + "\n"
+
+    def __call__(self, method, path, body):
+        if method == "POST" and path == "/v1/files":
+            cids = [json.loads(ln)["custom_id"] for ln in body.decode("utf-8").splitlines()
+                    if ln.startswith('{"custom_id"')]
+            file_id = f"file-{len(self.inputs) + 1}"
+            self.inputs[file_id] = cids
+            return 200, {}, {"id": file_id}
+        if method == "POST" and path == "/v1/batches":
+            batch_id = f"batch-{len(self.batches) + 1}"
+            self.batches[batch_id] = json.loads(body)["input_file_id"]
+            return 200, {}, {"id": batch_id}
+        if method == "GET" and path.startswith("/v1/batches/"):
+            batch_id = path.rsplit("/", 1)[1]
+            n = len(self.inputs[self.batches[batch_id]])
+            return 200, {}, {"id": batch_id, "status": "completed", "output_file_id": f"out-{batch_id}",
+                             "request_counts": {"total": n, "completed": n, "failed": 0}}
+        if method == "GET" and path.startswith("/v1/files/out-"):
+            return 200, {}, self._output(path.split("/")[3][len("out-"):])
+        return 404, {}, {"error": {"message": "not found"}}
+
+
+@pytest.fixture
+def batch_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(batch_client, "BATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(batch_client, "_STATE_FILE", str(tmp_path / "batch_state.json"))
+    return tmp_path
+
+
+def _pending_state(batch_id, cids):
+    batch_client._save_state({"batch_id": batch_id, "created": "2026-10-01T10:00:00",
+                              "keys": {cid: cache_key(OPENAI_MODEL, *PROMPTS[cid]) for cid in cids}})
+
+
+def test_submit_collect_and_cache(fake_api, llm_cache_db, batch_dir):
+    fake = FakeBatches()
+    fake_api.handle = fake
+    results, errors = batch_client.run_batch(PROMPTS)
+    assert errors == {}
+    assert results == {cid: _reply(cid) for cid in PROMPTS}
+    assert cache_get(OPENAI_MODEL, *PROMPTS["b"]) == _reply("b")
+    assert not (batch_dir / "batch_state.json").exists()
+
+
+def test_resume_reuses_successes_and_resubmits_failures(fake_api, llm_cache_db, batch_dir):
+    fake = FakeBatches(fail={"b"})
+    fake.add_batch("batch-0", ["a", "b"])
+    fake_api.handle = fake
+    _pending_state("batch-0", ["a", "b"])
+    results, errors = batch_client.run_batch(PROMPTS)
+    assert fake.inputs["file-2"] == ["b", "c"]   # "a" is not paid for twice
+    assert set(results) == {"a", "c"}
+    assert set(errors) == {"b"}                   # still failing in the new job
+    assert cache_get(OPENAI_MODEL, *PROMPTS["a"]) == _reply("a")
+
+
+def test_results_are_cached_before_state_is_cleared(fake_api, llm_cache_db, batch_dir, monkeypatch):
+    fake = FakeBatches()
+    fake.add_batch("batch-0", ["a", "b", "c"])
+    fake_api.handle = fake
+
+    def crash():
+        raise KeyboardInterrupt  # process dies right after collecting the resumed job
+
+    monkeypatch.setattr(batch_client, "_clear_state", crash)
+    _pending_state("batch-0", ["a", "b", "c"])
+    with pytest.raises(KeyboardInterrupt):
+        batch_client.run_batch(PROMPTS)
+    assert (batch_dir / "batch_state.json").exists()  # the job is not forgotten
+    assert all(cache_get(OPENAI_MODEL, *PROMPTS[cid]) == _reply(cid) for cid in PROMPTS)
@@ -0,0 +1,65 @@
+"""
+Cross-run contact index (contact_store.merge_rows): matching, merging and
+re-indexing of changed contacts.
+"""
+import pytest
+
+import contact_store
+from prompts import SCHEMA_KEYS_OSOBA
+
+
+def _row(**kw):
+    row = {k: "" for k in SCHEMA_KEYS_OSOBA}
+    row.update(kw)
+    return row
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(contact_store, "CONTACT_STORE", True)
+    monkeypatch.setattr(contact_store, "CONTACT_STORE_PATH", str(tmp_path / "contacts.sqlite"))
+    monkeypatch.setattr(contact_store, "_conn", None)
+    monkeypatch.setattr(contact_store, "_created", set())
+    monkeypatch.setattr(contact_store, "_changed", set())
+    yield contact_store
+    if contact_store._conn is not None:
+        contact_store._conn.close()
+
+
+def _keys(cid):
+    return set(contact_store._conn.execute(
+        "SELECT kind, value FROM contact_keys WHERE contact_id = ?", (cid,)).fetchall())
+
+
+def test_same_person_is_known_across_rows(store):
+    a = _row(Jmeno="Petr", Prijmeni="Svoboda", Email="petr@firma.cz")
+    b = _row(Jmeno="Petr", Prijmeni="Svoboda", Email="PETR@firma.cz", Tel1="+420 777 111 222")
+    store.merge_rows([a])
+    store.commit_contacts()
+    store._created.clear()
+    assert store.merge_rows([b]) == {"new": 0, "changed": 1, "known": 0}
+    assert a["_CONTACT_ID"] == b["_CONTACT_ID"]
+
+
+def test_changed_contact_drops_its_old_keys(store):
+    old = _row(Jmeno="Petr", Prijmeni="Svoboda", Email="petr@firma.cz", Tel1="777111222")
+    new = _row(Jmeno="Petr", Prijmeni="Svoboda", Email="petr.svoboda@firma.cz", Tel1="777333444")
+    store.merge_rows([old, new])
+    cid = old["_CONTACT_ID"]
+    assert new["_CONTACT_ID"] == cid
+    keys = _keys(cid)
+    assert ("email", "petr.svoboda@firma.cz") in keys and ("phone", "777333444") in keys
+    assert ("email", "petr@firma.cz") not in keys and ("phone", "777111222") not in keys
+
+    # the old number now belongs to someone else: no false match to Petr
+    other = _row(Jmeno="Jana", Prijmeni="Dvořáková", Tel1="777111222")
+    store.merge_rows([other])
+    assert other["_CONTACT"] == "new" and other["_CONTACT_ID"] != cid
+
+
+def test_disabled_store_leaves_rows_alone(monkeypatch):
+    monkeypatch.setattr(contact_store, "CONTACT_STORE", False)
+    monkeypatch.setattr(contact_store, "_conn", None)
+    row = _row(Jmeno="Petr", Prijmeni="Svoboda")
+    assert contact_store.merge_rows([row]) == {"new": 0, "changed": 0, "known": 0}
+    assert "_CONTACT" not in row
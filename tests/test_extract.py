@@ -0,0 +1,69 @@
+"""
+Row extraction in main: the worker pool, packed requests and their per-email fallback.
+"""
+import datetime as dt
+import threading
+
+import pytest
+
+import main
+from prompts import SCHEMA_KEYS_OSOBA
+
+
+def _em(i):
+    return main.EmailItem(received=dt.datetime(2026, 10, 1, 10, i), subject=f"nabídka {i}",
+                          sender=f"Jan Novák <jan{i}@firma.cz>", to_recipients="", cc_recipients="",
+                          body_text=f"Dobrý den, posílám nabídku {i}.", conversation_id=f"conv{i}",
+                          entry_id=f"e{i}", is_incoming=True)
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    monkeypatch.setattr(main, "cache_get", lambda *a: None)
+    monkeypatch.setattr(main, "cache_put", lambda *a: None)
+    monkeypatch.setattr(main, "_token_stats", {"requests": 0, "input_tokens": 0, "trimmed": 0, "stripped_bytes": 0})
+
+
+def test_packed_fallback_builds_each_prompt_once(monkeypatch, no_cache):
+    calls = []
+
+    def fake_gpt(system_prompt, user_prompt, packed=False):
+        calls.append(packed)
+        if packed:
+            raise ValueError("broken packed reply")
+        return {k: "" for k in SCHEMA_KEYS_OSOBA}
+
+    monkeypatch.setattr(main, "call_gpt_with_prompts", fake_gpt)
+    rows = main._extract_packed({0: _em(0), 1: _em(1)})
+    assert calls == [True, False, False]
+    assert sorted(rows) == [0, 1] and not any(r.get("_ERROR") for r in rows.values())
+    assert main._token_stats["requests"] == 2   # one prompt per email, not rebuilt by the fallback
+
+
+def test_pool_keeps_selection_order_and_isolates_failures(monkeypatch, no_cache):
+    monkeypatch.setattr(main, "LLM_CONCURRENCY", 4)
+    monkeypatch.setattr(main, "LLM_PACK_SIZE", 1)
+    done = [threading.Event() for _ in range(4)]
+    finished = []
+
+    def fake_gpt(system_prompt, user_prompt, packed=False):
+        i = next(i for i in range(4) if f"nabídku {i}." in user_prompt)
+        try:
+            if i < 3:   # finish in reverse order: 3, 2, 1, 0
+                assert done[i + 1].wait(5), "extraction did not run concurrently"
+            if i == 3:
+                raise RuntimeError("HTTP 500")
+            obj = {k: "" for k in SCHEMA_KEYS_OSOBA}
+            obj["Prijmeni"] = f"Novák {i}"
+            return obj
+        finally:
+            finished.append(i)
+            done[i].set()
+
+    monkeypatch.setattr(main, "call_gpt_with_prompts", fake_gpt)
+    streamed = []
+    rows = main._extract_rows([_em(i) for i in range(4)], on_rows=streamed.extend)
+    assert finished == [3, 2, 1, 0]
+    assert [r["Prijmeni"] for r in rows[:3]] == ["Novák 0", "Novák 1", "Novák 2"]
+    assert "HTTP 500" in rows[3]["_ERROR"]
+    assert len(streamed) == 4
@@ -0,0 +1,83 @@
+"""
+HTTP layer of gpt_client: retry delays, 429 handling and streamed replies against a fake server.
+"""
+import json
+
+import requests
+import pytest
+
+import gpt_client
+from prompts import SCHEMA_KEYS_OSOBA
+
+
+def _response(status, headers=None):
+    r = requests.Response()
+    r.status_code = status
+    r.headers.update(headers or {})
+    return r
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr(gpt_client.time, "sleep", slept.append)
+    monkeypatch.setattr(gpt_client, "LLM_BACKOFF_BASE", 1.0)
+    monkeypatch.setattr(gpt_client, "LLM_BACKOFF_MAX", 5.0)
+    return slept
+
+
+def test_server_hint_is_not_capped(no_sleep):
+    delay = gpt_client._retry_delay(_response(429, {"Retry-After": "120"}), 0)
+    assert 120 <= delay <= 121
+
+
+def test_ratelimit_reset_header(no_sleep):
+    delay = gpt_client._retry_delay(_response(429, {"x-ratelimit-reset-requests": "1m30s"}), 0)
+    assert 90 <= delay <= 91
+
+
+def test_backoff_without_hint_is_capped(no_sleep):
+    assert all(0 <= gpt_client._retry_delay(_response(503), attempt) <= 5.0 for attempt in range(10))
+
+
+def test_429_is_retried_after_retry_after(fake_api, no_sleep):
+    replies = [(429, {"Retry-After": "7"}, {"error": {"message": "rate limited"}}),
+               (200, {}, {"id": "ok"})]
+    fake_api.handle = lambda method, path, body: replies.pop(0)
+    r = gpt_client.api_request("GET", "/models")
+    assert r.json() == {"id": "ok"}
+    assert len(no_sleep) == 1 and 7 <= no_sleep[0] <= 8
+    assert gpt_client.run_stats()["retries"] == 1
+
+
+def test_non_retryable_status_raises_at_once(fake_api, no_sleep):
+    fake_api.handle = lambda method, path, body: (401, {}, {"error": {"message": "bad key"}})
+    with pytest.raises(requests.HTTPError):
+        gpt_client.api_request("GET", "/models")
+    assert no_sleep == [] and len(fake_api.requests) == 1
+
+
+def _sse(*deltas):
+    events = [{"choices": [{"delta": {"content": d}}]} for d in deltas]
+    return "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+
+
+def test_object_end_across_chunks_ignores_braces_in_strings():
+    state = {"depth": 0, "in_str": False, "esc": False}
+    assert gpt_client._object_end('{"a": "x}', state) == -1
+    assert gpt_client._object_end('\\" {", "b": {}', state) == -1
+    assert gpt_client._object_end('}\n\nDone.', state) == 1
+
+
+def test_stream_stops_at_end_of_json(fake_api, monkeypatch):
+    monkeypatch.setattr(gpt_client, "LLM_STREAM", True)
+    monkeypatch.setattr(gpt_client, "_stats", dict(gpt_client._stats, streamed=0, early_stops=0))
+    obj = {k: "" for k in SCHEMA_KEYS_OSOBA}
+    obj["Prijmeni"] = "Novák {ml.}"
+    text = json.dumps(obj, ensure_ascii=False)
+    fake_api.handle = lambda method, path, body: (200, {"Content-Type": "text/event-stream"},
+                                                  _sse(text[:10], text[10:], " Hope this helps!", "{"))
+    assert gpt_client.call_gpt_with_prompts("sys", "user") == obj
+    assert json.loads(fake_api.requests[0][2])["stream"] is True
+    stats = gpt_client.run_stats()
+    assert stats["streamed"] == 1 and stats["early_stops"] == 1
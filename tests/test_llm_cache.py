@@ -0,0 +1,71 @@
+"""
+Content-addressed LLM response cache (llm_cache): hits, misses, expiry and eviction.
+"""
+import time
+
+import llm_cache
+from llm_cache import cache_get, cache_put, cache_evict, cache_key
+
+OBJ = {"Prijmeni": "Novák", "Email": "jan@firma.cz"}
+
+
+def _age(key, days):
+    llm_cache._conn.execute("UPDATE responses SET created = ?, last_used = ? WHERE key = ?",
+                            (time.time() - days * 86400,) * 2 + (key,))
+    llm_cache._conn.commit()
+
+
+def test_hit_after_put_and_miss_on_other_prompt(llm_cache_db, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_stats", {"hits": 0, "misses": 0, "stores": 0})
+    assert cache_get("m", "sys", "user") is None
+    cache_put("m", "sys", "user", OBJ)
+    assert cache_get("m", "sys", "user") == OBJ
+    assert cache_get("m", "sys", "user 2") is None
+    assert cache_get("other-model", "sys", "user") is None
+    assert llm_cache.cache_stats() == {"hits": 1, "misses": 3, "stores": 1}
+
+
+def test_key_separates_prompt_boundaries():
+    assert cache_key("m", "ab", "c") != cache_key("m", "a", "bc")
+
+
+def test_empty_result_is_not_cached(llm_cache_db):
+    cache_put("m", "sys", "user", {})
+    assert cache_get("m", "sys", "user") is None
+
+
+def test_expired_entry_is_a_miss_and_evicted(llm_cache_db, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_AGE_DAYS", 30)
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_ENTRIES", 0)
+    cache_put("m", "sys", "old", OBJ)
+    cache_put("m", "sys", "fresh", OBJ)
+    _age(cache_key("m", "sys", "old"), 31)
+    assert cache_get("m", "sys", "old") is None
+    assert cache_get("m", "sys", "fresh") == OBJ
+    assert cache_evict() == 1
+
+
+def test_no_expiry_when_max_age_is_zero(llm_cache_db, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_AGE_DAYS", 0)
+    cache_put("m", "sys", "old", OBJ)
+    _age(cache_key("m", "sys", "old"), 3650)
+    assert cache_get("m", "sys", "old") == OBJ
+
+
+def test_evict_keeps_most_recently_used(llm_cache_db, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_AGE_DAYS", 0)
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_ENTRIES", 2)
+    for i, days in enumerate((3, 2, 1)):
+        cache_put("m", "sys", f"u{i}", OBJ)
+        _age(cache_key("m", "sys", f"u{i}"), days)
+    assert cache_get("m", "sys", "u0") == OBJ   # touched now, so u1 is the least recently used
+    assert cache_evict() == 1
+    assert cache_get("m", "sys", "u1") is None
+    assert cache_get("m", "sys", "u0") == OBJ and cache_get("m", "sys", "u2") == OBJ
+
+
+def test_disabled_cache(monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE", False)
+    monkeypatch.setattr(llm_cache, "_conn", None)
+    cache_put("m", "sys", "user", OBJ)
+    assert cache_get("m", "sys", "user") is None and cache_evict() == 0
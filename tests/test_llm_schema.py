@@ -0,0 +1,80 @@
+"""
+Structured output (llm_schema + gpt_client.call_gpt_with_prompts): local repair,
+json_schema -> json_object fallback and the re-ask of unusable replies.
+"""
+import json
+
+import pytest
+import requests
+
+import gpt_client
+import llm_schema
+from prompts import SCHEMA_KEYS_OSOBA
+
+
+def _person(**kw):
+    obj = {k: "" for k in SCHEMA_KEYS_OSOBA}
+    obj.update(kw)
+    return obj
+
+
+def _chat(content):
+    return 200, {}, {"choices": [{"message": {"content": content}}]}
+
+
+@pytest.fixture
+def schema_on(monkeypatch, fake_api):
+    monkeypatch.setattr(llm_schema, "_schema_supported", {"on": True})
+    monkeypatch.setattr(llm_schema, "_stats", dict.fromkeys(llm_schema._stats, 0))
+    monkeypatch.setattr(gpt_client, "LLM_STREAM", False)
+    monkeypatch.setattr(gpt_client, "LLM_REASK", 1)
+    return fake_api
+
+
+def _formats(api):
+    return [json.loads(body)["response_format"]["type"] for m, p, body in api.requests if p.endswith("/chat/completions")]
+
+
+def test_parse_reply_repairs_locally():
+    obj, status, _ = llm_schema.parse_reply('```json\n{"Prijmeni": "Novák", "Tel1": 777111222}\n```')
+    assert status == "repaired"
+    assert obj["Prijmeni"] == "Novák" and obj["Tel1"] == "777111222" and obj["Email"] == ""
+
+
+def test_parse_reply_rejects_non_json():
+    assert llm_schema.parse_reply("Sorry, I cannot help with that.") == (None, "invalid", ["reply is not parseable JSON"])
+
+
+def test_rejected_json_schema_falls_back_to_json_object(schema_on):
+    def handle(method, path, body):
+        if json.loads(body)["response_format"]["type"] == "json_schema":
+            return 400, {}, {"error": {"message": "Invalid parameter: response_format json_schema is not supported"}}
+        return _chat(json.dumps(_person(Prijmeni="Novák")))
+
+    schema_on.handle = handle
+    assert gpt_client.call_gpt_with_prompts("sys", "user")["Prijmeni"] == "Novák"
+    assert gpt_client.call_gpt_with_prompts("sys", "user 2")["Prijmeni"] == "Novák"
+    assert _formats(schema_on) == ["json_schema", "json_object", "json_object"]  # asked once per run
+
+
+def test_other_400_is_not_a_schema_rejection(schema_on):
+    schema_on.handle = lambda method, path, body: (400, {}, {"error": {"message": "context length exceeded"}})
+    with pytest.raises(requests.HTTPError):
+        gpt_client.call_gpt_with_prompts("sys", "user")
+    assert llm_schema._schema_supported["on"] and len(schema_on.requests) == 1
+
+
+def test_unusable_reply_is_reasked_without_the_email(schema_on):
+    replies = [_chat('{"Prijmeni": {"value": "Novák"}}'), _chat(json.dumps(_person(Prijmeni="Novák")))]
+    schema_on.handle = lambda method, path, body: replies.pop(0)
+    assert gpt_client.call_gpt_with_prompts("sys", "EMAIL BODY")["Prijmeni"] == "Novák"
+    fix = json.loads(schema_on.requests[1][2])["messages"]
+    assert "EMAIL BODY" not in json.dumps(fix) and "Novák" in fix[-1]["content"]
+    assert llm_schema.schema_stats()["reasked"] == 1
+
+
+def test_reply_still_broken_after_reask_raises(schema_on):
+    schema_on.handle = lambda method, path, body: _chat("no json here")
+    with pytest.raises(ValueError):
+        gpt_client.call_gpt_with_prompts("sys", "user")
+    assert len(schema_on.requests) == 2 and llm_schema.schema_stats()["failed"] == 1
@@ -0,0 +1,34 @@
+"""
+Offline mail sources (mail_sources): header scan of .eml files and mbox archives.
+"""
+import os
+import datetime as dt
+
+from mail_sources import EmlDirSource, MboxSource
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "eml")
+FROM = dt.datetime(2026, 10, 1)
+
+
+def _check(em):
+    assert em.sender == "Novák Jan <jan.novak@firma.cz>"
+    assert em.subject == "Nabídka – příloha"
+    assert em.conversation_id == "raw-utf8-1@firma.cz"
+
+
+def test_eml_raw_utf8_header():
+    items = list(EmlDirSource(FIXTURES).iter_headers(FROM, None, "all"))
+    assert len(items) == 1
+    em, load_body = items[0]
+    _check(em)
+    assert "posílám nabídku" in load_body()
+
+
+def test_mbox_raw_utf8_header(tmp_path):
+    with open(os.path.join(FIXTURES, "raw_utf8_header.eml"), "rb") as f:
+        msg = f.read()
+    path = tmp_path / "inbox.mbox"
+    path.write_bytes(b"From jan.novak@firma.cz Thu Oct 15 08:00:00 2026\n" + msg + b"\n")
+    items = list(MboxSource(str(path)).iter_headers(FROM, None, "all"))
+    assert len(items) == 1
+    _check(items[0][0])
@@ -0,0 +1,117 @@
+"""
+Bulk header reads through Folder.GetTable (outlook_io) against a fake Outlook table:
+column mapping, chunked reads, conversation filter, early stop and the per-item fallback.
+"""
+import datetime as dt
+
+import pytest
+
+import outlook_io
+
+T0 = dt.datetime(2026, 10, 1, 12, 0, tzinfo=dt.timezone.utc)
+
+
+def _row(n, conv, cls="IPM.Note"):
+    values = {"EntryID": f"E{n}", "MessageClass": cls, "ReceivedTime": T0 - dt.timedelta(hours=n),
+              "Subject": f"subject {n}", "SenderName": "Jan Novák", "SenderEmailAddress": "jan@firma.cz",
+              "To": "me@firma.cz", "CC": None, "ConversationID": conv}
+    return tuple(values[c] for c in outlook_io.TABLE_COLUMNS)
+
+
+class FakeColumns:
+    def __init__(self):
+        self.names = ["EntryID", "Subject", "CreationTime"]
+
+    def RemoveAll(self):
+        self.names = []
+
+    def Add(self, name):
+        self.names.append(name)
+
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.pos = 0
+        self.reads = []
+        self.Columns = FakeColumns()
+
+    @property
+    def EndOfTable(self):
+        return self.pos >= len(self.rows)
+
+    def Sort(self, column, descending):
+        self.sort = (column, descending)
+
+    def GetRowCount(self):
+        return len(self.rows)
+
+    def GetArray(self, n):
+        self.reads.append(n)
+        chunk = self.rows[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return tuple(chunk)
+
+
+class FakeFolder:
+    Name = "Inbox"
+    FolderPath = "\\\\jan@firma.cz\\Inbox"
+    StoreID = "S1"
+
+    def __init__(self, table=None):
+        self.table = table
+        self.restrictions = []
+
+    def GetTable(self, restriction, table_contents):
+        self.restrictions.append(restriction)
+        if self.table is None:
+            raise RuntimeError("GetTable is not supported")
+        return self.table
+
+
+@pytest.fixture(autouse=True)
+def table_mode(monkeypatch):
+    monkeypatch.setattr(outlook_io, "OUTLOOK_READ_MODE", "table")
+    monkeypatch.setattr(outlook_io, "OUTLOOK_TABLE_CHUNK", 2)
+
+
+def _read(folder, **kw):
+    return [em for em, _ in outlook_io._folder_reader(folder, "[ReceivedTime] >= '01.10.2026'", **kw)]
+
+
+def test_rows_map_to_header_only_items():
+    table = FakeTable([_row(0, "c0"), _row(1, "c1", cls="IPM.Appointment"), _row(2, "c2")])
+    ems = _read(FakeFolder(table))
+    assert table.Columns.names == list(outlook_io.TABLE_COLUMNS)
+    assert table.sort == ("ReceivedTime", True)
+    assert table.reads == [2, 2]   # chunked GetArray calls, not one COM call per item
+    assert [em.entry_id for em in ems] == ["E0", "E2"]   # non-mail items are skipped
+    em = ems[0]
+    assert em.sender == "Jan Novák <jan@firma.cz>" and em.cc_recipients == "" and em.body_text == ""
+    assert em.received.tzinfo is None and em.folder_path == FakeFolder.FolderPath
+
+
+def test_conversation_filter():
+    table = FakeTable([_row(n, f"c{n % 2}") for n in range(5)])
+    assert [em.entry_id for em in _read(FakeFolder(table), conv_filter={"c1"})] == ["E1", "E3"]
+
+
+def test_limit_stops_reading():
+    table = FakeTable([_row(n, f"c{n}") for n in range(10)])
+    assert [em.entry_id for em in _read(FakeFolder(table), limit=3)] == ["E0", "E1", "E2"]
+    assert table.pos == 4   # two chunks, the rest of the folder is never read
+
+
+def test_limit_with_ids_sink_collects_remaining_conversations():
+    table = FakeTable([_row(n, f"c{n}") for n in range(5)])
+    sink = set()
+    assert len(_read(FakeFolder(table), limit=2, ids_sink=sink)) == 2
+    assert sink == {"c2", "c3", "c4"} and table.EndOfTable
+
+
+def test_falls_back_to_item_reads_when_gettable_fails(monkeypatch):
+    calls = []
+    monkeypatch.setattr(outlook_io, "_items_reader", lambda folder, restriction, *a: calls.append(restriction) or iter(()))
+    folder = FakeFolder(table=None)
+    assert _read(folder) == []
+    assert calls == folder.restrictions
@@ -0,0 +1,35 @@
+"""
+Streaming row writers (output_writers): fixed default columns, or the caller's
+columns for the end-of-run xlsx.
+"""
+import csv
+
+from openpyxl import load_workbook
+
+from output_writers import get_row_writer, output_columns
+
+
+def test_csv_uses_fixed_columns(tmp_path):
+    path = str(tmp_path / "out.csv")
+    w = get_row_writer("csv", path)
+    w.write({"Prijmeni": "Novák", "Extra": "x"})
+    w.close()
+    with open(path, encoding="utf-8", newline="") as f:
+        header, row = list(csv.reader(f))
+    assert header == output_columns()
+    assert row[header.index("Prijmeni")] == "Novák"
+
+
+def test_xlsx_with_row_columns_keeps_extra_keys(tmp_path):
+    path = str(tmp_path / "out.xlsx")
+    w = get_row_writer("xlsx", path, ["Prijmeni", "Jmeno", "_CONV_ID", "Extra"])
+    w.write({"Prijmeni": "Novák", "Jmeno": "Jan", "_CONV_ID": "c1", "Extra": "x"})
+    w.write({"Prijmeni": "Svobodová", "Jmeno": None})
+    w.close()
+    ws = load_workbook(path).active
+    assert ws.title == "Analysis"
+    assert list(ws.iter_rows(values_only=True)) == [
+        ("Prijmeni", "Jmeno", "_CONV_ID", "Extra"),
+        ("Novák", "Jan", "c1", "x"),
+        ("Svobodová", None, None, None),
+    ]
@@ -0,0 +1,92 @@
+"""
+Async pipeline (pipeline.run_pipeline): rows come back in selection order however the
+LLM calls finish, superseded speculative results are dropped.
+"""
+import datetime as dt
+import threading
+
+import pytest
+
+import pipeline
+from models import EmailItem
+
+T0 = dt.datetime(2026, 10, 1, 8, 0)
+
+
+def _em(minute, conv):
+    return EmailItem(received=T0 + dt.timedelta(minutes=minute), subject=f"{conv}@{minute}", sender="a <a@b.cz>",
+                     to_recipients="", cc_recipients="", body_text="", conversation_id=conv,
+                     entry_id=f"{conv}-{minute}")
+
+
+def _select_newest(ems):
+    """Newest message per conversation, newest conversation first (like main.select)."""
+    newest = {}
+    for em in ems:
+        if em.conversation_id not in newest or em.received > newest[em.conversation_id].received:
+            newest[em.conversation_id] = em
+    return sorted(newest.values(), key=lambda em: em.received, reverse=True)
+
+
+class ReverseFinish:
+    """extract_one whose calls finish in the reverse of the given order: each waits
+    until the call listed after it has returned."""
+
+    def __init__(self, subjects):
+        self.order = list(subjects)
+        self.done = {s: threading.Event() for s in self.order}
+        self.finished = []
+        self.lock = threading.Lock()
+
+    def __call__(self, em):
+        i = self.order.index(em.subject) if em.subject in self.order else -1
+        if 0 <= i < len(self.order) - 1:
+            assert self.done[self.order[i + 1]].wait(5), "pipeline did not run the calls concurrently"
+        with self.lock:
+            self.finished.append(em.subject)
+        if em.subject in self.done:
+            self.done[em.subject].set()
+        return {"subject": em.subject}
+
+
+@pytest.fixture(autouse=True)
+def workers(monkeypatch):
+    monkeypatch.setattr(pipeline, "LLM_CONCURRENCY", 4)
+    monkeypatch.setattr(pipeline, "PIPELINE_PREP_WORKERS", 2)
+
+
+def _run(ems, extract, max_emails=0, on_row=None):
+    return pipeline.run_pipeline(lambda: ((em, "") for em in ems), lambda em, raw: em, lambda em: True,
+                                 _select_newest, extract, max_emails, on_row)
+
+
+def test_rows_follow_selection_order_not_completion_order():
+    ems = [_em(30, "c"), _em(20, "b"), _em(10, "a")]
+    extract = ReverseFinish(["c@30", "b@20", "a@10"])
+    seen = []
+    selected, rows = _run(ems, extract, on_row=lambda em, row: seen.append(em.subject))
+    assert extract.finished == ["a@10", "b@20", "c@30"]
+    assert [em.subject for em in selected] == ["c@30", "b@20", "a@10"]
+    assert [r["subject"] for r in rows] == ["c@30", "b@20", "a@10"]
+    assert sorted(seen) == sorted(["c@30", "b@20", "a@10"])   # once per final row
+
+
+def test_superseded_message_is_not_exported():
+    ems = [_em(10, "a"), _em(5, "b"), _em(40, "a")]   # a newer reply in "a" arrives last
+    selected, rows = _run(ems, lambda em: {"subject": em.subject})
+    assert [r["subject"] for r in rows] == ["a@40", "b@5"]
+
+
+def test_cap_skips_old_messages_early(monkeypatch):
+    monkeypatch.setattr(pipeline, "PIPELINE_PREP_WORKERS", 1)   # messages arrive in fetch order
+    ems = [_em(m, c) for m, c in ((10, "a"), (50, "b"), (30, "c"), (20, "d"))]
+    calls = []
+
+    def extract(em):
+        calls.append(em.subject)
+        return {"subject": em.subject}
+
+    selected, rows = pipeline.run_pipeline(lambda: ((em, "") for em in ems), lambda em, raw: em,
+                                           lambda em: True, lambda ems: _select_newest(ems)[:2], extract, 2)
+    assert [r["subject"] for r in rows] == ["b@50", "c@30"]
+    assert "d@20" not in calls   # older than the two newest seen when it arrived
@@ -0,0 +1,61 @@
+"""
+Signature detection (utils.detect_signature) against the behaviour before the
+single-pass rewrite. Cases marked "unchanged" return exactly what the old
+extract_signature returned; the others document intended differences.
+"""
+import pytest
+
+from utils import detect_signature, extract_signature
+
+UNCHANGED = [
+    ("Dobrý den,\nposílám nabídku.\n\nS pozdravem\nJan Novák\nTel: +420 777 123 456",
+     "S pozdravem\nJan Novák\nTel: +420 777 123 456"),
+    ("Posílám nabídku. Díky. S pozdravem Jan Novák",
+     "S pozdravem Jan Novák"),
+    ("Anbei das Angebot.\n\nMit freundlichen Grüßen\nHans Müller\nTel. +49 30 1234567",
+     "Mit freundlichen Grüßen\nHans Müller\nTel. +49 30 1234567"),
+    ("Высылаю предложение.\n\nС уважением,\nИван Петров\n+7 495 123 45 67",
+     "С уважением,\nИван Петров\n+7 495 123 45 67"),
+    # the last cue wins over one in quoted history
+    ("Best regards\nJan\n\nOn Mon, Petr wrote:\nthanks\n\nS pozdravem\nPetr Svoboda\npetr@firma.cz",
+     "S pozdravem\nPetr Svoboda\npetr@firma.cz"),
+]
+
+
+@pytest.mark.parametrize("body,expected", UNCHANGED)
+def test_unchanged_cases(body, expected):
+    assert extract_signature(body) == expected
+
+
+def test_multiword_cue_is_kept_whole():
+    # old: "regards\nJohn Smith\n..." (the shorter cue "regards" matched first)
+    sig, conf = detect_signature("Please find attached the quote.\n\nBest regards\nJohn Smith\njohn@acme.com")
+    assert sig == "Best regards\nJohn Smith\njohn@acme.com"
+    assert conf == 0.8
+
+
+def test_no_cue_block_keeps_name_and_company():
+    # old: only the contact lines ("Tel: ...\nwww.firma.cz")
+    body = "Posílám podklady k nabídce.\n\nJan Novák\nFirma s.r.o.\nTel: +420 777 123 456\nwww.firma.cz"
+    sig, conf = detect_signature(body)
+    assert sig == "Jan Novák\nFirma s.r.o.\nTel: +420 777 123 456\nwww.firma.cz"
+    assert 0.2 <= conf <= 0.6
+
+
+def test_no_cue_block_stops_at_blank_line_and_short_sentence():
+    body = ("Dobrý den,\nposílám podklady.\nCall me tomorrow.\n\n"
+            "Jan Novák\nACME s.r.o.\ntel: +420 777 123 456\nwww.acme.cz")
+    assert extract_signature(body) == "Jan Novák\nACME s.r.o.\ntel: +420 777 123 456\nwww.acme.cz"
+    # without the blank line a short sentence still ends the block
+    body = "Hi Jan,\nCall me tomorrow.\nJohn Smith\nACME Ltd.\nPhone +44 20 7946 0958"
+    assert extract_signature(body) == "John Smith\nACME Ltd.\nPhone +44 20 7946 0958"
+
+
+def test_no_signature_has_low_confidence():
+    body = "Dobrý den,\nposílám nabídku na dodávku materiálu.\nTermín plnění je do konce měsíce."
+    assert detect_signature(body)[1] == 0.1
+
+
+def test_empty_body():
+    assert detect_signature("") == ("", 0.0)
+    assert extract_signature(None) == ""
@@ -0,0 +1,53 @@
+"""
+Incremental sync state (sync_state.record_run): folder watermarks and
+conversation markers after a run.
+"""
+import datetime as dt
+
+from models import EmailItem
+from sync_state import record_run, folder_watermarks, is_processed
+
+BASE = (dt.datetime.now() - dt.timedelta(days=2)).replace(microsecond=0)
+
+
+def _em(hour, conv, folder="Inbox"):
+    return EmailItem(received=BASE + dt.timedelta(hours=hour), subject="s", sender="a <a@b.cz>",
+                     to_recipients="", cc_recipients="", body_text="b", conversation_id=conv,
+                     entry_id=f"{conv}-{hour}", folder_path=folder)
+
+
+def _state():
+    return {"folders": {}, "conversations": {}}
+
+
+def test_watermark_advances_to_newest_fetched():
+    state = _state()
+    a, b = _em(1, "a"), _em(3, "b", folder="Sent")
+    record_run(state, [a, b], [a, b], [{}, {}])
+    assert folder_watermarks(state) == {"Inbox": a.received, "Sent": b.received}
+    assert is_processed(state, a) and is_processed(state, b)
+
+
+def test_error_row_holds_watermark_below_failed_message():
+    state = _state()
+    a, b, c = _em(1, "a"), _em(2, "b"), _em(3, "c")
+    record_run(state, [a, b, c], [a, b, c], [{}, {"_ERROR": "x"}, {}])
+    assert folder_watermarks(state)["Inbox"] == b.received - dt.timedelta(seconds=1)
+    assert not is_processed(state, b)
+
+
+def test_unreadable_message_holds_watermark():
+    state = _state()
+    a, b, c = _em(1, "a"), _em(2, "b"), _em(3, "c")
+    record_run(state, [a, c], [a, c], [{}, {}], [b])
+    assert folder_watermarks(state)["Inbox"] == b.received - dt.timedelta(seconds=1)
+
+
+def test_older_run_never_lowers_watermark_or_marker():
+    state = _state()
+    new = _em(10, "a")
+    record_run(state, [new], [new], [{}])
+    old = _em(1, "a")  # e.g. --full over an older window
+    record_run(state, [old], [old], [{}])
+    assert folder_watermarks(state)["Inbox"] == new.received
+    assert is_processed(state, new) and not is_processed(state, old)
@@ -0,0 +1,54 @@
+"""
+Master workbook upsert (template_export.upsert_rows_into_workbook): rows are matched
+by conversation ID first, by e-mail address only when the names agree.
+"""
+from openpyxl import load_workbook
+
+from template_export import upsert_rows_into_workbook
+
+COLUMNS = ["NazevKlienta", "Prijmeni", "Jmeno", "Email", "_CONV_ID"]
+PEOPLE = [("Novák", "Jan"), ("Svobodová", "Petra"), ("Dvořák", "Tomáš"),
+          ("Černá", "Lucie"), ("Procházka", "Karel"), ("Kučerová", "Eva")]
+
+
+def _row(surname, name, email, conv, company="Firma s.r.o."):
+    return {"NazevKlienta": company, "Prijmeni": surname, "Jmeno": name, "Email": email, "_CONV_ID": conv}
+
+
+def _data(path):
+    ws = load_workbook(path).active
+    return [r for r in ws.iter_rows(min_row=3, values_only=True) if any(r)]
+
+
+def test_shared_address_keeps_every_person(tmp_path):
+    master = str(tmp_path / "master.xlsx")
+    rows = [_row(s, n, "info@firma.cz", f"conv{i}") for i, (s, n) in enumerate(PEOPLE)]
+    counts = upsert_rows_into_workbook(master, None, "", rows, COLUMNS)
+    assert counts == {"appended": 6, "updated": 0, "unchanged": 0}
+    assert [(r[1], r[2]) for r in _data(master)] == PEOPLE
+
+
+def test_same_person_new_thread_updates_by_address(tmp_path):
+    master = str(tmp_path / "master.xlsx")
+    upsert_rows_into_workbook(master, None, "", [_row("Novák", "Jan", "jan@firma.cz", "conv1")], COLUMNS)
+    counts = upsert_rows_into_workbook(
+        master, None, "", [_row("Novak", "Jan", "jan@firma.cz", "conv2", company="Firma a.s.")], COLUMNS)
+    assert counts == {"appended": 0, "updated": 1, "unchanged": 0}
+    assert _data(master) == [("Firma a.s.", "Novak", "Jan", "jan@firma.cz", "conv2")]
+
+
+def test_conversation_id_wins_over_address(tmp_path):
+    master = str(tmp_path / "master.xlsx")
+    upsert_rows_into_workbook(master, None, "", [_row("Novák", "Jan", "jan@firma.cz", "conv1")], COLUMNS)
+    counts = upsert_rows_into_workbook(
+        master, None, "", [_row("Novák", "Jan", "jan.novak@jina.cz", "conv1")], COLUMNS)
+    assert counts == {"appended": 0, "updated": 1, "unchanged": 0}
+    assert len(_data(master)) == 1
+
+
+def test_rerun_is_unchanged(tmp_path):
+    master = str(tmp_path / "master.xlsx")
+    rows = [_row(s, n, "info@firma.cz", f"conv{i}") for i, (s, n) in enumerate(PEOPLE)]
+    upsert_rows_into_workbook(master, None, "", rows, COLUMNS)
+    counts = upsert_rows_into_workbook(master, None, "", rows, COLUMNS)
+    assert counts == {"appended": 0, "updated": 0, "unchanged": 6}
@@ -2,67 +2,336 @@
 import re
 import json
 import datetime as dt
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import os, sys
-from bs4 import BeautifulSoup
+from functools import lru_cache
+from html.parser import HTMLParser
+
+class _TextExtractor(HTMLParser):
+    """Streaming HTML -> text: every text node stripped, empty ones dropped, joined by newlines.
+    Same output as BeautifulSoup(html, "html.parser").get_text("\n", strip=True) with script and
+    style removed, without building a tree. Comments (incl. Outlook conditional blocks),
+    declarations and processing instructions end a text node and are not part of the text."""
+    _SKIP = {"script", "style", "xml"}  # xml: Office data islands outside conditional comments
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._buf: List[str] = []
+        self._skip = 0
+
+    def _flush(self):
+        if self._buf:
+            text = "".join(self._buf).strip()
+            self._buf = []
+            if text:
+                self.parts.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in self._SKIP:
+            self._skip += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag in self._SKIP and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._buf.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    handle_decl = handle_pi = handle_comment
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.upper().startswith("CDATA[") and not self._skip:
+            self._buf.append(data[6:])
+            self._flush()
 
 def html_to_text(html: str) -> str:
     """Convert HTML to plain text with basic cleanup."""
     if not html:
         return ""
-    soup = BeautifulSoup(html, "html.parser")
-    for tag in soup(["script", "style"]):
-        tag.decompose()
-    return soup.get_text("\n", strip=True)
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    parser._flush()
+    return "\n".join(parser.parts)
 
+# Closing phrases that open a signature block; extend the list (any language) and the
+# matcher is rebuilt on the next call. "Regards" also covers "Best/Kind/Warm regards".
 SIGNATURE_CUES = [
     "-- ",
-    "S pozdravem", "S pozdravy", "S úctou",
-    "Best regards", "Kind regards", "Regards",
-    "Mit freundlichen Grüßen", "С уважением",
+    "S pozdravem", "S pozdravy", "S úctou", "Se srdečným pozdravem", "S přátelským pozdravem",
+    "S pozdravom", "Pozdrawiam",
+    "Best regards", "Kind regards", "Regards", "Best wishes", "Yours sincerely", "Sincerely",
+    "Mit freundlichen Grüßen", "Freundliche Grüße", "Viele Grüße", "Beste Grüße",
+    "С уважением", "С наилучшими пожеланиями",
 ]
 
-def extract_signature(body_text: str, max_sig_lines: int = 18) -> str:
-    """Return probable signature block based on cues or tail heuristics."""
+_rx_contact = re.compile(r"(@|\b(tel|phone|mobil|mobile|gsm|email|e-mail|www|web|fax)\b|\+\d|https?://)", re.I)
+_rx_sig_separator = re.compile(r"^\s*(--|_{3,}|-{3,}|={3,})\s*$")
+_rx_sentence_end = re.compile(r"[.!?:;]\s*$")
+_CUE_PREFIX_MAX = 20    # "Best " / "Many thanks and " before a cue on the same line
+_SIG_MAX_CHARS = 2000
+_CUE_WINDOW = 256       # signatures sit at the end: search the tail first, then widen
+
+@lru_cache(maxsize=4)
+def _cue_matcher(cues: tuple):
+    """(fast, exact, longest) for a cue list. `fast` is a plain alternation over the lowercased
+    cues for a non-overlapping scan of lowercased text; `exact` is case-insensitive, requires a
+    word boundary and, being a zero-width lookahead, reports every start position, so its last
+    match equals max(rfind(cue)) of a per-cue scan."""
+    alts = "|".join(re.escape(c) for c in cues)
+    fast = re.compile("|".join(re.escape(c.lower()) for c in cues))
+    exact = re.compile(r"(?<!\w)(?=" + alts + ")", re.I)
+    return fast, exact, max((len(c) for c in cues), default=0)
+
+def _last_cue_exact(exact, txt: str, lo: int, hi: int, endpos: int) -> int:
+    pos = -1
+    for m in exact.finditer(txt, lo, endpos):
+        if m.start() < hi:
+            pos = m.start()
+    return pos
+
+def _last_cue(txt: str) -> int:
+    """Start of the last cue in txt, or -1. Windows are scanned from the end backwards, so a
+    typical body is only searched up to its tail. The fast scan finds the last cue occurrence;
+    the exact pattern then runs from there only (a later cue can only start inside that match)."""
+    fast, exact, longest = _cue_matcher(tuple(SIGNATURE_CUES))
+    hi, width = len(txt), _CUE_WINDOW
+    while hi > 0:
+        lo = max(0, hi - width)
+        end = min(len(txt), hi + longest)   # a cue starting before `hi` may end past it
+        seg = txt[lo:end].lower()
+        if len(seg) != end - lo:            # lower() changed the length: no position mapping
+            pos = _last_cue_exact(exact, txt, lo, hi, end)
+        else:
+            last = -1
+            for m in fast.finditer(seg):
+                if lo + m.start() < hi:
+                    last = lo + m.start()
+            pos = -1
+            if last != -1:
+                pos = _last_cue_exact(exact, txt, last, hi, end)
+                if pos == -1:               # only matches inside words ("disregards")
+                    pos = _last_cue_exact(exact, txt, lo, hi, end)
+        if pos != -1:
+            return pos
+        hi, width = lo, width * 4
+    return -1
+
+def _ends_sentence(s: str) -> bool:
+    """Body-text ending: a longer line closed by punctuation, "?"/"!", or a lowercase word
+    with a full stop ("Call me tomorrow."); "ACME s.r.o." / "Ltd." / "Ph.D." are not."""
+    if _rx_sentence_end.search(s) and len(s.split()) > 3:
+        return True
+    last = s.split()[-1]
+    return s.endswith(("!", "?")) or (last.endswith(".") and len(last) > 2 and last[:-1].isalpha()
+                                      and last[:-1].islower())
+
+def _sig_line_score(ln: str) -> int:
+    """How much a trailing line looks like part of a signature (<= 0: body text)."""
+    s = ln.strip()
+    if len(s) > 120:
+        return -3
+    score = 0
+    if _rx_contact.search(s):
+        score += 2
+    if "|" in s or "," in s:
+        score += 1
+    if _rx_sig_separator.match(s):
+        score += 2
+    if len(s) <= 40 and not _ends_sentence(s):
+        score += 1
+    return score
+
+def detect_signature(body_text: str, max_sig_lines: int = 18) -> Tuple[str, float]:
+    """Return (probable signature block, confidence 0..1).
+    A closing cue (last one in the text) starts the block; without a cue the trailing
+    lines are scored and the block starts where signature-like lines stop (at the latest
+    at the first blank line above it)."""
     if not body_text:
-        return ""
+        return "", 0.0
     txt = body_text.strip()
-    lower = txt.lower()
-    positions = [lower.rfind(cue.lower()) for cue in SIGNATURE_CUES]
-    pos = max(p for p in positions if p != -1) if any(p != -1 for p in positions) else -1
+    pos = _last_cue(txt)
     if pos != -1:
-        sig = txt[pos:]
-    else:
-        lines = [ln.rstrip() for ln in txt.splitlines()]
-        tail = lines[-max_sig_lines:]
-        rx_contact = re.compile(r"(@|\b(tel|phone|mobil|mobile|gsm|email|e-mail|www|web|fax)\b|\+\d|https?://)", re.I)
-        picked = [ln for ln in tail if ln and (len(ln) <= 120) and (rx_contact.search(ln) or "," in ln or "|" in ln)]
-        sig = "\n".join(picked[-max_sig_lines:]) if picked else "\n".join(tail)
-    if len(sig) > 2000:
-        sig = sig[:2000]
-    return sig.strip()
-
-def coerce_json(text: str) -> Optional[Dict[str, Any]]:
-    """Parse JSON from model output, tolerant to code fences / noise."""
-    if not text:
-        return None
-    m = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', text, flags=re.S)
-    if m:
-        try:
-            return json.loads(m.group(1))
-        except Exception:
-            pass
-    m = re.search(r'(\{.*\})', text, flags=re.S)
-    if m:
-        try:
-            return json.loads(m.group(1))
-        except Exception:
-            pass
+        line_start = txt.rfind("\n", 0, pos) + 1
+        prefix = txt[line_start:pos]
+        if len(prefix.strip()) <= _CUE_PREFIX_MAX and not re.search(r"[.!?]", prefix):
+            pos = line_start
+        sig = txt[pos:][:_SIG_MAX_CHARS].strip()
+        lines = sig.splitlines()[1:]
+        contacts = sum(1 for ln in lines if _rx_contact.search(ln))
+        conf = 0.6 + 0.2 * min(contacts, 2)
+        if len(lines) > max_sig_lines:
+            conf -= 0.2     # a long tail after the cue is probably more than a signature
+        return sig, round(min(conf, 1.0), 2)
+
+    tail = [ln.rstrip() for ln in txt.rsplit("\n", max_sig_lines)][-max_sig_lines:]
+    start = len(tail)
+    for i in range(len(tail) - 1, -1, -1):
+        if not tail[i].strip():
+            break           # the text above a blank line belongs to the body
+        if _sig_line_score(tail[i]) <= 0:
+            break
+        start = i
+        if _rx_sig_separator.match(tail[i]):
+            break           # "--" / "____" opens the block
+    block = tail[start:]
+    contacts = sum(1 for ln in block if _rx_contact.search(ln))
+    if not contacts:
+        return "\n".join(tail)[:_SIG_MAX_CHARS].strip(), 0.1
+    sig = "\n".join(block)[:_SIG_MAX_CHARS].strip()
+    return sig, round(min(0.2 + 0.15 * contacts, 0.6), 2)
+
+def extract_signature(body_text: str, max_sig_lines: int = 18) -> str:
+    """Return probable signature block based on cues or tail heuristics."""
+    return detect_signature(body_text, max_sig_lines)[0]
+
+# Rough chars-per-token ratio used when tiktoken is unavailable (conservative for Czech text)
+_CHARS_PER_TOKEN = 3
+
+@lru_cache(maxsize=1)
+def _token_encoder():
+    """Local tiktoken encoder, or None (missing package / no cached encoding file)."""
     try:
-        return json.loads(text.replace("'", '"'))
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
     except Exception:
         return None
 
+def count_tokens(text: str) -> int:
+    """Count prompt tokens locally; falls back to a character estimate."""
+    if not text:
+        return 0
+    enc = _token_encoder()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return -(-len(text) // _CHARS_PER_TOKEN)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the beginning of `text` that fits into `max_tokens`."""
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = _token_encoder()
+    if enc is not None:
+        toks = enc.encode(text, disallowed_special=())
+        return text if len(toks) <= max_tokens else enc.decode(toks[:max_tokens])
+    return text[:max_tokens * _CHARS_PER_TOKEN]
+
+_rx_fence = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.S)
+_SMART_QUOTES = str.maketrans({"\u201c": '"', "\u201d": '"', "\u201e": '"', "\u201f": '"', "\u2033": '"'})
+
+def _close_json(s: str) -> List[str]:
+    """Candidates for the JSON value starting at s[0]: trailing commas dropped, text after the
+    closing brace ignored; a truncated value is cut back to its last complete member (or
+    closed where it stops) and the open strings/brackets are closed."""
+    out: List[str] = []
+    stack: List[str] = []
+    in_str = esc = False
+    last_comma = None  # (output length, open brackets) at the last comma outside strings
+    for ch in s:
+        if in_str:
+            out.append(ch)
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                return ["".join(out)]
+            continue
+        elif ch == ",":
+            last_comma = (len(out), list(stack))
+        out.append(ch)
+    tries = []
+    if last_comma:
+        n, open_ = last_comma
+        tries.append("".join(out[:n]) + "".join(reversed(open_)))
+    tries.append("".join(out) + ('"' if in_str else "") + "".join(reversed(stack)))
+    return tries
+
+def repair_json(text: str) -> Tuple[Optional[Any], bool]:
+    """Parse a JSON object from model output. Returns (value, repaired): repaired is True when
+    the text was not valid JSON as-is and a local fix (code fence, prose around the object,
+    trailing commas, truncation, smart or single quotes) made it parse; (None, False) if none did."""
+    if not text:
+        return None, False
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+    m = _rx_fence.search(text)
+    s = m.group(1) if m else text
+    start = s.find("{")
+    if start == -1:
+        return None, False
+    s = s[start:]
+    for variant in (s, s.translate(_SMART_QUOTES), s.translate(_SMART_QUOTES).replace("'", '"')):
+        for cand in _close_json(variant):
+            try:
+                return json.loads(cand), True
+            except ValueError:
+                continue
+    return None, False
+
+def split_packed_results(obj: Optional[Dict[str, Any]], n: int, headers: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """Split a packed {"results": [{"index": i, ...}]} reply into n per-message objects.
+
+    Entries that are missing, duplicated, out of range or carry no schema key come
+    back as None so the caller can retry them one by one.
+    """
+    out: List[Optional[Dict[str, Any]]] = [None] * n
+    items = (obj or {}).get("results") if isinstance(obj, dict) else None
+    if not isinstance(items, list):
+        return out
+    seen, dup = set(), set()
+    for pos, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        idx = item.get("index", pos if len(items) == n else None)
+        try:
+            idx = int(idx)
+        except (TypeError, ValueError):
+            continue
+        if not (0 <= idx < n):
+            continue
+        if idx in seen:
+            dup.add(idx)
+            continue
+        if not any(h in item for h in headers):
+            continue
+        if any(v is not None and not isinstance(v, (str, int, float)) for k, v in item.items() if k != "index"):
+            continue
+        seen.add(idx)
+        out[idx] = {k: v for k, v in item.items() if k != "index"}
+    for idx in dup:
+        out[idx] = None  # ambiguous: two answers for the same email
+    return out
+
 def coerce_to_schema(obj: dict, headers: List[str]) -> dict:
     """Ensure object has exactly the schema keys (strings only)."""
     clean = {}
@@ -86,6 +355,10 @@ def to_naive_local(d: dt.datetime) -> dt.datetime:
     except Exception:
         return d.replace(tzinfo=None)
 
+def conversation_key(em) -> str:
+    """Grouping key for a message: its ConversationID, or a per-message fallback."""
+    return em.conversation_id or f"__{em.entry_id or id(em)}"
+
 def is_incoming_email(item, my_emails: set) -> bool:
     """Return True if the message is incoming, False if outgoing."""
     sender_l = (item.sender or "").lower()